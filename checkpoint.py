@@ -0,0 +1,403 @@
+"""
+Background checkpoint writer.
+
+Background checkpoint writer: snapshot the state dict in memory, write it from a
+worker thread with an atomic rename, coalesce writes that pile up, and keep the
+best-k and last checkpoints next to the main checkpoint path. Also holds the full
+training-state checkpoint used to resume interrupted runs, and the
+self-describing model checkpoint format read by `load_pes`.
+"""
+
+import copy
+import glob
+import logging
+import os
+import random
+import re
+import threading
+
+import numpy as np
+import torch
+
+from config import get_config, DEFAULT_CONFIG_NAME
+from model import FEATURE_OPTIONS, STANDARDIZATION_BUFFERS, build_model
+
+HISTORY_REGEX = re.compile(r"\.(last|state|best-e\d+)\.pth$")
+CHECKPOINT_FORMAT = "pes-checkpoint"
+CHECKPOINT_VERSION = 1
+# Run directories named "<num_layers>-<hidden_dim>-<activation>[-YYYYMMDD-HHMMSS]": the only record
+# of the activation of a bare state-dict checkpoint
+LEGACY_STEM_REGEX = re.compile(r"^(\d+)-(\d+)-([A-Za-z]+)$")
+LEGACY_TS_SUFFIX = re.compile(r"-\d{8}-\d{6}$")
+LEGACY_ACTIVATIONS = ("Mish", "ReLU", "LeakyReLU", "ELU", "GELU")
+
+
+def is_history_checkpoint(filename: str) -> bool:
+    """
+    True for the .last / .state / .best-eNNNNN side files (not the main best checkpoint).
+    """
+    return bool(HISTORY_REGEX.search(filename))
+
+
+def state_path_for(path: str) -> str:
+    """
+    Training-state checkpoint path that belongs to a model checkpoint path.
+    """
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.state{ext or '.pth'}"
+
+
+def _cpu_copy(obj):
+    """
+    Recursively copy tensors to CPU so the snapshot is immune to in-place updates.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _cpu_copy(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_copy(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def capture_training_state(epoch, model, optimizer, scheduler, best_loss, patience_counter, stage=0,
+                           stage_start=0):
+    """
+    Snapshot everything needed to continue a run at epoch + 1.
+
+    Model, optimizer and scheduler state, early-stop counters, the curriculum
+    stage and the epoch it started at, and the torch / CUDA / NumPy / Python
+    RNG states (so shuffling continues identically).
+    """
+    return _cpu_copy({
+        "epoch": int(epoch),
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(),
+        "best_loss": float(best_loss),
+        "patience_counter": int(patience_counter),
+        "stage": int(stage),
+        "stage_start": int(stage_start),
+        "rng": {
+            "torch": torch.get_rng_state(),
+            "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+            "numpy": np.random.get_state(),
+            "python": random.getstate(),
+        },
+    })
+
+
+def restore_training_state(path, model, optimizer, scheduler):
+    """
+    Load a training-state checkpoint into model/optimizer/scheduler and the RNGs.
+
+    Returns:
+        dict with "epoch" (last finished epoch), "best_loss", "patience_counter",
+        "stage" and "stage_start" (0 for states written without a curriculum)
+    """
+    device = next(model.parameters()).device
+    # Our own file with RNG tuples and NumPy arrays, hence weights_only=False.
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    scheduler.load_state_dict(state["scheduler"])
+    for group_state in optimizer.state.values():
+        for k, v in group_state.items():
+            if isinstance(v, torch.Tensor) and v.dim() > 0:
+                group_state[k] = v.to(device)
+    rng = state["rng"]
+    torch.set_rng_state(rng["torch"])
+    if rng["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng["cuda"])
+    np.random.set_state(rng["numpy"])
+    random.setstate(rng["python"])
+    resumed = {k: state[k] for k in ("epoch", "best_loss", "patience_counter")}
+    resumed.update(stage=state.get("stage", 0), stage_start=state.get("stage_start", 0))
+    return resumed
+
+
+def snapshot_state(model):
+    """
+    Detached CPU copy of a model's state dict (safe to write while training continues).
+    """
+    return {k: v.detach().to("cpu", copy=True) for k, v in model.state_dict().items()}
+
+
+def pes_checkpoint(model, metrics=None, precision=None, **metadata):
+    """
+    Self-describing model checkpoint: the weights plus everything needed to rebuild and judge them.
+
+    Only tensors, numbers, strings and containers, so it loads with
+    ``weights_only=True``.
+
+    Args:
+        model (NeuralNetwork): model to snapshot
+        metrics (dict | None): scalar metrics, e.g. epoch, loss and evaluation results
+        precision (str | None): training precision policy; defaults to the weight dtype
+        **metadata: extra entries such as data_hash or config
+    """
+    return {
+        "format": CHECKPOINT_FORMAT,
+        "format_version": CHECKPOINT_VERSION,
+        "arch": model.arch,
+        "normalization": {name: float(getattr(model, name)) for name in STANDARDIZATION_BUFFERS},
+        "precision": precision or str(next(model.parameters()).dtype).replace("torch.", ""),
+        "metrics": {k: v if isinstance(v, int) else float(v) for k, v in (metrics or {}).items()},
+        **metadata,
+        "state_dict": snapshot_state(model),
+    }
+
+
+def read_checkpoint(path, map_location="cpu"):
+    """
+    Memory-mapped, weights-only load of a model checkpoint.
+
+    Returns (state_dict, metadata); metadata is empty for the bare state dicts
+    written before the self-describing format.
+    """
+    payload = torch.load(path, map_location=map_location, mmap=True, weights_only=True)
+    if payload.get("format") != CHECKPOINT_FORMAT:
+        return payload, {}
+    if payload["format_version"] > CHECKPOINT_VERSION:
+        raise ValueError(f"{path}: checkpoint format version {payload['format_version']} is newer than "
+                         f"this code ({CHECKPOINT_VERSION})")
+    metadata = {k: v for k, v in payload.items() if k != "state_dict"}
+    return payload["state_dict"], metadata
+
+
+def _legacy_activation(path, num_layers, hidden_dim):
+    """
+    Activation named by a legacy run directory (or file stem), or None.
+
+    The name only counts if its layer count and width match the checkpoint's
+    tensors, so a file copied into an unrelated directory is not misread.
+    """
+    path = os.path.abspath(path)
+    for name in (os.path.basename(os.path.dirname(path)), os.path.splitext(os.path.basename(path))[0]):
+        m = LEGACY_STEM_REGEX.match(LEGACY_TS_SUFFIX.sub("", name))
+        if m and m.group(3) in LEGACY_ACTIVATIONS and (int(m.group(1)), int(m.group(2))) == (num_layers, hidden_dim):
+            return m.group(3)
+    return None
+
+
+def _legacy_arch(state_dict, cfg, path):
+    """
+    Architecture of a bare state dict.
+
+    Layer shapes come from the tensors. The activation comes from the run
+    directory name (see `_legacy_activation`), else from `cfg`, with a warning,
+    since a wrong activation loads without error. Input features come from `cfg`.
+    """
+    num_layers = sum(1 for key in state_dict if key.startswith("layers.") and key.endswith(".weight"))
+    arch = {key: cfg[key] for key in ("activation_function", "features", *FEATURE_OPTIONS) if key in cfg}
+    arch.update(
+        input_dim=state_dict["layers.0.weight"].shape[1],
+        hidden_dim=state_dict["layers.0.weight"].shape[0],
+        num_layers=num_layers,
+        output_dim=state_dict["output_layer.weight"].shape[0],
+    )
+    activation = _legacy_activation(path, num_layers, arch["hidden_dim"])
+    if activation is not None:
+        arch["activation_function"] = activation
+    else:
+        logging.warning(f"{path}: bare state dict without an architecture-named directory; "
+                        f"assuming the config's activation {arch['activation_function']}")
+    if "features.selector" in state_dict:
+        if not cfg.get("features"):
+            raise ValueError("Checkpoint has an input feature stage but no features spec; pass the training --features")
+        arch["input_dim"] = state_dict["features.selector"].shape[1]
+    return arch
+
+
+def load_pes(path, cfg=None, device=None, dtype=None):
+    """
+    Rebuild a trained NeuralNetwork from a checkpoint, ready for inference.
+
+    Self-describing checkpoints (``pes_checkpoint``) carry their architecture;
+    for bare state dicts the layer sizes are read from the tensor shapes, the
+    activation from a "<layers>-<hidden>-<activation>" run directory name or
+    else `cfg`, and the input features from `cfg` (default config if None).
+    The metadata is kept on the model as ``model.checkpoint``.
+
+    Args:
+        path (str): checkpoint path
+        cfg (dict | None): config for bare state dicts
+        device: target device (default CPU)
+        dtype: target dtype (default: as stored)
+    """
+    state_dict, metadata = read_checkpoint(path)
+    if metadata:
+        arch = metadata["arch"]
+    else:
+        arch = _legacy_arch(state_dict, cfg if cfg is not None else get_config(DEFAULT_CONFIG_NAME), path)
+    model = build_model(arch)
+    model.load_state_dict(state_dict)
+    model.to(device=device, dtype=dtype)
+    model.eval()
+    model.checkpoint = metadata
+    return model
+
+
+def atomic_save(obj, path):
+    """
+    torch.save to a temporary file in the same directory, then os.replace.
+
+    Readers never see a half-written checkpoint.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter:
+    """
+    Write checkpoints from a background thread.
+
+    Layout for path="out/2-64.pth":
+        out/2-64.pth                 best state so far (what load_pes / load_model read)
+        out/2-64.last.pth            most recent state submitted with submit_last
+        out/2-64.best-e00042.pth     best-k history, pruned to `keep_best` files
+        out/2-64.state.pth           full training state (submit_state) for --resume
+
+    Only the newest pending "best" and "last" snapshots are kept: if the worker is
+    still busy (e.g. on NFS), older pending snapshots are replaced, not queued.
+    """
+
+    def __init__(self, path, keep_best: int = 3, metadata=None):
+        """
+        Args:
+            path (str): main (best) checkpoint path
+            keep_best (int): number of best-k history files to retain (0 = none)
+            metadata (dict | None): ``pes_checkpoint`` keyword arguments written
+                with every best/last checkpoint (e.g. precision, data_hash)
+        """
+        self.path = path
+        self.metadata = dict(metadata or {})
+        self.keep_best = int(keep_best)
+        stem, ext = os.path.splitext(path)
+        self._stem, self._ext = stem, ext or ".pth"
+        self.last_path = f"{stem}.last{self._ext}"
+        self._best_files = self._existing_best_files()  # (loss, path), ascending loss
+        self._pending = {}
+        self._busy = False
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _existing_best_files(self):
+        """
+        Best-k history already on disk (e.g. before --resume), with the loss stored in each file.
+
+        Files without a stored loss (bare state dicts) rank last, so they are pruned first.
+        """
+        files = []
+        for best_path in glob.glob(f"{glob.escape(self._stem)}.best-e*{self._ext}"):
+            try:
+                _, metadata = read_checkpoint(best_path)
+                loss = float(metadata.get("metrics", {}).get("loss", float("inf")))
+            except Exception:  # unreadable leftovers are pruned first
+                loss = float("inf")
+            files.append((loss, best_path))
+        return sorted(files, key=lambda item: item[0])
+
+    def submit_best(self, model, loss, epoch, metrics=None):
+        """
+        Queue a new best checkpoint (replaces a not-yet-written pending best).
+        """
+        metrics = {"epoch": int(epoch), "loss": float(loss), **(metrics or {})}
+        self._submit("best", (pes_checkpoint(model, metrics, **self.metadata), float(loss), int(epoch)))
+
+    def submit_last(self, model, epoch, metrics=None):
+        """
+        Queue the latest-epoch checkpoint (replaces a not-yet-written pending last).
+        """
+        metrics = {"epoch": int(epoch), **(metrics or {})}
+        self._submit("last", (pes_checkpoint(model, metrics, **self.metadata), None, int(epoch)))
+
+    def submit_state(self, state):
+        """
+        Queue a training-state snapshot from ``capture_training_state``.
+        """
+        self._submit("state", (state, None, state["epoch"]))
+
+    def _submit(self, kind, item):
+        with self._cond:
+            if self._error is not None:
+                raise RuntimeError(f"Checkpoint writer failed: {self._error}") from self._error
+            if self._closed:
+                raise RuntimeError("Checkpoint writer is closed")
+            self._pending[kind] = item
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                pending, self._pending = self._pending, {}
+                self._busy = True
+            error = None
+            try:
+                if "best" in pending:
+                    self._write_best(*pending["best"])
+                if "last" in pending:
+                    state, _, _ = pending["last"]
+                    atomic_save(state, self.last_path)
+                if "state" in pending:
+                    state, _, _ = pending["state"]
+                    atomic_save(state, state_path_for(self.path))
+            except Exception as e:  # surfaced on the next submit/flush/close
+                error = e
+            with self._cond:
+                self._busy = False
+                self._error = self._error or error
+                self._cond.notify_all()
+                if error is not None:
+                    return
+
+    def _write_best(self, state, loss, epoch):
+        atomic_save(state, self.path)
+        if self.keep_best <= 0:
+            return
+        best_path = f"{self._stem}.best-e{epoch:05d}{self._ext}"
+        atomic_save(state, best_path)
+        # A resumed run can rewrite an epoch it already had on disk
+        self._best_files = [item for item in self._best_files if item[1] != best_path] + [(loss, best_path)]
+        self._best_files.sort(key=lambda item: item[0])
+        for _, stale in self._best_files[self.keep_best:]:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        self._best_files = self._best_files[:self.keep_best]
+
+    def flush(self):
+        """
+        Block until every submitted snapshot has been written.
+        """
+        with self._cond:
+            while (self._pending or self._busy) and self._error is None:
+                self._cond.wait()
+        if self._error is not None:
+            raise RuntimeError(f"Checkpoint writer failed: {self._error}") from self._error
+
+    def close(self):
+        """
+        Write whatever is pending, stop the worker and re-raise any write error.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Checkpoint writer failed: {self._error}") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
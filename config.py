@@ -28,6 +28,66 @@ def get_config(config_name):
         "train_data_path": "input_force_filtered.csv",
         # Training hyperparameters (can be overridden via CLI)
         "epochs": 1000,
+        # 1 = original per-sample loop; >1 = batched energy/force engine
+        "batch_size": 1,
+        # Keep X/targets resident on the device and step on the whole set each epoch
+        "full_batch": False,
+        # "Adam" or "LBFGS" (LBFGS implies full_batch)
+        "optimizer": "Adam",
+        "lbfgs_learning_rate": 1.0,
+        "lbfgs_max_iter": 20,
+        "lbfgs_history_size": 100,
+        # Evaluation cadence (epochs) and optional fixed random subset size (None = all rows)
+        "eval_every": 1,
+        "eval_subsample": None,
+        # torch.compile the energy/force/loss step (batched or full-batch only)
+        "compile": False,
+        # Precision policy: "float32", "float64" or "bf16" (float32 weights + bfloat16 autocast)
+        "train_precision": "float32",
+        "inference_precision": "float32",
+        "md_precision": "float64",
+        # torch intra-op threads per training run (None = leave torch's default)
+        "num_threads": 12,
+        # Background checkpoint writer and number of best-k history files kept
+        "async_checkpoint": True,
+        "keep_best": 3,
+        # Serve CSV datasets from the content-addressed cache (data_loader.cached_dataset_path)
+        "data_cache": True,
+        # Validation/test split (None = train on everything; "random", "block" or "region", see splits.py);
+        # early stopping and the best checkpoint then follow the validation loss
+        "split": None,
+        "split_fractions": (0.8, 0.1, 0.1),
+        "split_blocks": 6,
+        "holdout_region": None,
+        "split_seed": 0,
+        # Stream shuffled chunks from disk instead of loading the dataset (needs batch_size > 1)
+        "streaming": False,
+        "chunk_size": 65536,
+        "prefetch_chunks": 2,
+        # Input features before the first layer ("raw", "morse", "inverse", "poly", joined with "+";
+        # None = raw bond lengths) and their parameters, see model.FeatureTransform
+        "features": None,
+        "morse_scales": (0.5, 1.0, 2.0),
+        "inverse_powers": (1, 2),
+        "poly_degree": 3,
+        # Precompute the features and their derivatives once per dataset (eager batched/full-batch training)
+        "cache_features": True,
+        # Train on standardized energies/forces; the statistics are saved in the checkpoint and
+        # undone inside the model, so predictions stay in Hartree and Hartree/Bohr
+        "standardize": True,
+        # Coarse-to-fine curriculum: subgrid strides trained before the full set (e.g. (4, 2); None = off),
+        # the epoch budget of each coarse stage, and the energy RMSE whose time-to-target is reported
+        "curriculum": None,
+        "curriculum_epochs": 50,
+        "target_energy_rmse": None,
+        # Tabulated surrogate (tabulate command): grid spacing (Å) and r12 / r23 ranges (default: the MD domain)
+        "table_spacing": 0.01,
+        "table_x_range": (0.0, 4.0),
+        "table_y_range": (0.0, 3.99),
+        # Process-wide model cache (model_cache.get_model): most models kept, and the memory bound of
+        # their weights in MB; least recently used models are evicted first
+        "model_cache_size": 8,
+        "model_cache_mb": 512,
         "patience": 50,
         "min_delta": 1e-4,
         "scheduler_mode": "min",
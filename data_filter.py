@@ -0,0 +1,197 @@
+"""
+Dataset outlier filtering.
+
+Outlier filtering stage: flag bad QC points with vectorized checks on the
+regular grid (see pes_grid.PESGrid) and split a dataset into kept and removed
+sets, each removed row carrying the reasons it was flagged.
+"""
+
+import logging
+import warnings
+
+import numpy as np
+import pandas as pd
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+from numpy_pes import QC_FORCE_SCALE, gradients_from_forces
+from pes_grid import PESGrid
+
+# Reason codes written to the `reason` column of the removed set
+NONFINITE = "nonfinite"            # NaN/inf energy, or forces only partly present
+SCF_FAILURE = "scf_failure"        # non-negative energy or listed in a QC error file
+STATE_JUMP = "state_jump"          # on an upper electronic state the SCF converged to
+FORCE_FD = "force_fd"              # stored forces disagree with finite differences of the energy
+CURVATURE = "curvature"            # isolated spike in the local energy curvature
+MODEL_RESIDUAL = "model_residual"  # energy far from a trained model's prediction
+REASONS = (NONFINITE, SCF_FAILURE, STATE_JUMP, FORCE_FD, CURVATURE, MODEL_RESIDUAL)
+
+TARGET_COLUMNS = ["z1", "z2", "z3", "z4"]
+
+
+def robust_z(values, window=None, floor=0.0):
+    """
+    Robust z-scores (median / 1.4826*MAD), ignoring NaN.
+
+    Args:
+        values (np.ndarray): values to score
+        window (int | None): for 2-D input, score against the median/MAD of the
+            surrounding `window` x `window` neighbourhood instead of the whole array
+        floor (float): lower bound on the scale, e.g. the resolution of the
+            data, so plateaus with zero MAD do not give infinite scores
+    """
+    with warnings.catch_warnings():
+        # Windows inside masked blocks are all NaN; their score is NaN and never flagged
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if window is None:
+            median = np.nanmedian(values)
+            mad = np.nanmedian(np.abs(values - median))
+        else:
+            half = window // 2
+            windows = sliding_window_view(np.pad(values, half, constant_values=np.nan), (window, window))
+            median = np.nanmedian(windows, axis=(-2, -1))
+            mad = np.nanmedian(np.abs(windows - median[..., None, None]), axis=(-2, -1))
+    return (values - median) / np.maximum(1.4826 * mad, floor)
+
+
+def _local_peak(score):
+    """
+    True where |score| is the maximum of its 3x3 neighbourhood.
+
+    A single bad energy disturbs the curvature of its neighbours too; keeping
+    only the peak blames the point itself.
+    """
+    magnitude = np.nan_to_num(np.abs(score), nan=0.0)
+    windows = sliding_window_view(np.pad(magnitude, 1), (3, 3))
+    return magnitude >= windows.max(axis=(-2, -1))
+
+
+def upper_state(grid, jump_atol):
+    """
+    True on grid points that lie on an upper electronic state.
+
+    Between neighbouring points the energy step is compared with the step the
+    stored forces predict (trapezoid rule); a mismatch above `jump_atol`
+    (Hartree) is a jump between states. Along every grid line, in x and in
+    y, the jumps add up to a state offset, and points more than
+    `jump_atol` / 2 above the lowest state of a line are flagged. Whole
+    blocks of points on the wrong state are found this way, not just their
+    edges. Steps next to missing points or energy-only rows are not judged.
+    """
+    # The stored forces are in the QC units, not the legacy model convention
+    gradients = np.moveaxis(gradients_from_forces(np.moveaxis(grid.forces, 0, -1), scale=QC_FORCE_SCALE), -1, 0)
+    upper = np.zeros(grid.shape, dtype=bool)
+    for axis, gradient, step in ((1, gradients[0], grid.dx), (0, gradients[1], grid.dy)):
+        predicted = 0.5 * (np.delete(gradient, 0, axis) + np.delete(gradient, -1, axis)) * step
+        mismatch = np.nan_to_num(np.diff(grid.energy, axis=axis) - predicted)
+        jumps = np.where(np.abs(mismatch) > jump_atol, mismatch, 0.0)
+        offset = np.cumsum(np.insert(jumps, 0, 0.0, axis=axis), axis=axis)
+        upper |= offset - offset.min(axis=axis, keepdims=True) > 0.5 * jump_atol
+    return upper & grid.mask
+
+
+def energy_resolution(energies):
+    """
+    Smallest spacing between distinct energies (the precision the QC outputs were written with).
+    """
+    unique = np.unique(energies[np.isfinite(energies)])
+    return float(np.diff(unique).min()) if len(unique) > 1 else 0.0
+
+
+def model_energies(model, data):
+    """
+    Energies predicted by a trained model for the rows of `data`.
+    """
+    model.eval()
+    parameter = next(model.parameters())
+    X = torch.tensor(data[['x', 'y']].to_numpy(), dtype=parameter.dtype, device=parameter.device)
+    with torch.no_grad():
+        return model(X)[:, 0].double().cpu().numpy()
+
+
+def flag_outliers(data, force_atol=0.05, force_rtol=0.2, curvature_z=6.0, failed_points=None,
+                  model=None, residual_z=6.0, jump_atol=0.05):
+    """
+    Flag bad points with vectorized checks.
+
+    Returns a boolean DataFrame (one column per reason code in `REASONS`)
+    aligned with `data`. The grid checks are skipped, with a warning, if the
+    points are not on a regular grid.
+
+    Args:
+        data (pd.DataFrame): dataset with columns x, y, z1..z4
+        force_atol (float): absolute tolerance (Hartree/Bohr) of the force / finite-difference check
+        force_rtol (float): relative tolerance of the same check, times |F|
+        curvature_z (float): robust z-score above which a curvature spike is flagged
+        failed_points (pd.DataFrame | None): (x, y) of failed QC jobs, e.g. *_gaussian_errors.csv
+        model: optional trained model; rows whose energy residual has a robust
+            z-score above `residual_z` are flagged
+        residual_z (float): threshold of the model-residual check
+        jump_atol (float): energy-step mismatch (Hartree) that marks a jump between
+            electronic states, see `upper_state`
+    """
+    flags = pd.DataFrame(False, index=data.index, columns=list(REASONS))
+    targets = data[TARGET_COLUMNS].to_numpy(dtype=np.float64)
+    # Energy-only rows (all forces NaN, see data_merge) are valid; partial forces are not
+    force_present = np.isfinite(targets[:, 1:])
+    flags[NONFINITE] = ~np.isfinite(targets[:, 0]) | (force_present.any(axis=1) & ~force_present.all(axis=1))
+
+    energies = targets[:, 0]
+    flags[SCF_FAILURE] = np.nan_to_num(energies, nan=-np.inf) >= 0
+    if failed_points is not None and len(failed_points):
+        failed = pd.MultiIndex.from_frame(failed_points[['x', 'y']].round(6))
+        flags[SCF_FAILURE] |= pd.MultiIndex.from_frame(data[['x', 'y']].round(6)).isin(failed)
+
+    resolution = energy_resolution(energies)
+    usable = data[~(flags[NONFINITE] | flags[SCF_FAILURE])]
+    try:
+        grid = PESGrid.from_frame(usable)
+    except ValueError as exc:
+        logging.warning(f"Grid checks skipped: {exc}")
+        grid = None
+    if grid is not None:
+        rows = usable.index.to_numpy()
+        upper = upper_state(grid, jump_atol)
+        flags.loc[rows[grid.rows[upper]], STATE_JUMP] = True
+        # Points on the wrong state are masked so they do not fail the checks of their neighbours
+        valid = grid.mask & ~upper
+        grid.energy = np.where(upper, np.nan, grid.energy)
+
+        # 5-point Laplacian, scored against its 5x5 neighbourhood
+        energy = grid.energy
+        laplacian = np.full(energy.shape, np.nan)
+        laplacian[1:-1, 1:-1] = (energy[2:, 1:-1] + energy[:-2, 1:-1] + energy[1:-1, 2:] + energy[1:-1, :-2]
+                                 - 4 * energy[1:-1, 1:-1])
+        score = robust_z(laplacian, window=5, floor=resolution)
+        bad_curvature = valid & (np.abs(np.nan_to_num(score)) > curvature_z) & _local_peak(score)
+        flags.loc[rows[grid.rows[bad_curvature]], CURVATURE] = True
+
+        # Spikes are masked first so they do not fail the force check of their neighbours
+        grid.energy = np.where(bad_curvature, np.nan, energy)
+        residual = np.sqrt(np.sum(grid.force_residuals() ** 2, axis=0))
+        magnitude = np.sqrt(np.sum(grid.forces ** 2, axis=0))
+        bad_force = valid & (residual > force_atol + force_rtol * magnitude)
+        flags.loc[rows[grid.rows[bad_force]], FORCE_FD] = True
+
+    if model is not None:
+        residuals = np.full(len(data), np.nan)
+        finite = ~flags[NONFINITE].to_numpy()
+        residuals[finite] = model_energies(model, data[finite]) - energies[finite]
+        flags[MODEL_RESIDUAL] = np.abs(np.nan_to_num(robust_z(residuals, floor=resolution))) > residual_z
+    return flags
+
+
+def filter_dataset(data, **kwargs):
+    """
+    Split a dataset into kept and removed rows.
+
+    The removed frame has an extra `reason` column with the ';'-joined
+    reason codes of each row. The split is deterministic: rerunning on the
+    same inputs gives the same files. Keyword arguments go to `flag_outliers`.
+    """
+    flags = flag_outliers(data, **kwargs)
+    bad = flags.any(axis=1)
+    removed = data[bad].copy()
+    codes = np.array(flags.columns)
+    removed["reason"] = [";".join(codes[row]) for row in flags[bad].to_numpy()]
+    return data[~bad], removed
@@ -1,31 +1,472 @@
 """
 Data loading helpers.
 
-Data loading utilities: read from CSV and build PyTorch DataLoader.
+Data loading utilities: read from CSV or the binary PES format and build PyTorch DataLoader.
 """
 
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
 import pandas as pd
-from torch.utils.data import TensorDataset, DataLoader
+from torch.utils.data import TensorDataset, DataLoader, IterableDataset
 import torch
 
-def load_data(file_path, shuffle=True):
+# Binary dataset layout (little-endian):
+#   8 bytes   magic  b"PESBIN01"
+#   8 bytes   uint64 header length in bytes
+#   N bytes   UTF-8 JSON header {"columns": [...], "dtype": "<f8", "rows": n, "offset": k, "source": ...}
+#   padding   zeros up to `offset` (64-byte aligned)
+#   payload   len(columns) contiguous columns of `rows` values each
+BINARY_MAGIC = b"PESBIN01"
+BINARY_SUFFIX = ".pesbin"
+BINARY_ALIGN = 64
+DATA_COLUMNS = ["x", "y", "z1", "z2", "z3", "z4"]
+
+# Column names written by older read_gaussian.py versions -> training columns
+LEGACY_COLUMNS = {"z": "z1", "force1_x": "z2", "force2_x": "z3", "force3_x": "z4"}
+
+# Prepared-dataset cache (see cached_dataset_path); PES_CACHE_DIR overrides the location
+DEFAULT_CACHE_DIR = os.environ.get("PES_CACHE_DIR", ".pes_cache")
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+CACHE_MAX_AGE_DAYS = 30
+# Bump when the preparation changes so stale entries are never served
+CACHE_VERSION = 1
+_hash_memo = {}
+
+
+def is_binary_dataset(file_path):
+    """
+    Check whether a file is in the binary PES format.
+
+    Detection is by magic bytes, so the file extension does not matter.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    except OSError:
+        return False
+
+
+def write_binary_dataset(data, out_path, dtype="float64", source=None):
+    """
+    Write a DataFrame to the binary PES format.
+
+    Write the training columns of a DataFrame as contiguous typed columns
+    behind a JSON header. The file is written to a temporary name and renamed,
+    so concurrent readers never see a partial file.
+
+    Args:
+        data: DataFrame with columns x, y, z1..z4 (legacy Gaussian names accepted).
+        out_path: Output file path.
+        dtype: Stored value type, "float32" or "float64".
+        source: Optional description of the originating file, kept in the header.
+    """
+    data = data.rename(columns=LEGACY_COLUMNS)
+    missing = [c for c in DATA_COLUMNS if c not in data.columns]
+    if missing:
+        raise ValueError(f"Dataset is missing column(s): {', '.join(missing)}")
+    np_dtype = np.dtype(dtype).newbyteorder("<")
+    if np_dtype.kind != "f":
+        raise ValueError(f"Unsupported dataset dtype: {dtype}")
+    columns = np.ascontiguousarray(data[DATA_COLUMNS].to_numpy(dtype=np_dtype).T)
+
+    header = {"columns": DATA_COLUMNS, "dtype": np_dtype.str, "rows": int(columns.shape[1]), "source": source}
+    # The offset depends on the header length, which depends on the offset; two passes settle it
+    header["offset"] = 0
+    for _ in range(2):
+        blob = json.dumps(header).encode("utf-8")
+        prefix = len(BINARY_MAGIC) + 8 + len(blob)
+        header["offset"] = -(-prefix // BINARY_ALIGN) * BINARY_ALIGN
+    blob = json.dumps(header).encode("utf-8")
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(np.uint64(len(blob)).tobytes())
+        f.write(blob)
+        f.write(b"\0" * (header["offset"] - f.tell()))
+        f.write(columns.tobytes())
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def read_binary_header(file_path):
+    """
+    Read the JSON header of a binary PES dataset.
+    """
+    with open(file_path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{file_path} is not a binary PES dataset")
+        length = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        return json.loads(f.read(length).decode("utf-8"))
+
+
+def _map_columns(file_path):
+    """
+    Memory-map the payload of a binary PES dataset.
+
+    Returns the header and a (n_columns, rows) copy-on-write memmap.
+    """
+    header = read_binary_header(file_path)
+    columns = np.memmap(
+        file_path, dtype=np.dtype(header["dtype"]), mode="c", offset=header["offset"],
+        shape=(len(header["columns"]), header["rows"]),
+    )
+    return header, columns
+
+
+def read_binary_dataset(file_path):
     """
-    Load training data from CSV into a DataLoader.
+    Memory-map a binary PES dataset as a DataFrame.
+
+    Memory-map the payload and wrap it in a DataFrame without copying. The map
+    is copy-on-write: every process reading the same file shares one page-cache
+    copy, and in-place edits stay private to the process.
+    """
+    header, columns = _map_columns(file_path)
+    # columns.T is a Fortran-ordered view; pandas keeps it as one block without a copy
+    return pd.DataFrame(columns.T, columns=header["columns"], copy=False)
+
+
+def read_dataset(file_path, cache=False):
+    """
+    Read a PES dataset from CSV or binary format.
+
+    Read a dataset as a DataFrame with columns x, y, z1..z4, dispatching on the
+    file contents. With `cache=True` a CSV is parsed once and later reads map
+    the cached binary copy (see `cached_dataset_path`).
+    """
+    if cache:
+        file_path = cached_dataset_path(file_path)
+    if is_binary_dataset(file_path):
+        return read_binary_dataset(file_path)
+    return pd.read_csv(file_path).rename(columns=LEGACY_COLUMNS)
 
-    Load training data from CSV and build DataLoader.
+
+def file_digest(file_path):
+    """
+    SHA-256 of a file's contents.
+
+    Digests are memoised per (path, mtime, size), so repeated loads of an
+    unchanged file in one process read it only once.
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.realpath(file_path), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _hash_memo:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+def frame_digest(data):
+    """
+    SHA-256 of a dataset's x, y, z1..z4 values (float64, row order), independent of the file it came from.
+    """
+    values = np.ascontiguousarray(data[DATA_COLUMNS].to_numpy(dtype=np.float64))
+    return hashlib.sha256(values.tobytes()).hexdigest()
+
+
+def cache_key(file_path, **options):
+    """
+    Content address of a prepared dataset.
+
+    Hashes the source file digest together with every preprocessing option
+    (column mapping, stored dtype, ...), so changing either gives a new entry.
+    """
+    spec = {"version": CACHE_VERSION, "source": file_digest(file_path), "columns": LEGACY_COLUMNS, **options}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def evict_cache(cache_dir=DEFAULT_CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS):
+    """
+    Drop cache entries older than `max_age_days`, then least recently used
+    entries until the cache fits in `max_bytes`.
+
+    Hits refresh an entry's mtime, so age is time since last use.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(BINARY_SUFFIX):
+            full = os.path.join(cache_dir, name)
+            stat = os.stat(full)
+            entries.append((stat.st_mtime, stat.st_size, full))
+    entries.sort()
+    cutoff = time.time() - max_age_days * 86400
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, full in entries:
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        try:
+            os.remove(full)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cached_dataset_path(file_path, cache_dir=DEFAULT_CACHE_DIR, dtype="float64"):
+    """
+    Binary copy of a CSV dataset, prepared once and served from the cache.
+
+    On a miss the CSV is parsed, column names are mapped and the result is
+    written to `<cache_dir>/<key>.pesbin` (see `cache_key`) after trimming the
+    cache with `evict_cache`. On a hit nothing is parsed. Binary inputs are
+    returned unchanged.
+    """
+    if is_binary_dataset(file_path):
+        return file_path
+    entry = os.path.join(cache_dir, cache_key(file_path, dtype=dtype) + BINARY_SUFFIX)
+    if os.path.exists(entry):
+        os.utime(entry)
+        return entry
+    # Trim before writing so the new entry itself is never evicted
+    evict_cache(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_binary_dataset(pd.read_csv(file_path), entry, dtype=dtype, source=os.path.abspath(file_path))
+    return entry
+
+
+def convert_csv_to_binary(csv_path, out_path=None, dtype="float64"):
+    """
+    Convert a CSV dataset to the binary PES format.
+
+    Args:
+        csv_path: input_force*.csv or *_gaussian_energy.csv file.
+        out_path: Output path; defaults to the CSV path with a .pesbin suffix.
+        dtype: Stored value type, "float32" or "float64".
+    """
+    if out_path is None:
+        out_path = os.path.splitext(csv_path)[0] + BINARY_SUFFIX
+    data = pd.read_csv(csv_path)
+    return write_binary_dataset(data, out_path, dtype=dtype, source=os.path.basename(csv_path))
+
+
+def iter_chunks(file_path, chunk_size=65536, rng=None):
+    """
+    Yield a dataset as DataFrames of at most `chunk_size` rows.
+
+    Binary files are sliced from the memory map (chunks are views, and with a
+    numpy Generator `rng` they come in random order); CSV files are parsed
+    incrementally in file order.
+    """
+    chunk_size = int(chunk_size)
+    if is_binary_dataset(file_path):
+        header, columns = _map_columns(file_path)
+        starts = np.arange(0, header["rows"], chunk_size)
+        if rng is not None:
+            rng.shuffle(starts)
+        for start in starts:
+            block = columns[:, start:start + chunk_size]
+            yield pd.DataFrame(block.T, columns=header["columns"], copy=False)
+    else:
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+            yield chunk.rename(columns=LEGACY_COLUMNS)
+
+
+def prefetch(iterable, depth=2):
+    """
+    Iterate `iterable` in a background thread through a bounded queue.
+
+    At most `depth` items are produced ahead of the consumer, so disk reads and
+    parsing overlap with compute while memory stays bounded. Exceptions raised
+    by the producer are re-raised in the consumer; closing the generator early
+    stops the producer.
+    """
+    buffer = queue.Queue(maxsize=max(1, int(depth)))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Poll so an abandoned consumer never leaves the producer blocked on a full queue
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as exc:
+            put(exc)
+
+    worker = threading.Thread(target=produce, name="pes-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def sample_dataset(file_path, n, chunk_size=65536, seed=0):
+    """
+    Uniform random sample of `n` rows, read chunk by chunk.
+
+    Each row gets a random key and the `n` smallest keys are kept, so memory is
+    bounded by `n + chunk_size` rows whatever the dataset size.
+    """
+    rng = np.random.default_rng(seed)
+    kept = None
+    for chunk in iter_chunks(file_path, chunk_size):
+        chunk = chunk[DATA_COLUMNS].assign(_key=rng.random(len(chunk)))
+        kept = chunk if kept is None else pd.concat([kept, chunk], ignore_index=True)
+        kept = kept.nsmallest(int(n), "_key")
+    return kept.drop(columns="_key").sort_values(["x", "y"]).reset_index(drop=True)
+
+
+class StreamingPESDataset(IterableDataset):
+    """
+    Mini-batches streamed from disk in shuffled chunks.
+
+    A background thread reads and converts up to `prefetch` chunks ahead of
+    training (see `prefetch`); the rows of each chunk are shuffled and leftover
+    rows are carried into the next chunk, so every batch except the last has
+    `batch_size` rows. Peak memory is about `(prefetch + 1) * chunk_size` rows.
+    """
+
+    def __init__(self, file_path, batch_size, chunk_size=65536, shuffle=True, seed=0,
+                 dtype=torch.float32, prefetch=2):
+        self.file_path = file_path
+        self.batch_size = int(batch_size)
+        self.chunk_size = int(chunk_size)
+        self.shuffle = shuffle
+        self.seed = int(seed)
+        self.dtype = dtype
+        self.prefetch = int(prefetch)
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """
+        Select the shuffle order of an epoch (mirrors DistributedSampler.set_epoch).
+        """
+        self.epoch = int(epoch)
+
+    def _chunk_tensors(self):
+        rng = np.random.default_rng([self.seed, self.epoch]) if self.shuffle else None
+        for chunk in iter_chunks(self.file_path, self.chunk_size, rng=rng):
+            X = torch.tensor(chunk[['x', 'y']].to_numpy(), dtype=self.dtype)
+            y = torch.tensor(chunk[['z1', 'z2', 'z3', 'z4']].to_numpy(), dtype=self.dtype)
+            if rng is not None:
+                order = torch.from_numpy(rng.permutation(len(X)))
+                X, y = X[order], y[order]
+            yield X, y
+
+    def __iter__(self):
+        carry_X, carry_y = None, None
+        for X, y in prefetch(self._chunk_tensors(), self.prefetch):
+            if carry_X is not None:
+                X, y = torch.cat([carry_X, X]), torch.cat([carry_y, y])
+            full = len(X) - len(X) % self.batch_size
+            for start in range(0, full, self.batch_size):
+                yield X[start:start + self.batch_size], y[start:start + self.batch_size]
+            carry_X, carry_y = X[full:], y[full:]
+        if carry_X is not None and len(carry_X):
+            yield carry_X, carry_y
+
+
+def load_data(file_path, shuffle=True, batch_size=1, dtype=torch.float32, streaming=False, chunk_size=65536,
+              prefetch_chunks=2, cache=True, rows=None):
+    """
+    Load training data from CSV or binary format into a DataLoader.
+
+    Load training data from CSV or the binary PES format and build DataLoader.
 
     The CSV is expected to contain columns: x, y, z1, z2, z3, z4.
     Expected CSV columns: x, y, z1, z2, z3, z4.
+
+    batch_size=1 keeps the original per-sample iteration; larger values
+    switch ``train.train`` to the batched engine. `dtype` is the tensor dtype
+    (see ``precision.resolve_dtype``). Binary files (``main.py convert-data``)
+    are memory-mapped, and when their stored dtype matches `dtype` the tensors
+    are views of the mapping.
+
+    With `streaming=True` nothing is loaded up front: the loader is a
+    `StreamingPESDataset` and the returned frame is None (evaluate with
+    ``evaluation.ChunkedEvaluator``).
+
+    With `cache=True` (default) a CSV is prepared once into the dataset cache
+    and every later load, from any entry point, maps the cached binary copy
+    instead of parsing the CSV again (see `cached_dataset_path`).
+
+    `rows` (positional indices, see ``splits.split_dataset``) restricts the
+    loader and the returned frame to a subset.
     """
-    data = pd.read_csv(file_path)
-    X = data[['x', 'y']]
-    y = data[['z1','z2','z3','z4']]
-    # Convert to torch tensors
-    X_train = torch.tensor(X.to_numpy(), dtype=torch.float32, requires_grad=True)
-    y_train = torch.tensor(y.to_numpy(), dtype=torch.float32)
+    if streaming:
+        if int(batch_size) <= 1:
+            raise ValueError("Streaming needs batch_size > 1")
+        dataset = StreamingPESDataset(file_path, batch_size, chunk_size=chunk_size, shuffle=shuffle,
+                                      dtype=dtype, prefetch=prefetch_chunks)
+        return dataset, None
+    if cache:
+        file_path = cached_dataset_path(file_path)
+    if is_binary_dataset(file_path):
+        header, columns = _map_columns(file_path)
+        data = pd.DataFrame(columns.T, columns=header["columns"], copy=False)
+        # Column-major payload: the (N, k) tensors are strided views of the mapping
+        X_train = torch.from_numpy(columns[0:2]).T.to(dtype)
+        y_train = torch.from_numpy(columns[2:6]).T.to(dtype)
+    else:
+        data = read_dataset(file_path)
+        # Convert to torch tensors
+        X_train = torch.tensor(data[['x', 'y']].to_numpy(), dtype=dtype)
+        y_train = torch.tensor(data[['z1', 'z2', 'z3', 'z4']].to_numpy(), dtype=dtype)
+    if rows is not None:
+        rows = torch.as_tensor(rows, dtype=torch.long)
+        X_train, y_train = X_train[rows], y_train[rows]
+        data = data.iloc[rows.numpy()].reset_index(drop=True)
+    X_train.requires_grad_(True)
     train_data = TensorDataset(X_train, y_train)
-    # Return one sample at a time (no batching concept)
-    train_loader = DataLoader(train_data, shuffle=shuffle)
+    train_loader = DataLoader(train_data, batch_size=int(batch_size), shuffle=shuffle)
 
     return train_loader, data
-    
+
+
+def featurize_loader(train_loader, transform):
+    """
+    Loader over precomputed input features of an in-memory dataset.
+
+    The features phi(x) and their derivatives d phi / d x (see
+    ``model.FeatureTransform.features_and_derivatives``) are computed once for
+    the whole dataset, so training steps skip the transform and apply the
+    chain rule with the cached derivatives (``train.batch_loss``). Batches
+    are (phi, dphi, labels); batch size and shuffling follow `train_loader`.
+    """
+    X, y = (t.detach() for t in train_loader.dataset.tensors)
+    with torch.no_grad():
+        phi, dphi = transform.features_and_derivatives(X.to(transform.selector))
+    dataset = TensorDataset(phi.cpu(), dphi.cpu(), y)
+    shuffle = isinstance(train_loader.sampler, torch.utils.data.RandomSampler)
+    return DataLoader(dataset, batch_size=train_loader.batch_size, shuffle=shuffle)
+
+
+def subset_loader(train_loader, rows):
+    """
+    Loader over the given rows of an in-memory loader's dataset, with the same batch size and shuffling.
+
+    The subset tensors are new leaves (same requires_grad as the originals), so
+    batches do not share an autograd graph through the indexing.
+    """
+    rows = torch.as_tensor(rows, dtype=torch.long)
+    dataset = TensorDataset(*(t.detach()[rows].requires_grad_(t.requires_grad) for t in train_loader.dataset.tensors))
+    shuffle = isinstance(train_loader.sampler, torch.utils.data.RandomSampler)
+    return DataLoader(dataset, batch_size=train_loader.batch_size, shuffle=shuffle)
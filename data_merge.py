@@ -0,0 +1,163 @@
+"""
+Multi-source dataset merge.
+
+Merge stage: read any mix of QC reader outputs (read_gaussian.py, read_cp2k.py,
+read_qe.py, the legacy read.py xlsx and existing training CSVs) into one dataset
+with columns x, y, z1..z4 in Hartree and Hartree/Bohr, a source / level-of-theory
+column and a force-availability mask, deduplicated on (x, y).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_COLUMNS, LEGACY_COLUMNS, read_dataset, is_binary_dataset
+
+FORCE_COLUMNS = ["z2", "z3", "z4"]
+MERGED_COLUMNS = DATA_COLUMNS + ["source", "level", "has_forces"]
+
+# Conversion factors to Hartree and Hartree/Bohr
+ENERGY_UNITS = {"hartree": 1.0, "ry": 0.5, "ev": 1 / 27.211386, "kcal/mol": 1 / 627.509474}
+FORCE_UNITS = {"hartree/bohr": 1.0, "ry/bohr": 0.5, "ev/angstrom": 0.529177 / 27.211386}
+
+# Units the QC readers write; read_qe.py already converts Ry to Hartree
+SOURCE_UNITS = {
+    "gaussian": ("hartree", "hartree/bohr"),
+    "cp2k": ("hartree", "hartree/bohr"),
+    "qe": ("hartree", "ry/bohr"),
+    "legacy": ("hartree", "hartree/bohr"),
+    "dataset": ("hartree", "hartree/bohr"),
+}
+
+
+def detect_source(path):
+    """
+    Guess the QC reader that produced a file from its name.
+
+    `*_gaussian_*`, `*_cp2k_*` and `*_qe_*` come from the matching readers, other
+    `.xlsx` files from the legacy read.py, and anything else is treated as an
+    existing training dataset (x, y, z1..z4).
+    """
+    name = os.path.basename(path).lower()
+    for source in ("gaussian", "cp2k", "qe"):
+        if f"_{source}_" in name:
+            return source
+    if name.endswith(".xlsx"):
+        return "legacy"
+    return "dataset"
+
+
+def parse_input_spec(spec):
+    """
+    Parse `path[,key=value...]` into (path, options).
+
+    Recognised keys: source, level, energy_unit, force_unit.
+    """
+    path, *pairs = spec.split(",")
+    options = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep or key not in ("source", "level", "energy_unit", "force_unit"):
+            raise ValueError(f"Bad input option '{pair}' in '{spec}'")
+        options[key] = value
+    return path, options
+
+
+def _read_table(path):
+    if path.lower().endswith(".xlsx"):
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError as exc:
+            raise ImportError("Reading .xlsx outputs needs openpyxl (pip install openpyxl)") from exc
+        return pd.read_excel(path)
+    if is_binary_dataset(path):
+        return read_dataset(path)
+    return pd.read_csv(path)
+
+
+def read_source(path, source=None, level=None, energy_unit=None, force_unit=None):
+    """
+    Read one QC output into the merged layout.
+
+    Column names are mapped to x, y, z1..z4; energies and forces are converted
+    to Hartree and Hartree/Bohr; energy-only outputs get NaN forces and
+    has_forces False. The all-zero first row that read.py writes is dropped.
+
+    Args:
+        path (str): reader output (.csv, .xlsx or .pesbin)
+        source (str | None): gaussian, cp2k, qe, legacy or dataset; guessed from the name if None
+        level (str | None): level-of-theory label; defaults to the source name
+        energy_unit (str | None): unit of the energy column (see ENERGY_UNITS)
+        force_unit (str | None): unit of the force columns (see FORCE_UNITS)
+    """
+    source = source or detect_source(path)
+    if source not in SOURCE_UNITS:
+        raise ValueError(f"Unknown source '{source}' (choose from {', '.join(SOURCE_UNITS)})")
+    default_energy, default_force = SOURCE_UNITS[source]
+    energy_scale = ENERGY_UNITS[(energy_unit or default_energy).lower()]
+    force_scale = FORCE_UNITS[(force_unit or default_force).lower()]
+
+    table = _read_table(path).rename(columns=LEGACY_COLUMNS)
+    if source == "legacy":
+        table = table[~((table['x'] == 0) & (table['y'] == 0) & (table['z1'] == 0))]
+    frame = pd.DataFrame({
+        "x": table['x'].to_numpy(dtype=np.float64),
+        "y": table['y'].to_numpy(dtype=np.float64),
+        "z1": table['z1'].to_numpy(dtype=np.float64) * energy_scale,
+    })
+    for column in FORCE_COLUMNS:
+        values = table[column].to_numpy(dtype=np.float64) if column in table.columns else np.nan
+        frame[column] = values * force_scale
+    frame["source"] = source
+    frame["level"] = level or source
+    frame["has_forces"] = np.isfinite(frame[FORCE_COLUMNS].to_numpy()).all(axis=1)
+    return frame
+
+
+def deduplicate(data, tol=1e-6):
+    """
+    Drop duplicate (x, y) points, exact first and then within `tol` Å.
+
+    Rows with forces win over energy-only rows; otherwise the earlier row (the
+    earlier input) wins. Tolerance matching snaps coordinates to a `tol` grid.
+
+    Returns (deduplicated frame, number of exact duplicates, number of tolerance duplicates).
+    """
+    order = np.lexsort((np.arange(len(data)), ~data["has_forces"].to_numpy()))
+    ranked = data.iloc[order]
+    exact = ranked.duplicated(subset=["x", "y"], keep="first")
+    ranked = ranked[~exact]
+    snapped = pd.DataFrame({"x": np.round(ranked["x"].to_numpy() / tol), "y": np.round(ranked["y"].to_numpy() / tol)})
+    near = snapped.duplicated(keep="first").to_numpy()
+    kept = ranked[~near].sort_index()
+    return kept, int(exact.sum()), int(near.sum())
+
+
+def merge_sources(specs, tol=1e-6):
+    """
+    Read and merge several QC outputs.
+
+    Args:
+        specs (list[str | tuple[str, dict]]): `path[,key=value...]` strings (see
+            `parse_input_spec`) or (path, options) pairs, in priority order
+        tol (float): coordinate tolerance (Å) of the near-duplicate pass
+
+    Returns (merged frame, report) where the report has per-source row counts
+    and the number of exact and tolerance duplicates removed.
+    """
+    frames = []
+    for spec in specs:
+        path, options = parse_input_spec(spec) if isinstance(spec, str) else spec
+        frames.append(read_source(path, **options))
+    merged = pd.concat(frames, ignore_index=True)
+    merged, exact, near = deduplicate(merged, tol=tol)
+    merged = merged.sort_values(["x", "y"], kind="stable").reset_index(drop=True)
+    report = {
+        "rows": len(merged),
+        "with_forces": int(merged["has_forces"].sum()),
+        "exact_duplicates": exact,
+        "tolerance_duplicates": near,
+        "per_source": merged["source"].value_counts().to_dict(),
+    }
+    return merged[MERGED_COLUMNS], report
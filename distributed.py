@@ -0,0 +1,117 @@
+"""
+CPU data-parallel training helpers (torch.distributed, gloo backend).
+
+Data-parallel helpers: shard the dataset across ranks, all-reduce gradients and
+losses, and broadcast rank-0 decisions (early stopping, learning rate). Launch with
+torchrun, e.g. ``torchrun --nproc_per_node 4 main.py train --distributed --batch-size 256``.
+"""
+
+import os
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import DataLoader, DistributedSampler
+
+
+def init_distributed(backend: str = "gloo"):
+    """
+    Join the process group set up by torchrun and return a DistributedContext.
+
+    Reads RANK / WORLD_SIZE / MASTER_ADDR / MASTER_PORT from the environment.
+    """
+    if "RANK" not in os.environ or "WORLD_SIZE" not in os.environ:
+        raise RuntimeError("Distributed mode expects to be launched with torchrun (RANK/WORLD_SIZE not set)")
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+    return DistributedContext()
+
+
+class DistributedContext:
+    """
+    Rank information plus the collectives used by the training loop.
+    """
+
+    def __init__(self):
+        self.rank = dist.get_rank()
+        self.world_size = dist.get_world_size()
+        self.is_main = self.rank == 0
+
+    def broadcast_parameters(self, model):
+        """
+        Copy rank 0's initial weights to every rank.
+        """
+        with torch.no_grad():
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                dist.broadcast(tensor, src=0)
+
+    def shard_loader(self, train_loader, seed: int = 0):
+        """
+        Re-wrap a DataLoader's dataset with a DistributedSampler (same batch size).
+        """
+        sampler = DistributedSampler(
+            train_loader.dataset, num_replicas=self.world_size, rank=self.rank, shuffle=True, seed=seed
+        )
+        return DataLoader(train_loader.dataset, batch_size=train_loader.batch_size, sampler=sampler)
+
+    def shard_tensors(self, *tensors):
+        """
+        Strided shard of resident tensors for full-batch training.
+        """
+        return tuple(t[self.rank::self.world_size] for t in tensors)
+
+    def average(self, value):
+        """
+        Mean of a scalar tensor over all ranks.
+        """
+        value = value.detach().clone()
+        dist.all_reduce(value, op=dist.ReduceOp.SUM)
+        return value / self.world_size
+
+    def all_reduce_grads(self, model):
+        """
+        Average parameter gradients over ranks with one flattened all-reduce.
+        """
+        params = [p for p in model.parameters() if p.requires_grad]
+        for p in params:
+            if p.grad is None:
+                p.grad = torch.zeros_like(p)
+        flat = torch.cat([p.grad.reshape(-1) for p in params])
+        dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+        flat /= self.world_size
+        offset = 0
+        for p in params:
+            n = p.numel()
+            p.grad.copy_(flat[offset:offset + n].view_as(p))
+            offset += n
+
+    def wrap_step(self, step, model):
+        """
+        Make a train step globally consistent: averaged gradients and loss.
+
+        Averaging the loss too keeps closure-based optimizers (L-BFGS line search)
+        in lock-step on every rank.
+        """
+        def synced_step(inputs, labels):
+            loss, pred_forces = step(inputs, labels)
+            self.all_reduce_grads(model)
+            return self.average(loss), pred_forces
+        return synced_step
+
+    def broadcast_decision(self, stop: bool, lr: float):
+        """
+        Broadcast rank 0's early-stop flag and learning rate to every rank.
+        """
+        values = torch.tensor([float(stop), float(lr)], dtype=torch.float64)
+        dist.broadcast(values, src=0)
+        return bool(values[0].item()), values[1].item()
+
+    def barrier(self):
+        dist.barrier()
+
+
+def cleanup_distributed():
+    """
+    Leave the process group (no-op when not initialized).
+    """
+    if dist.is_initialized():
+        dist.destroy_process_group()
@@ -1,20 +1,15 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+from pes_grid import PESGrid
 
 
 # load the data
 file_path = 'input_force.csv'
-data = pd.read_csv(file_path)
+grid = PESGrid.from_file(file_path)
 
-# extract the coordinate (x,y), and the energy z
-x = data.iloc[:, 0]
-y = data.iloc[:, 1]
-z = data.iloc[:, 2]
-
-# create 3D plot
+# create 3D plot (the grid is plotted directly, no triangulation)
 fig = plt.figure()
 ax = fig.add_subplot(111, projection='3d')
-ax.plot_trisurf(x, y, z, cmap='viridis')
+grid.plot_surface(ax, cmap='viridis')
 
 # Sex axis titles and tick labels
 ax.set_xlabel('Ne-H (Å)', fontname='Arial', fontsize=18, fontweight='bold', labelpad=10)
@@ -0,0 +1,204 @@
+"""
+Vectorized ensemble training.
+
+Vectorized ensemble training: stack K same-shape NeuralNetwork members with
+torch.func.stack_module_state and evaluate energy/force losses of all members in
+one vmapped call, then save K checkpoints plus an ensemble manifest.
+"""
+
+import copy
+import json
+import os
+
+import torch
+from torch.func import functional_call, grad_and_value, stack_module_state, vmap
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+from tqdm import tqdm
+
+from model import FEATURE_OPTIONS, build_model, forces_from_gradients
+from loss import CustomLoss, StandardizedLoss
+from evaluation import Evaluator
+from precision import resolve_dtype, autocast
+from utils import setup_logging, log_metrics, ensure_dir
+from checkpoint import pes_checkpoint
+from model_cache import get_model
+from data_loader import frame_digest
+
+MANIFEST_NAME = "ensemble.json"
+
+
+def build_members(cfg, seeds, device, dtype=torch.float32):
+    """
+    Instantiate one NeuralNetwork per seed (same architecture, different init).
+    """
+    members = []
+    for seed in seeds:
+        torch.manual_seed(int(seed))
+        members.append(build_model(cfg).to(device=device, dtype=dtype))
+    return members
+
+
+def ensemble_loss_fn(base, criterion, weight):
+    """
+    Build loss(params, buffers, inputs, labels) -> (per-member loss (K,), forces (K, N, 3)).
+
+    `base` is a structural template (e.g. on the meta device); the stacked
+    parameters carry the leading member dimension.
+    """
+    def energy(params, buffers, x):
+        return functional_call(base, (params, buffers), (x.unsqueeze(0),))[0, 0]
+
+    per_sample = vmap(grad_and_value(energy, argnums=2), in_dims=(None, None, 0))
+    per_member = vmap(per_sample, in_dims=(0, 0, None))
+
+    def member_loss(energies, pred_forces, labels):
+        return criterion(energies, labels[:, 0], pred_forces, labels[:, 1:4], weight)
+
+    def loss(params, buffers, inputs, labels):
+        gradients, energies = per_member(params, buffers, inputs)
+        pred_forces = forces_from_gradients(gradients.reshape(-1, 2)).reshape(*gradients.shape[:-1], 3)
+        losses = vmap(member_loss, in_dims=(0, 0, None))(energies, pred_forces, labels)
+        return losses, pred_forces
+
+    return loss
+
+
+def train_ensemble(
+    cfg,
+    train_loader,
+    data,
+    out_dir,
+    members: int = 8,
+    seed: int = 0,
+    trainname: str = "ensemble",
+):
+    """
+    Train K members of one architecture in a single vmapped pass.
+
+    Every member gets its own Adam state (Adam is elementwise, so one optimizer over
+    the stacked tensors is K independent optimizers) and its own best-loss
+    checkpoint and patience counter; training stops once every member has
+    early-stopped. The learning-rate schedule is shared and follows the mean loss.
+
+    Args:
+        cfg (dict): merged config (architecture, learning_rate, weight, epochs, ...)
+        train_loader: DataLoader from ``data_loader.load_data``; batch_size 1 means
+            full-batch (per-sample vmapping would gain nothing)
+        data (pd.DataFrame): frame used for the final per-member metrics
+        out_dir (str): directory for member_<i>.pth and ensemble.json
+        members (int): ensemble size K
+        seed (int): seed of member 0; member i uses seed + i
+
+    Returns:
+        dict: the manifest written to out_dir/ensemble.json
+    """
+    ensure_dir(out_dir)
+    if cfg.get('num_threads'):
+        torch.set_num_threads(int(cfg['num_threads']))
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    precision = cfg['train_precision']
+    dtype = resolve_dtype(precision)
+    seeds = [int(seed) + i for i in range(int(members))]
+    models = build_members(cfg, seeds, device, dtype)
+    if cfg.get('standardize'):
+        for model in models:
+            model.fit_standardization(train_loader.dataset.tensors[1])
+    params, buffers = stack_module_state(models)
+    base = copy.deepcopy(models[0]).to("meta")
+    # Every member shares the training-set standardization
+    loss_fn = ensemble_loss_fn(base, StandardizedLoss(CustomLoss(), models[0].standardize), cfg['weight'])
+
+    optimizer = torch.optim.Adam(list(params.values()), lr=cfg['learning_rate'])
+    scheduler = ReduceLROnPlateau(
+        optimizer, cfg['scheduler_mode'], patience=cfg['scheduler_patience'], factor=cfg['scheduler_factor']
+    )
+    writer = setup_logging(''.join(['Training Ensemble', '-', trainname]))
+
+    full_batch = getattr(train_loader, "batch_size", 1) in (None, 1)
+    if full_batch:
+        batches = [tuple(t.detach().to(device, dtype) for t in train_loader.dataset.tensors)]
+
+    K = len(seeds)
+    best_loss = torch.full((K,), float('inf'))
+    patience_counter = torch.zeros(K, dtype=torch.long)
+    best_state = [None] * K
+    min_delta = float(cfg['min_delta'])
+    for epoch in tqdm(range(int(cfg['epochs'])), desc=f"ensemble x{K}"):
+        epoch_loss = torch.zeros(K, dtype=torch.float64)
+        n_samples = 0
+        iterator = batches if full_batch else train_loader
+        for inputs, labels in iterator:
+            inputs = inputs.to(device, dtype)
+            labels = labels.to(device, dtype)
+            optimizer.zero_grad()
+            with autocast(precision, device):
+                losses, _ = loss_fn(params, buffers, inputs, labels)
+            # Members are independent, so the sum gives each its own gradient.
+            losses.sum().backward()
+            optimizer.step()
+            epoch_loss += losses.detach().double().cpu() * inputs.shape[0]
+            n_samples += inputs.shape[0]
+        epoch_loss /= n_samples
+
+        log_metrics(writer, {f"Loss/member_{i}": epoch_loss[i].item() for i in range(K)}, epoch, "Train")
+        log_metrics(writer, {"Loss/mean": epoch_loss.mean().item()}, epoch, "Train")
+
+        improved = epoch_loss < best_loss - min_delta
+        for i in torch.nonzero(improved).flatten().tolist():
+            best_state[i] = {k: v[i].detach().clone() for k, v in {**params, **buffers}.items()}
+        best_loss = torch.where(improved, epoch_loss, best_loss)
+        patience_counter = torch.where(improved, torch.zeros_like(patience_counter), patience_counter + 1)
+
+        scheduler.step(epoch_loss.mean().item())
+        if bool((patience_counter >= int(cfg['patience'])).all()):
+            tqdm.write("Early stopping triggered for all members")
+            break
+
+    # Save member checkpoints (same self-describing format as a single NeuralNetwork).
+    data_hash = frame_digest(data)
+    evaluator = Evaluator(data, device, every=1, dtype=dtype)
+    manifest = {
+        "config": {k: cfg.get(k) for k in ("input_dim", "hidden_dim", "num_layers", "output_dim",
+                                           "activation_function", "features", *FEATURE_OPTIONS)},
+        "seeds": seeds,
+        "members": [],
+    }
+    for i, state in enumerate(best_state):
+        if state is None:  # never evaluated (epochs=0)
+            state = {k: v[i].detach().clone() for k, v in {**params, **buffers}.items()}
+        path = os.path.join(out_dir, f"member_{i}.pth")
+        model = models[i]
+        model.load_state_dict(state)
+        metrics = evaluator.evaluate(model)
+        torch.save(pes_checkpoint(model, {"loss": best_loss[i].item(), **metrics}, precision,
+                                  data_hash=data_hash, seed=seeds[i]), path)
+        manifest["members"].append({
+            "path": os.path.basename(path),
+            "seed": seeds[i],
+            "best_loss": best_loss[i].item(),
+            **metrics,
+        })
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_ensemble(out_dir, device=None):
+    """
+    Load every member listed in out_dir/ensemble.json as an eval-mode NeuralNetwork.
+    """
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    # The manifest architecture only matters for members saved as bare state dicts
+    arch = {k: v for k, v in manifest["config"].items() if v is not None}
+    return [get_model(os.path.join(out_dir, member["path"]), arch, device=device) for member in manifest["members"]]
+
+
+def ensemble_predict(models, X):
+    """
+    Mean and standard deviation of the members' energies (uncertainty estimate).
+    """
+    with torch.no_grad():
+        energies = torch.stack([m(X.to(next(m.parameters()).dtype))[:, 0] for m in models])
+    return energies.mean(dim=0), energies.std(dim=0)
@@ -0,0 +1,182 @@
+"""
+Epoch evaluation stage.
+
+Epoch evaluation stage: build the evaluation tensors once, keep them on the device
+and compute energy/force metrics in torch at a configurable cadence. Datasets too
+large for memory are evaluated chunk by chunk with `ChunkedEvaluator`.
+"""
+
+import torch
+from data_loader import iter_chunks, prefetch
+
+
+def r2_score_torch(target, pred):
+    """
+    Coefficient of determination computed in torch.
+
+    Same definition as sklearn.metrics.r2_score for a single output.
+    """
+    target = target.double()
+    pred = pred.double()
+    ss_res = torch.sum((target - pred) ** 2)
+    ss_tot = torch.sum((target - target.mean()) ** 2)
+    return 1.0 - ss_res / ss_tot
+
+
+def regression_metrics(pred_energy, pred_forces, energy, forces):
+    """
+    R2, MAE and RMSE of energies and MAE/RMSE of forces.
+
+    Returns a dict of python floats, ready for ``utils.log_metrics``.
+    """
+    energy_err = (pred_energy.double() - energy.double())
+    force_err = (pred_forces.double() - forces.double())
+    # Energy-only rows (merged datasets) have NaN force targets
+    force_err = force_err[torch.isfinite(force_err)]
+    return {
+        "Accuracy": r2_score_torch(energy, pred_energy).item(),
+        "Energy_MAE": energy_err.abs().mean().item(),
+        "Energy_RMSE": energy_err.pow(2).mean().sqrt().item(),
+        "Force_MAE": force_err.abs().mean().item(),
+        "Force_RMSE": force_err.pow(2).mean().sqrt().item(),
+    }
+
+
+class Evaluator:
+    """
+    Cached, cadence-controlled evaluation of a PES model.
+
+    The (x, y) inputs and the z1..z4 targets are converted to tensors once and kept
+    on the device; each call is then a single batched forward + input-gradient pass.
+    """
+
+    def __init__(self, data, device, every: int = 1, subsample=None, seed: int = 0, dtype=torch.float32):
+        """
+        Args:
+            data (pd.DataFrame): frame with columns x, y, z1..z4
+            device: torch device the model lives on
+            every (int): evaluate every `every` epochs (<= 0 disables evaluation)
+            subsample (int | None): evaluate on a fixed random subset of this many rows
+            seed (int): seed for the subset selection
+            dtype (torch.dtype): dtype of the model inputs (see precision.resolve_dtype)
+        """
+        X = torch.tensor(data[['x', 'y']].to_numpy(), dtype=torch.float64)
+        # Targets stay in float64 so metrics are not limited by float32 at ~-128 Ha.
+        y = torch.tensor(data[['z1', 'z2', 'z3', 'z4']].to_numpy(), dtype=torch.float64)
+        if subsample and int(subsample) < len(X):
+            generator = torch.Generator().manual_seed(int(seed))
+            idx = torch.randperm(len(X), generator=generator)[:int(subsample)]
+            X, y = X[idx], y[idx]
+        self.X = X.to(device, dtype)
+        self.energy = y[:, 0].to(device)
+        self.forces = y[:, 1:4].to(device)
+        self.every = int(every)
+
+    def should_run(self, epoch: int) -> bool:
+        """
+        Whether evaluation is due at this (0-based) epoch.
+        """
+        return self.every > 0 and (epoch + 1) % self.every == 0
+
+    def _predict(self, model):
+        model.eval()
+        return model.energy_and_forces(self.X)
+
+    def evaluate(self, model):
+        """
+        Compute energy and force metrics on the cached tensors.
+
+        Leaves the model in eval mode; the training loop switches it back.
+        """
+        pred_energy, pred_forces = self._predict(model)
+        return regression_metrics(pred_energy, pred_forces, self.energy, self.forces)
+
+    def loss(self, model, criterion, weight):
+        """
+        Training loss and metrics on the cached tensors (validation set).
+
+        The loss uses the training criterion in float64, so it can drive
+        early stopping and the LR schedule in place of the training loss.
+
+        Returns:
+            (loss tensor, metrics dict)
+        """
+        pred_energy, pred_forces = self._predict(model)
+        loss = criterion(pred_energy.double(), self.energy, pred_forces.double(), self.forces, weight)
+        return loss, regression_metrics(pred_energy, pred_forces, self.energy, self.forces)
+
+
+class ChunkedEvaluator:
+    """
+    Evaluation of a PES model on a dataset streamed from disk.
+
+    Same metrics as `Evaluator`, accumulated chunk by chunk in float64 so peak
+    memory is set by `chunk_size`, not by the dataset size. Chunks are read
+    ahead in a background thread (see ``data_loader.prefetch``).
+    """
+
+    def __init__(self, file_path, device, every: int = 1, chunk_size: int = 65536, dtype=torch.float32,
+                 prefetch_chunks: int = 2):
+        """
+        Args:
+            file_path (str): CSV or binary dataset (see data_loader.load_data)
+            device: torch device the model lives on
+            every (int): evaluate every `every` epochs (<= 0 disables evaluation)
+            chunk_size (int): rows per chunk
+            dtype (torch.dtype): dtype of the model inputs (see precision.resolve_dtype)
+            prefetch_chunks (int): chunks read ahead of the model
+        """
+        self.file_path = file_path
+        self.device = device
+        self.every = int(every)
+        self.chunk_size = int(chunk_size)
+        self.dtype = dtype
+        self.prefetch_chunks = int(prefetch_chunks)
+
+    def should_run(self, epoch: int) -> bool:
+        """
+        Whether evaluation is due at this (0-based) epoch.
+        """
+        return self.every > 0 and (epoch + 1) % self.every == 0
+
+    def evaluate(self, model):
+        """
+        Compute energy and force metrics over the whole file, one chunk at a time.
+
+        R2 uses energies shifted by the first chunk's mean, which keeps the
+        running sum of squares well conditioned at ~-128 Ha.
+        """
+        model.eval()
+        n = 0
+        n_forces = 0
+        shift = None
+        sums = dict.fromkeys(["e", "e2", "e_abs", "e_sq", "f_abs", "f_sq"], 0.0)
+        for chunk in prefetch(iter_chunks(self.file_path, self.chunk_size), self.prefetch_chunks):
+            if chunk.empty:  # a header-only CSV parses as one empty object-dtype chunk
+                continue
+            X = torch.tensor(chunk[['x', 'y']].to_numpy(), dtype=torch.float64).to(self.device, self.dtype)
+            y = torch.tensor(chunk[['z1', 'z2', 'z3', 'z4']].to_numpy(), dtype=torch.float64).to(self.device)
+            energy, forces = model.energy_and_forces(X)
+            energy_err = energy.double() - y[:, 0]
+            force_err = forces.double() - y[:, 1:4]
+            if shift is None:
+                shift = y[:, 0].mean()
+            centered = y[:, 0] - shift
+            sums["e"] += centered.sum().item()
+            sums["e2"] += centered.pow(2).sum().item()
+            sums["e_abs"] += energy_err.abs().sum().item()
+            sums["e_sq"] += energy_err.pow(2).sum().item()
+            force_err = force_err[torch.isfinite(force_err)]
+            sums["f_abs"] += force_err.abs().sum().item()
+            sums["f_sq"] += force_err.pow(2).sum().item()
+            n_forces += force_err.numel()
+            n += len(X)
+        # An empty file or constant energies leave the energy metrics undefined: NaN, not a ZeroDivisionError
+        ss_tot = sums["e2"] - sums["e"] ** 2 / n if n else 0.0
+        return {
+            "Accuracy": 1.0 - sums["e_sq"] / ss_tot if ss_tot > 0 else float("nan"),
+            "Energy_MAE": sums["e_abs"] / n if n else float("nan"),
+            "Energy_RMSE": (sums["e_sq"] / n) ** 0.5 if n else float("nan"),
+            "Force_MAE": sums["f_abs"] / max(n_forces, 1),
+            "Force_RMSE": (sums["f_sq"] / max(n_forces, 1)) ** 0.5,
+        }
@@ -7,19 +7,24 @@ Simple graphical interface based on Streamlit: training, visualization and molec
 import os
 import io
 import time
-import re
 from datetime import datetime
 import pandas as pd
 import streamlit as st
 import torch
 from config import get_config, list_config_names, DEFAULT_CONFIG_NAME
-from model import NeuralNetwork
-from data_loader import load_data
-from train import train
-from utils import visualize_model, accuracy, load_model, ensure_dir
+from model import build_model
+from data_loader import load_data, read_dataset
+from evaluation import Evaluator
+from splits import split_from_config
+from train import train, build_optimizer, curriculum_stages
+from utils import visualize_model, accuracy, ensure_dir
 from loss import CustomLoss
 from torch.optim.lr_scheduler import ReduceLROnPlateau
 from molecular_simulation import run_simulation
+from pes_table import PESTable
+from precision import PRECISIONS, resolve_dtype, autocast
+from checkpoint import is_history_checkpoint, state_path_for
+from model_cache import get_model
 
 st.set_page_config(page_title="PES GUI", layout="wide")
 
@@ -66,6 +71,20 @@ TEXT = {
         "exports": "Exports:",
         "sim_fail": "Simulation failed: {err}",
         "epochs": "epochs",
+        "batch_size": "batch_size",
+        "optimizer": "optimizer",
+        "eval_every": "eval_every",
+        "compile": "Compile training step (torch.compile)",
+        "resume_dir": "Resume run directory (optional, continues from its .state.pth)",
+        "no_resume_state": "No training state (.state.pth) found in {d}",
+        "train_precision": "train_precision",
+        "split": "Validation split (none / random / block)",
+        "input_features": "Input features (e.g. morse+inverse; empty = raw bond lengths)",
+        "curriculum": "Curriculum subgrid strides (e.g. 4,2; empty = off)",
+        "md_table": "Tabulated surrogate (.table.npz from the tabulate command; empty = use the model)",
+        "inference_precision": "inference_precision",
+        "md_precision": "md_precision",
+        "full_batch": "Full-batch training (data resident on device)",
 
         "hidden_dim": "hidden_dim",
         "patience": "patience",
@@ -123,6 +142,20 @@ TEXT = {
         "exports": "Outputs:",
         "sim_fail": "Simulation failed: {err}",
         "epochs": "epochs",
+        "batch_size": "batch_size",
+        "optimizer": "optimizer",
+        "eval_every": "eval_every",
+        "compile": "Compile training step (torch.compile)",
+        "resume_dir": "Resume run directory (optional, continues from its .state.pth)",
+        "no_resume_state": "No training state (.state.pth) found in {d}",
+        "train_precision": "train_precision",
+        "split": "Validation split (none / random / block)",
+        "input_features": "Input features (e.g. morse+inverse; empty = raw bond lengths)",
+        "curriculum": "Curriculum subgrid strides (e.g. 4,2; empty = off)",
+        "md_table": "Tabulated surrogate (.table.npz from the tabulate command; empty = use the model)",
+        "inference_precision": "inference_precision",
+        "md_precision": "md_precision",
+        "full_batch": "Full-batch training (data resident on device)",
 
         "hidden_dim": "hidden_dim",
         "patience": "patience",
@@ -145,16 +178,12 @@ def t(lang_code: str, key: str) -> str:
     return TEXT.get(lang_code, TEXT["zh"]).get(key, key)
 
 # -------- Utilities for auto-detecting latest model --------
-ACTIVATIONS = {"Mish", "ReLU", "LeakyReLU", "ELU", "GELU"}
-STEM_REGEX = re.compile(r"^(\d+)-(\d+)-([A-Za-z]+)$")
-TS_SUFFIX = re.compile(r"-\d{8}-\d{6}$")  # -YYYYMMDD-HHMMSS
-
 def list_pth_files(dirpath: str):
     try:
         return [
             os.path.join(dirpath, f)
             for f in os.listdir(dirpath)
-            if f.endswith(".pth") and os.path.isfile(os.path.join(dirpath, f))
+            if f.endswith(".pth") and not is_history_checkpoint(f) and os.path.isfile(os.path.join(dirpath, f))
         ]
     except Exception:
         return []
@@ -184,20 +213,6 @@ def find_latest_model_dir(base_dir: str = "."):
     candidates.sort(reverse=True, key=lambda x: x[0])
     return candidates[0][1]
 
-def parse_stem_to_arch(stem: str):
-    """
-    stem format: "<num_layers>-<hidden_dim>-<activation>"
-    """
-    m = STEM_REGEX.match(stem)
-    if not m:
-        return None
-    num_layers = int(m.group(1))
-    hidden_dim = int(m.group(2))
-    act = m.group(3)
-    if act not in ACTIVATIONS:
-        return None
-    return {"num_layers": num_layers, "hidden_dim": hidden_dim, "activation_function": act}
-
 def save_uploaded_to(path: str, uploaded_file) -> str:
     """
     Save an uploaded file to disk.
@@ -209,30 +224,6 @@ def save_uploaded_to(path: str, uploaded_file) -> str:
         f.write(uploaded_file.getbuffer())
     return path
 
-def ensure_latest_alias(model_dir: str, cfg_default_model_name: str, latest_model_path: str):
-    """
-    Some downstream funcs (e.g., run_simulation) may expect cfg['save_model_path'] under model_dir.
-    To satisfy that without changing their code, copy/symlink the latest model to that expected name.
-    """
-    try:
-        ensure_dir(model_dir)
-        alias_path = os.path.join(model_dir, cfg_default_model_name)
-        # Prefer symlink if possible; fall back to copy if symlink fails.
-        if os.path.islink(alias_path) or os.path.exists(alias_path):
-            try:
-                os.remove(alias_path)
-            except Exception:
-                pass
-        try:
-            os.symlink(os.path.abspath(latest_model_path), alias_path)
-        except Exception:
-            # Copy fallback
-            import shutil
-            shutil.copy2(latest_model_path, alias_path)
-        return alias_path
-    except Exception:
-        return None
-
 with st.sidebar:
     # language selection / Language selection
     lang_label = t("zh", "language")  # label itself bilingual
@@ -269,10 +260,20 @@ with TAB_TRAIN:
         patience = st.number_input(t(lang_code, "patience"), min_value=1, value=int(cfg["patience"]))
         lr = st.number_input(t(lang_code, "learning_rate"), min_value=1e-6, format="%f", value=float(cfg["learning_rate"]))
         num_layers = st.number_input(t(lang_code, "num_layers"), min_value=1, value=int(cfg["num_layers"]))
+        batch_size = st.number_input(t(lang_code, "batch_size"), min_value=1, value=int(cfg["batch_size"]))
     with col3:
         min_delta = st.number_input(t(lang_code, "min_delta"), min_value=0.0, format="%f", value=float(cfg["min_delta"]))
         weight = st.number_input(t(lang_code, "gradient_weight"), min_value=0.0, format="%f", value=float(cfg["weight"]))
         activation = st.selectbox(t(lang_code, "activation"), ["Mish", "ReLU", "LeakyReLU", "ELU", "GELU"], index=0)
+        optimizer_name = st.selectbox(t(lang_code, "optimizer"), ["Adam", "LBFGS"], index=0)
+        eval_every = st.number_input(t(lang_code, "eval_every"), min_value=0, value=int(cfg["eval_every"]))
+        full_batch = st.checkbox(t(lang_code, "full_batch"), value=bool(cfg["full_batch"]))
+        use_compile = st.checkbox(t(lang_code, "compile"), value=bool(cfg["compile"]))
+        train_precision = st.selectbox(t(lang_code, "train_precision"), PRECISIONS,
+                                       index=PRECISIONS.index(cfg["train_precision"]))
+        split_method = st.selectbox(t(lang_code, "split"), ["none", "random", "block"], index=0)
+        features = st.text_input(t(lang_code, "input_features"), value=cfg["features"] or "")
+        curriculum = st.text_input(t(lang_code, "curriculum"), value="")
 
     st.markdown("---")
 
@@ -280,6 +281,7 @@ with TAB_TRAIN:
     uploaded_train = st.file_uploader(t(lang_code, "upload_train"), type=["csv"], key="train_csv")
     default_data_path = cfg["train_data_path"]
     data_path_text = st.text_input(t(lang_code, "input_train_path"), value=default_data_path)
+    resume_dir = st.text_input(t(lang_code, "resume_dir"), value="")
 
     if st.button(t(lang_code, "start_train"), type="primary"):
         try:
@@ -287,14 +289,32 @@ with TAB_TRAIN:
             cfg["epochs"], cfg["patience"], cfg["min_delta"] = int(epochs), int(patience), float(min_delta)
             cfg["learning_rate"], cfg["weight"] = float(lr), float(weight)
             cfg["hidden_dim"], cfg["num_layers"], cfg["activation_function"] = int(hidden_dim), int(num_layers), activation
+            cfg["batch_size"] = int(batch_size)
+            cfg["optimizer"], cfg["full_batch"] = optimizer_name, bool(full_batch)
+            cfg["eval_every"] = int(eval_every)
+            cfg["compile"] = bool(use_compile)
+            cfg["train_precision"] = train_precision
+            cfg["split"] = None if split_method == "none" else split_method
+            cfg["features"] = features.strip() or None
+            cfg["curriculum"] = tuple(int(s) for s in curriculum.split(",") if s.strip()) or None
 
             # Automatically generate directory name (with timestamp) and filename (also with timestamp)
             stem = f"{cfg['num_layers']}-{cfg['hidden_dim']}-{cfg['activation_function']}"
-            tag = datetime.now().strftime("%Y%m%d-%H%M%S")
-            out_dir = f"{stem}-{tag}"         # Directory also has timestamp
+            resume_from = None
+            if resume_dir.strip():
+                # Continue an interrupted run in place: reuse its directory and checkpoint name
+                out_dir = resume_dir.strip()
+                model_file = latest_pth_in_dir(out_dir)
+                if model_file is None or not os.path.exists(state_path_for(model_file)):
+                    raise FileNotFoundError(t(lang_code, "no_resume_state").format(d=out_dir))
+                cfg["save_model_path"] = os.path.basename(model_file)
+                resume_from = state_path_for(model_file)
+            else:
+                tag = datetime.now().strftime("%Y%m%d-%H%M%S")
+                out_dir = f"{stem}-{tag}"         # Directory also has timestamp
+                cfg["save_model_path"] = f"{stem}-{tag}.pth"   # Filename matches directory name
             ensure_dir(out_dir)
 
-            cfg["save_model_path"] = f"{stem}-{tag}.pth"   # Filename matches directory name
             cfg["saveaxpath"] = f"{stem}-3d.png"
             cfg["saveaxpath2"] = f"{stem}-2d.png"
             cfg["assesspath"] = f"{stem}-fit.png"
@@ -313,21 +333,26 @@ with TAB_TRAIN:
 
             # Data loading
             with st.spinner(t(lang_code, "loading_data")):
-                train_loader, data = load_data(data_path)
+                full = read_dataset(data_path, cache=cfg['data_cache'])
+                split = split_from_config(full, cfg)
+                train_loader, data = load_data(
+                    data_path, batch_size=cfg['batch_size'], dtype=resolve_dtype(cfg['train_precision']),
+                    cache=cfg['data_cache'], rows=split["train"] if split is not None else None,
+                )
 
             # Build model
             device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            model = NeuralNetwork(
-                cfg['input_dim'],
-                cfg['hidden_dim'],
-                cfg['num_layers'],
-                cfg['output_dim'],
-                cfg['activation_function']
-            ).to(device)
+            model = build_model(cfg)
+            if cfg['standardize']:
+                model.fit_standardization(data[['z1', 'z2', 'z3', 'z4']].to_numpy())
+            model = model.to(device)
+            val_evaluator = None
+            if split is not None and len(split["val"]):
+                val_evaluator = Evaluator(full.iloc[split["val"]], device, dtype=resolve_dtype(cfg['train_precision']))
 
             # Optimizer and scheduler
             criterion = CustomLoss()
-            optimizer = torch.optim.Adam(model.parameters(), lr=cfg['learning_rate'])
+            optimizer = build_optimizer(model, cfg)
             scheduler = ReduceLROnPlateau(
                 optimizer,
                 cfg['scheduler_mode'],
@@ -350,12 +375,26 @@ with TAB_TRAIN:
                     epochs=cfg['epochs'],
                     patience=cfg['patience'],
                     min_delta=cfg['min_delta'],
+                    full_batch=cfg['full_batch'],
+                    eval_every=cfg['eval_every'],
+                    eval_subsample=cfg['eval_subsample'],
+                    compile=cfg['compile'],
+                    precision=cfg['train_precision'],
+                    num_threads=cfg['num_threads'],
+                    async_checkpoint=cfg['async_checkpoint'],
+                    keep_best=cfg['keep_best'],
+                    resume_from=resume_from,
+                    val_evaluator=val_evaluator,
+                    cache_features=cfg['cache_features'],
+                    curriculum=curriculum_stages(data, cfg['curriculum'], cfg['curriculum_epochs'])
+                    if cfg['curriculum'] else None,
                 )
 
-            # Evaluation and visualization
-            model = load_model(model, save_model_path)
-            visualize_model(model, data, savepath, savepath2, saverocpath)
-            r2 = accuracy(model, data)
+            # Evaluation and visualization (R2 on the test rows when a split is used)
+            model = get_model(save_model_path, cfg, device=device, dtype=resolve_dtype(cfg['inference_precision']))
+            with autocast(cfg['inference_precision'], device):
+                visualize_model(model, full, savepath, savepath2, saverocpath)
+                r2 = accuracy(model, full.iloc[split["test"]] if split is not None else full)
             st.success(t(lang_code, "train_done").format(r2=f"{r2:.6f}"))
             st.image([saverocpath, savepath, savepath2],
                      caption=[t(lang_code, "cap_fit"), t(lang_code, "cap_3d"), t(lang_code, "cap_2d")],
@@ -397,20 +436,17 @@ with TAB_VIS:
     uploaded_vis = st.file_uploader(t(lang_code, "upload_vis"), type=["csv"], key="vis_csv")
     data_path_text = st.text_input(t(lang_code, "input_data_path"),
                                    value=cfg["train_data_path"], key="vis_path")
+    vis_precision = st.selectbox(t(lang_code, "inference_precision"), PRECISIONS,
+                                 index=PRECISIONS.index(cfg["inference_precision"]), key="vis_precision")
+    vis_features = st.text_input(t(lang_code, "input_features"), value=cfg["features"] or "", key="vis_features")
 
     if st.button(t(lang_code, "gen_plots")):
         try:
             if not auto_dir or not auto_model_path or not os.path.exists(auto_model_path):
                 st.error(t(lang_code, "no_model_found"))
             else:
-                # Parse structure parameters from directory name: first remove timestamp suffix then parse
-                dir_base = os.path.basename(auto_dir)
-                stem_no_ts = TS_SUFFIX.sub("", dir_base)
-                arch = parse_stem_to_arch(stem_no_ts)
-                if arch:
-                    cfg["num_layers"] = arch["num_layers"]
-                    cfg["hidden_dim"] = arch["hidden_dim"]
-                    cfg["activation_function"] = arch["activation_function"]
+                # The checkpoint carries its architecture; features only matter for legacy checkpoints
+                cfg["features"] = vis_features.strip() or None
 
                 # Data preparation
                 if uploaded_vis is not None:
@@ -420,29 +456,23 @@ with TAB_VIS:
                     data_path = data_path_text
 
                 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-                model = NeuralNetwork(
-                    cfg['input_dim'],
-                    cfg['hidden_dim'],
-                    cfg['num_layers'],
-                    cfg['output_dim'],
-                    cfg['activation_function']
-                ).to(device)
-
                 # Directly use auto-selected .pth
-                model = load_model(model, auto_model_path)
+                model = get_model(auto_model_path, cfg, device=device, dtype=resolve_dtype(vis_precision))
 
-                _, data = load_data(data_path)
+                _, data = load_data(data_path, cache=cfg['data_cache'])
 
                 # Output image paths (overwrite/update visualization plots in this directory)
-                cfg["saveaxpath"] = f"{stem_no_ts}-3d.png"
-                cfg["saveaxpath2"] = f"{stem_no_ts}-2d.png"
-                cfg["assesspath"] = f"{stem_no_ts}-fit.png"
+                model_stem = os.path.splitext(os.path.basename(auto_model_path))[0]
+                cfg["saveaxpath"] = f"{model_stem}-3d.png"
+                cfg["saveaxpath2"] = f"{model_stem}-2d.png"
+                cfg["assesspath"] = f"{model_stem}-fit.png"
                 savepath = os.path.join(auto_dir, cfg["saveaxpath"])
                 savepath2 = os.path.join(auto_dir, cfg["saveaxpath2"])
                 saverocpath = os.path.join(auto_dir, cfg["assesspath"])
 
-                visualize_model(model, data, savepath, savepath2, saverocpath)
-                r2 = accuracy(model, data)
+                with autocast(vis_precision, device):
+                    visualize_model(model, data, savepath, savepath2, saverocpath)
+                    r2 = accuracy(model, data)
                 st.success(t(lang_code, "vis_done").format(r2=f"{r2:.6f}"))
                 st.image([saverocpath, savepath, savepath2],
                          caption=[t(lang_code, "cap_fit"), t(lang_code, "cap_3d"), t(lang_code, "cap_2d")],
@@ -482,6 +512,10 @@ with TAB_SIM:
 
     steps = st.number_input(t(lang_code, "steps"), min_value=1, value=60000)
     dt = st.number_input(t(lang_code, "dt"), min_value=1e-22, value=10e-19, format="%e")
+    md_precision = st.selectbox(t(lang_code, "md_precision"), PRECISIONS,
+                                index=PRECISIONS.index(cfg["md_precision"]), key="md_precision")
+    md_features = st.text_input(t(lang_code, "input_features"), value=cfg["features"] or "", key="md_features")
+    md_table = st.text_input(t(lang_code, "md_table"), value="", key="md_table")
 
     c1, c2, c3 = st.columns(3)
     with c1:
@@ -500,19 +534,6 @@ with TAB_SIM:
                 st.error(t(lang_code, "no_model_found"))
             else:
                 with st.spinner(t(lang_code, "sim_running")):
-                    # Compatible with run_simulation possibly using cfg['save_model_path']:
-                    default_model_name = get_config(selected_config).get("save_model_path", "model.pth")
-                    alias_path = ensure_latest_alias(auto_dir, default_model_name, auto_model_path)
-
-                    # Parse directory name to get structure (remove timestamp)
-                    dir_base = os.path.basename(auto_dir)
-                    stem_no_ts = TS_SUFFIX.sub("", dir_base)
-                    arch = parse_stem_to_arch(stem_no_ts)
-                    if arch:
-                        cfg["num_layers"] = arch["num_layers"]
-                        cfg["hidden_dim"] = arch["hidden_dim"]
-                        cfg["activation_function"] = arch["activation_function"]
-
                     outputs = run_simulation(
                         config_name=selected_config,
                         model_dir=auto_dir,  # Use auto-selected directory
@@ -524,6 +545,10 @@ with TAB_SIM:
                         init_v1=float(v1),
                         init_v2=float(v2),
                         init_v3=float(v3),
+                        precision=md_precision,
+                        features=md_features.strip() or None,
+                        potential=PESTable.from_npz(md_table.strip()) if md_table.strip() else None,
+                        model_path=auto_model_path,
                     )
                 st.success(t(lang_code, "sim_done"))
                 st.image([outputs["md_plot"], outputs["energy_plot"]],
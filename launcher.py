@@ -0,0 +1,329 @@
+"""
+Training launchers.
+
+Training launchers: run one configuration end to end (train, evaluate, plot) and
+train several configurations concurrently in a process pool with the CPU cores
+partitioned between workers.
+"""
+
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+
+from data_loader import load_data, sample_dataset, read_dataset
+from evaluation import Evaluator, ChunkedEvaluator
+from splits import split_from_config, cv_splits
+from model import build_model
+from loss import CustomLoss
+from train import train, build_optimizer, curriculum_stages
+from utils import visualize_model, accuracy, ensure_dir
+from model_cache import get_model
+from precision import resolve_dtype, autocast
+from checkpoint import state_path_for
+
+# Rows drawn for the plots of a streamed run
+STREAMING_PLOT_ROWS = 20000
+
+
+def run_training(config_name, cfg, train_data_path, out_dir, dist_ctx=None, resume=False, split=None, run_name=None):
+    """
+    Train one configuration and write its checkpoint, plots and summary.csv.
+
+    Train a single configuration end to end and return its summary row. With a
+    `dist_ctx` (see ``distributed.py``) every rank trains on its shard and only
+    rank 0 evaluates and writes outputs; other ranks return None. `resume`
+    continues from the run's training-state checkpoint if one exists.
+
+    `split` ({"train", "val", "test"} row indices, see ``splits.py``; by default
+    taken from the config's `split` settings) trains on the train rows, early
+    stops on the validation loss and reports R2 and errors on the test rows
+    (validation rows if there is no test set).
+
+    `run_name` names the progress bar and TensorBoard run (default
+    `config_name`); concurrent runs of one config need distinct names.
+    """
+    ensure_dir(out_dir)
+    save_model_path = f"{out_dir}/{cfg['save_model_path']}"
+    savepath = f"{out_dir}/{cfg['saveaxpath']}"
+    savepath2 = f"{out_dir}/{cfg['saveaxpath2']}"
+    saverocpath = f"{out_dir}/{cfg['assesspath']}"
+    start = time.perf_counter()
+    resume_from = None
+    if resume:
+        resume_from = state_path_for(save_model_path)
+        if not os.path.exists(resume_from):
+            print(f"[{config_name}] no training state at {resume_from}; starting from scratch")
+            resume_from = None
+
+    # Data
+    # Data loading
+    full = None
+    if split is None and cfg['split']:
+        if cfg['streaming']:
+            raise ValueError("Validation splits need the in-memory loader (streaming is on)")
+        full = read_dataset(train_data_path, cache=cfg['data_cache'])
+        split = split_from_config(full, cfg)
+    if split is not None:
+        full = read_dataset(train_data_path, cache=cfg['data_cache']) if full is None else full
+        ensure_dir(out_dir)
+        np.savez(f"{out_dir}/split.npz", **split)
+    train_loader, data = load_data(
+        train_data_path, batch_size=cfg['batch_size'], dtype=resolve_dtype(cfg['train_precision']),
+        streaming=cfg['streaming'], chunk_size=cfg['chunk_size'], prefetch_chunks=cfg['prefetch_chunks'],
+        cache=cfg['data_cache'], rows=split["train"] if split is not None else None,
+    )
+
+    # Model
+    # Build model
+    model = build_model(cfg)
+    if cfg['standardize']:
+        # Statistics of the training targets (a bounded sample when streaming)
+        targets = data if data is not None else sample_dataset(
+            train_data_path, STREAMING_PLOT_ROWS, chunk_size=cfg['chunk_size'])
+        model.fit_standardization(targets[['z1', 'z2', 'z3', 'z4']].to_numpy())
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = model.to(device)
+    evaluator = None
+    if cfg['streaming']:
+        # Metrics are accumulated chunk by chunk; the in-memory frame is never built.
+        evaluator = ChunkedEvaluator(
+            train_data_path, device, every=cfg['eval_every'], chunk_size=cfg['chunk_size'],
+            dtype=resolve_dtype(cfg['train_precision']), prefetch_chunks=cfg['prefetch_chunks'],
+        )
+    val_evaluator = None
+    if split is not None and len(split["val"]):
+        val_evaluator = Evaluator(full.iloc[split["val"]], device, dtype=resolve_dtype(cfg['train_precision']))
+
+    curriculum = None
+    if cfg['curriculum']:
+        curriculum = curriculum_stages(data, cfg['curriculum'], cfg['curriculum_epochs'])
+
+    # Optimization
+    # Optimizer and learning rate scheduler
+    criterion = CustomLoss()
+    optimizer = build_optimizer(model, cfg)
+    scheduler = ReduceLROnPlateau(
+        optimizer, cfg['scheduler_mode'], patience=cfg['scheduler_patience'], factor=cfg['scheduler_factor']
+    )
+
+    # train
+    report = train(
+        model,
+        train_loader,
+        criterion,
+        optimizer,
+        scheduler,
+        save_model_path,
+        data,
+        cfg['weight'],
+        run_name or config_name,
+        epochs=cfg['epochs'],
+        patience=cfg['patience'],
+        min_delta=cfg['min_delta'],
+        full_batch=cfg['full_batch'],
+        eval_every=cfg['eval_every'],
+        eval_subsample=cfg['eval_subsample'],
+        compile=cfg['compile'],
+        precision=cfg['train_precision'],
+        num_threads=cfg['num_threads'],
+        dist_ctx=dist_ctx,
+        async_checkpoint=cfg['async_checkpoint'],
+        keep_best=cfg['keep_best'],
+        resume_from=resume_from,
+        evaluator=evaluator,
+        val_evaluator=val_evaluator,
+        cache_features=cfg['cache_features'],
+        curriculum=curriculum,
+        target_rmse=cfg['target_energy_rmse'],
+    )
+    if dist_ctx is not None and not dist_ctx.is_main:
+        return None
+
+    # Evaluation & Visualization
+    # Evaluation and visualization
+    model = get_model(save_model_path, cfg, device=device, dtype=resolve_dtype(cfg['inference_precision']))
+    held_out = {}
+    with autocast(cfg['inference_precision'], device):
+        if split is not None:
+            # Report on data the model never trained on; plots show the whole dataset.
+            name = "test" if len(split["test"]) else "val"
+            held_out = Evaluator(
+                full.iloc[split[name]], device, dtype=resolve_dtype(cfg['inference_precision'])
+            ).evaluate(model)
+            held_out = {f"{name}_{key}": value for key, value in held_out.items()}
+            r2 = held_out[f"{name}_Accuracy"]
+            visualize_model(model, full, savepath, savepath2, saverocpath)
+        elif cfg['streaming']:
+            # R2 over the full file; the plots use a bounded uniform sample.
+            evaluator.dtype = resolve_dtype(cfg['inference_precision'])
+            r2 = evaluator.evaluate(model)["Accuracy"]
+            data = sample_dataset(train_data_path, STREAMING_PLOT_ROWS, chunk_size=cfg['chunk_size'])
+            visualize_model(model, data, savepath, savepath2, saverocpath)
+        else:
+            visualize_model(model, data, savepath, savepath2, saverocpath)
+            r2 = accuracy(model, data)
+    print(f"[{config_name}] R2: {r2:.6f}")
+    timing = {key: report[key] for key in ("epochs", "time_to_target", "epoch_to_target")}
+    # write to a CSV summary
+    # Write results summary
+    pd.DataFrame([{"config": config_name, "r2": r2, **held_out, **timing}]).to_csv(f"{out_dir}/summary.csv", index=False)
+    return {"config": config_name, "r2": r2, **held_out, **timing, "out_dir": out_dir,
+            "seconds": time.perf_counter() - start}
+
+
+def partition_cores(workers: int, cores=None):
+    """
+    Split the available CPU cores into `workers` disjoint, equally sized slots.
+
+    Returns a list of core-id lists (leftover cores are left idle).
+    """
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    per_worker = max(1, len(cores) // workers)
+    return [cores[i * per_worker:(i + 1) * per_worker] or cores[-per_worker:] for i in range(workers)]
+
+
+def _init_worker(slots):
+    """
+    Pool initializer: claim one core slot, pin to it and size torch's thread pool.
+    """
+    cores = slots.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    os.environ["PES_WORKER_CORES"] = ",".join(map(str, cores))
+
+
+def _run_in_worker(config_name, cfg, train_data_path, out_dir, split=None, run_name=None):
+    cfg = {**cfg, "num_threads": torch.get_num_threads()}
+    row = run_training(config_name, cfg, train_data_path, out_dir, split=split, run_name=run_name)
+    row.update({"threads": cfg["num_threads"], "cores": os.environ.get("PES_WORKER_CORES", "")})
+    return row
+
+
+def _run_pool(jobs, workers=None, cores=None):
+    """
+    Run training jobs in a spawn process pool with one core slot per worker.
+
+    Args:
+        jobs (dict): {name: (config_name, cfg, train_data_path, out_dir, split[, run_name])}
+
+    Returns:
+        list[dict]: summary rows; a failed job gives a row with r2 NaN and the error
+    """
+    slots = partition_cores(workers or len(jobs), cores)
+    workers = min(len(jobs), len(slots))
+    ctx = mp.get_context("spawn")
+    slot_queue = ctx.Queue()
+    for slot in slots[:workers]:
+        slot_queue.put(slot)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(slot_queue,)) as pool:
+        futures = {pool.submit(_run_in_worker, *args): name for name, args in jobs.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                rows.append({**future.result(), "job": name})
+            except Exception as e:
+                print(f"[{name}] training failed: {e}")
+                rows.append({"job": name, "config": jobs[name][0], "r2": float("nan"),
+                             "out_dir": jobs[name][3], "error": str(e)})
+    return rows
+
+
+def train_many(configs, out_root, train_data_path=None, workers=None, cores=None):
+    """
+    Train several configurations concurrently and aggregate their summaries.
+
+    Args:
+        configs (dict): {config_name: merged config dict}
+        out_root (str): each run writes to out_root/<config_name>; the aggregated
+            summary goes to out_root/summary.csv
+        train_data_path (str | None): data path, default each config's train_data_path
+        workers (int | None): pool size, default min(len(configs), number of cores)
+        cores (list | None): core ids to partition, default the process affinity set
+
+    Returns:
+        pd.DataFrame: one row per configuration (config, r2, out_dir, seconds, threads, cores)
+    """
+    ensure_dir(out_root)
+    jobs = {
+        name: (name, cfg, train_data_path or cfg['train_data_path'], os.path.join(out_root, name), None)
+        for name, cfg in configs.items()
+    }
+    rows = _run_pool(jobs, workers, cores)
+    summary = pd.DataFrame(rows).drop(columns="job").sort_values("config")
+    summary.to_csv(os.path.join(out_root, "summary.csv"), index=False)
+    return summary
+
+
+def cross_validate(config_name, cfg, out_root, folds=5, method="block", train_data_path=None, workers=None,
+                   cores=None):
+    """
+    k-fold cross-validation with the folds trained concurrently.
+
+    Fold k is held out as the test set and a validation set for early stopping
+    is split off the rest (see ``splits.cv_splits``). Each fold writes to
+    out_root/fold_<k>; the per-fold test metrics plus their mean and standard
+    deviation go to out_root/cv_summary.csv.
+
+    Returns:
+        pd.DataFrame: one row per fold followed by "mean" and "std" rows
+    """
+    ensure_dir(out_root)
+    train_data_path = train_data_path or cfg['train_data_path']
+    data = read_dataset(train_data_path, cache=cfg['data_cache'])
+    splits = cv_splits(data, folds, method, val_fraction=cfg['split_fractions'][1],
+                       blocks=cfg['split_blocks'], seed=cfg['split_seed'])
+    jobs = {
+        # One TensorBoard run per fold: concurrent runs with one name would share a log directory
+        f"fold_{k}": (config_name, cfg, train_data_path, os.path.join(out_root, f"fold_{k}"), split,
+                      f"{config_name}-fold{k}")
+        for k, split in enumerate(splits)
+    }
+    rows = _run_pool(jobs, workers, cores)
+    folds_frame = pd.DataFrame(rows).rename(columns={"job": "fold"}).sort_values("fold")
+    metrics = [c for c in folds_frame.columns if c.startswith("test_")]
+    spread = folds_frame[metrics].agg(["mean", "std"]).reset_index(names="fold")
+    summary = pd.concat([folds_frame, spread], ignore_index=True)
+    summary.to_csv(os.path.join(out_root, "cv_summary.csv"), index=False)
+    return summary
+
+
+def compare_curriculum(config_name, cfg, out_root, train_data_path=None, seed=0):
+    """
+    Time-to-target-error of curriculum training against single-stage training.
+
+    Runs the configuration twice, one run after the other (concurrent runs
+    would distort the timings), with the same seed: once without the
+    curriculum and once with cfg['curriculum']. Each run writes to
+    out_root/single and out_root/curriculum; the comparison goes to
+    out_root/curriculum_summary.csv.
+
+    Returns:
+        pd.DataFrame: one row per run with epochs, time/epoch to the target
+        energy RMSE, final R2 and wall time, plus the speedup of the curriculum
+    """
+    if not cfg['curriculum'] or cfg['target_energy_rmse'] is None:
+        raise ValueError("The comparison needs curriculum strides and target_energy_rmse")
+    ensure_dir(out_root)
+    train_data_path = train_data_path or cfg['train_data_path']
+    rows = []
+    for run, curriculum in (("single", None), ("curriculum", cfg['curriculum'])):
+        torch.manual_seed(seed)
+        row = run_training(config_name, {**cfg, "curriculum": curriculum}, train_data_path,
+                           os.path.join(out_root, run))
+        rows.append({"run": run, **row})
+    summary = pd.DataFrame(rows)[["run", "epochs", "epoch_to_target", "time_to_target", "r2", "seconds"]]
+    single, staged = summary["time_to_target"]
+    summary["speedup"] = [1.0, single / staged if single and staged else float("nan")]
+    summary.to_csv(os.path.join(out_root, "curriculum_summary.csv"), index=False)
+    return summary
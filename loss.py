@@ -14,14 +14,46 @@ class CustomLoss(nn.Module):
         """
         Compute weighted sum of output error and gradient error.
 
-        Compute weighted sum of output error and gradient error.
+        Compute weighted sum of output error and gradient error. Non-finite
+        force targets (energy-only rows of a merged dataset) are left out of
+        the gradient term; with all targets present the result is unchanged.
         """
         # the main loss based on the MSE of the input and output
         loss_output = torch.mean((input - target) ** 2)*(1-weight)
         
         # the added loss based on MSE of derivatives of the input and output
-        loss_derivative = torch.mean((dY_dX_pred - dY_dX_target) ** 2) * weight
+        has_force = torch.isfinite(dY_dX_target)
+        error = torch.where(has_force, dY_dX_pred - dY_dX_target, torch.zeros_like(dY_dX_pred))
+        # mean over the present targets; the factor is exactly 1 when none are missing
+        coverage = has_force.numel() / has_force.sum().clamp(min=1)
+        loss_derivative = torch.mean(error ** 2) * coverage * weight
 
         # combine 2 different loss
         loss = loss_output + loss_derivative
         return loss
+
+
+class StandardizedLoss(nn.Module):
+    """
+    Apply a criterion to standardized energies and forces.
+
+    Predictions and targets are both mapped with the model's stored
+    standardization (``model.NeuralNetwork.standardize``), so the optimizer
+    sees O(1) targets while the model itself keeps predicting Hartree. With
+    the identity standardization the wrapped criterion's value is unchanged.
+    """
+
+    def __init__(self, criterion, standardize):
+        """
+        Args:
+            criterion: loss module with CustomLoss's signature
+            standardize: callable (energy, forces) -> standardized (energy, forces)
+        """
+        super(StandardizedLoss, self).__init__()
+        self.criterion = criterion
+        self.standardize = standardize
+
+    def forward(self, input, target, dY_dX_pred, dY_dX_target, weight):
+        input, dY_dX_pred = self.standardize(input, dY_dX_pred)
+        target, dY_dX_target = self.standardize(target, dY_dX_target)
+        return self.criterion(input, target, dY_dX_pred, dY_dX_target, weight)
@@ -1,24 +1,147 @@
 """
 Command-line entrypoint for PES project.
 
-Command line entry: provides four subcommands: train / visualize / simulate / list-configs,
+Command line entry: provides subcommands train / train-all / cv / train-ensemble / visualize / simulate / export-numpy / tabulate / benchmark-precision / convert-data / merge-data / filter-data / list-configs,
 used for training models, visualization and molecular dynamics simulation.
 """
 import argparse
+import os
 from mkdir import create_folders
-from data_loader import load_data
-from model import NeuralNetwork
-from loss import CustomLoss
+from data_loader import load_data, convert_csv_to_binary, read_binary_header, read_dataset
+from data_filter import filter_dataset
+from data_merge import merge_sources
+from model import build_model
+from numpy_pes import export_npz, NumpyPES
+from pes_table import tabulate, PESTable
 from config import get_config, list_config_names, DEFAULT_CONFIG_NAME
-from train import train
-from utils import visualize_model, accuracy, load_model, ensure_dir
+from utils import visualize_model, accuracy
+from model_cache import get_model
+from launcher import run_training, train_many, cross_validate, compare_curriculum
+from splits import SPLIT_METHODS
+from ensemble import train_ensemble
+from distributed import init_distributed, cleanup_distributed
+from precision import PRECISIONS, resolve_dtype, autocast, benchmark_precision
 import numpy as np
 import pandas as pd
 import torch
-from torch.optim.lr_scheduler import ReduceLROnPlateau
 from molecular_simulation import run_simulation
 
 
+def _add_train_arguments(p):
+    """
+    Register the hyperparameter overrides shared by train and train-all.
+    """
+    p.add_argument("--data", default=None, help="Training data CSV path, default reads from config")
+    p.add_argument("--epochs", type=int, default=None)
+    p.add_argument("--patience", type=int, default=None)
+    p.add_argument("--batch-size", type=int, default=None,
+                   help="Mini-batch size (1 = original per-sample loop)")
+    p.add_argument("--lr", type=float, default=None)
+    p.add_argument("--optimizer", choices=["Adam", "LBFGS"], default=None,
+                   help="LBFGS trains full-batch")
+    p.add_argument("--eval-every", type=int, default=None,
+                   help="Log evaluation metrics every N epochs (0 disables)")
+    p.add_argument("--eval-subsample", type=int, default=None,
+                   help="Evaluate on a fixed random subset of this many rows")
+    p.add_argument("--compile", action="store_true",
+                   help="torch.compile the energy/force/loss step (needs --batch-size > 1 or --full-batch)")
+    p.add_argument("--full-batch", action="store_true",
+                   help="Keep the dataset on the device and take one step per epoch on all of it")
+    p.add_argument("--weight", type=float, default=None)
+    p.add_argument("--hidden-dim", type=int, default=None)
+    p.add_argument("--num-layers", type=int, default=None)
+    p.add_argument("--activation", type=str, default=None)
+    p.add_argument("--features", default=None,
+                   help="Input features before the first layer, '+'-joined: raw, morse, inverse, poly "
+                        "(e.g. morse+inverse)")
+    p.add_argument("--precision", choices=PRECISIONS, default=None,
+                   help="Training precision (bf16 = float32 weights + bfloat16 autocast)")
+    p.add_argument("--num-threads", type=int, default=None, help="torch intra-op threads per run")
+    p.add_argument("--keep-best", type=int, default=None, help="Best-k checkpoint history files to keep")
+    p.add_argument("--streaming", action="store_true",
+                   help="Stream shuffled chunks from disk with background prefetch (needs --batch-size > 1)")
+    p.add_argument("--chunk-size", type=int, default=None, help="Rows per streamed chunk")
+    p.add_argument("--split", choices=SPLIT_METHODS, default=None,
+                   help="Hold out validation/test data; early stopping follows the validation loss")
+    p.add_argument("--holdout-region", default=None,
+                   help="x_min,x_max,y_min,y_max test rectangle for --split region")
+    p.add_argument("--curriculum", default=None,
+                   help="Comma-separated subgrid strides trained before the full set, coarsest first (e.g. 4,2)")
+    p.add_argument("--curriculum-epochs", type=int, default=None, help="Epoch budget of each coarse stage")
+    p.add_argument("--target-rmse", type=float, default=None,
+                   help="Energy RMSE (Hartree) whose time-to-target is reported")
+    p.add_argument("--no-standardize", action="store_true",
+                   help="Train on raw energies/forces instead of standardized targets")
+    p.add_argument("--no-data-cache", action="store_true",
+                   help="Parse the CSV directly instead of using the prepared-dataset cache")
+    p.add_argument("--sync-checkpoint", action="store_true",
+                   help="Write checkpoints synchronously inside the epoch loop")
+
+
+def _apply_train_overrides(cfg, args):
+    """
+    Apply CLI overrides to a merged config.
+
+    Apply command line overrides on top of a configuration dict.
+    """
+    if args.hidden_dim is not None:
+        cfg["hidden_dim"] = args.hidden_dim
+    if args.num_layers is not None:
+        cfg["num_layers"] = args.num_layers
+    if args.activation is not None:
+        cfg["activation_function"] = args.activation
+    if args.features is not None:
+        cfg["features"] = args.features or None
+    if args.lr is not None:
+        cfg["learning_rate"] = args.lr
+        cfg["lbfgs_learning_rate"] = args.lr
+    if args.optimizer is not None:
+        cfg["optimizer"] = args.optimizer
+    if args.eval_every is not None:
+        cfg["eval_every"] = args.eval_every
+    if args.eval_subsample is not None:
+        cfg["eval_subsample"] = args.eval_subsample
+    if args.full_batch:
+        cfg["full_batch"] = True
+    if args.compile:
+        cfg["compile"] = True
+    if args.precision is not None:
+        cfg["train_precision"] = args.precision
+    if args.weight is not None:
+        cfg["weight"] = args.weight
+    if args.epochs is not None:
+        cfg["epochs"] = args.epochs
+    if args.patience is not None:
+        cfg["patience"] = args.patience
+    if args.batch_size is not None:
+        cfg["batch_size"] = args.batch_size
+    if args.num_threads is not None:
+        cfg["num_threads"] = args.num_threads
+    if args.keep_best is not None:
+        cfg["keep_best"] = args.keep_best
+    if args.sync_checkpoint:
+        cfg["async_checkpoint"] = False
+    if args.split is not None:
+        cfg["split"] = args.split
+    if args.holdout_region is not None:
+        cfg["holdout_region"] = tuple(float(v) for v in args.holdout_region.split(","))
+    if args.no_data_cache:
+        cfg["data_cache"] = False
+    if args.no_standardize:
+        cfg["standardize"] = False
+    if args.curriculum is not None:
+        cfg["curriculum"] = tuple(int(s) for s in args.curriculum.split(",") if s.strip()) or None
+    if args.curriculum_epochs is not None:
+        cfg["curriculum_epochs"] = args.curriculum_epochs
+    if args.target_rmse is not None:
+        cfg["target_energy_rmse"] = args.target_rmse
+    if args.streaming:
+        cfg["streaming"] = True
+    if args.chunk_size is not None:
+        cfg["chunk_size"] = args.chunk_size
+    return cfg
+
+
 def cli():
     """
     Parse arguments and dispatch subcommands.
@@ -31,21 +154,55 @@ def cli():
     # train command
     p_train = subparsers.add_parser("train", help="Train model")
     p_train.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
-    p_train.add_argument("--data", default=None, help="Training data CSV path, default reads from config")
     p_train.add_argument("--out", default=None, help="Output directory (default uses config name)")
-    p_train.add_argument("--epochs", type=int, default=None)
-    p_train.add_argument("--patience", type=int, default=None)
-    p_train.add_argument("--lr", type=float, default=None)
-    p_train.add_argument("--weight", type=float, default=None)
-    p_train.add_argument("--hidden-dim", type=int, default=None)
-    p_train.add_argument("--num-layers", type=int, default=None)
-    p_train.add_argument("--activation", type=str, default=None)
+    p_train.add_argument("--resume", action="store_true",
+                         help="Continue from <out>/<model>.state.pth (optimizer, scheduler, early-stop and RNG state)")
+    p_train.add_argument("--distributed", action="store_true",
+                         help="Data-parallel training on CPU (gloo); launch with torchrun --nproc_per_node N")
+    _add_train_arguments(p_train)
+
+    # train-all command
+    p_all = subparsers.add_parser("train-all", help="Train several configs concurrently in a process pool")
+    p_all.add_argument("--configs", default=None,
+                       help="Comma-separated config names (default: all registered configs)")
+    p_all.add_argument("--out", default="runs", help="Root output directory (one subdirectory per config)")
+    p_all.add_argument("--workers", type=int, default=None,
+                       help="Concurrent runs (default: one per config); cores are split evenly between them")
+    _add_train_arguments(p_all)
+
+    # train-ensemble command
+    p_ens = subparsers.add_parser("train-ensemble", help="Train K seeds of one architecture in a single vmapped pass")
+    p_ens.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
+    p_ens.add_argument("--out", default=None, help="Output directory (default: <config>-ensemble)")
+    p_ens.add_argument("--members", type=int, default=8, help="Ensemble size K")
+    p_ens.add_argument("--seed", type=int, default=0, help="Seed of member 0 (member i uses seed + i)")
+    _add_train_arguments(p_ens)
+
+    # cv command
+    p_cv = subparsers.add_parser("cv", help="k-fold cross-validation with the folds trained concurrently")
+    p_cv.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
+    p_cv.add_argument("--folds", type=int, default=5, help="Number of folds k")
+    p_cv.add_argument("--method", choices=["block", "random"], default="block",
+                      help="block = whole spatial blocks per fold, random = shuffled rows")
+    p_cv.add_argument("--out", default=None, help="Output directory (default: <config>-cv)")
+    p_cv.add_argument("--workers", type=int, default=None, help="Concurrent folds (default: one per fold)")
+    _add_train_arguments(p_cv)
+
+    # benchmark-curriculum command
+    p_cur = subparsers.add_parser("benchmark-curriculum",
+                                  help="Time-to-target-error of curriculum vs single-stage training")
+    p_cur.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
+    p_cur.add_argument("--out", default=None, help="Output directory (default: <config>-curriculum)")
+    p_cur.add_argument("--seed", type=int, default=0, help="Seed shared by both runs")
+    _add_train_arguments(p_cur)
 
     # visualize command
     p_vis = subparsers.add_parser("visualize", help="Load trained model and visualize")
     p_vis.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
     p_vis.add_argument("--data", required=True, help="Data CSV path")
     p_vis.add_argument("--model-dir", required=True, help="Model directory (contains saved weights)")
+    p_vis.add_argument("--precision", choices=PRECISIONS, default=None, help="Inference precision")
+    p_vis.add_argument("--features", default=None, help="Input feature spec of a legacy (bare state dict) checkpoint; self-describing checkpoints store their own")
 
     # simulate command
     p_sim = subparsers.add_parser("simulate", help="Run molecular dynamics simulation")
@@ -59,6 +216,70 @@ def cli():
     p_sim.add_argument("--v1", type=float, default=-20000)
     p_sim.add_argument("--v2", type=float, default=0.0)
     p_sim.add_argument("--v3", type=float, default=0.0)
+    p_sim.add_argument("--precision", choices=PRECISIONS, default=None, help="MD force-evaluation precision")
+    p_sim.add_argument("--features", default=None, help="Input feature spec of a legacy (bare state dict) checkpoint; self-describing checkpoints store their own")
+    p_sim.add_argument("--table", default=None, help="Run on a tabulated surrogate (see tabulate) instead of the model")
+    p_sim.add_argument("--compile", action="store_true", help="torch.compile the model's energy/force path before the run")
+
+    # export-numpy command
+    p_npz = subparsers.add_parser("export-numpy", help="Export a trained model to .npz for torch-free NumPy inference")
+    p_npz.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
+    p_npz.add_argument("--model-dir", required=True, help="Model directory (contains saved weights)")
+    p_npz.add_argument("--out", default=None, help="Output path (default: <model-dir>/<model>.npz)")
+    p_npz.add_argument("--data", default=None, help="Check NumPy against torch on this dataset")
+    p_npz.add_argument("--features", default=None, help="Input feature spec of a legacy (bare state dict) checkpoint; self-describing checkpoints store their own")
+
+    # tabulate command
+    p_tab = subparsers.add_parser("tabulate", help="Tabulate a trained model for fast bicubic-spline MD forces")
+    p_tab.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
+    p_tab.add_argument("--model-dir", required=True, help="Model directory (contains saved weights)")
+    p_tab.add_argument("--out", default=None, help="Output path (default: <model-dir>/<model>.table.npz)")
+    p_tab.add_argument("--spacing", type=float, default=None, help="Grid spacing (Å)")
+    p_tab.add_argument("--x-range", default=None, help="r12 range 'min,max' (Å)")
+    p_tab.add_argument("--y-range", default=None, help="r23 range 'min,max' (Å)")
+    p_tab.add_argument("--features", default=None, help="Input feature spec of a legacy (bare state dict) checkpoint; self-describing checkpoints store their own")
+
+    # benchmark-precision command
+    p_bench = subparsers.add_parser("benchmark-precision",
+                                    help="Throughput/accuracy of float32, float64 and bf16 for one model")
+    p_bench.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
+    p_bench.add_argument("--data", default=None, help="Data CSV path, default reads from config")
+    p_bench.add_argument("--model-dir", default=None, help="Model directory (random weights if omitted)")
+    p_bench.add_argument("--out", default="precision_benchmark.csv", help="Output CSV path")
+
+    # convert-data command
+    p_conv = subparsers.add_parser("convert-data",
+                                   help="Convert CSV datasets to the memory-mapped binary format")
+    p_conv.add_argument("inputs", nargs="+", help="input_force*.csv / *_gaussian_energy.csv files")
+    p_conv.add_argument("--out", default=None, help="Output path (single input only; default: <input>.pesbin)")
+    p_conv.add_argument("--dtype", choices=["float32", "float64"], default="float64", help="Stored value type")
+
+    # merge-data command
+    p_merge = subparsers.add_parser("merge-data", help="Merge QC reader outputs into one deduplicated dataset")
+    p_merge.add_argument("inputs", nargs="+",
+                         help="path[,source=gaussian|cp2k|qe|legacy|dataset][,level=NAME][,energy_unit=U][,force_unit=U]"
+                              " in priority order")
+    p_merge.add_argument("--out", default="merged_dataset.csv", help="Output CSV path")
+    p_merge.add_argument("--tol", type=float, default=1e-6, help="Coordinate tolerance (Å) for near-duplicates")
+
+    # filter-data command
+    p_filt = subparsers.add_parser("filter-data", help="Flag outliers and write kept/removed datasets")
+    p_filt.add_argument("--data", default=None, help="Dataset path, default reads from config")
+    p_filt.add_argument("--config", default=DEFAULT_CONFIG_NAME, choices=list_config_names())
+    p_filt.add_argument("--kept", default=None,
+                        help="Kept rows CSV (default: <data>_filtered.csv, never overwritten unless given here)")
+    p_filt.add_argument("--removed", default=None,
+                        help="Removed rows CSV with reasons (default: <data>_removed.csv, never overwritten unless given here)")
+    p_filt.add_argument("--failed", default=None, help="CSV of failed QC points (x, y), e.g. *_gaussian_errors.csv")
+    p_filt.add_argument("--force-atol", type=float, default=0.05,
+                        help="Absolute tolerance of the force / finite-difference check (Hartree/Bohr)")
+    p_filt.add_argument("--force-rtol", type=float, default=0.2, help="Relative tolerance of the same check")
+    p_filt.add_argument("--curvature-z", type=float, default=6.0, help="Robust z-score of a curvature spike")
+    p_filt.add_argument("--jump-atol", type=float, default=0.05,
+                        help="Energy-step mismatch (Hartree) that marks a jump to another electronic state")
+    p_filt.add_argument("--model-dir", default=None, help="Also flag large residuals of this trained model")
+    p_filt.add_argument("--residual-z", type=float, default=6.0, help="Robust z-score of a model residual")
+    p_filt.add_argument("--features", default=None, help="Input feature spec of a legacy (bare state dict) checkpoint; self-describing checkpoints store their own")
 
     # list-configs command
     subparsers.add_parser("list-configs", help="List available configuration names")
@@ -74,94 +295,82 @@ def cli():
         # Train model: supports overriding default hyperparameters via command line.
         if torch.cuda.is_available():
             torch.cuda.init()
-        cfg = get_config(args.config)
-        # allow overrides
-        if args.hidden_dim is not None:
-            cfg["hidden_dim"] = args.hidden_dim
-        if args.num_layers is not None:
-            cfg["num_layers"] = args.num_layers
-        if args.activation is not None:
-            cfg["activation_function"] = args.activation
-        if args.lr is not None:
-            cfg["learning_rate"] = args.lr
-        if args.weight is not None:
-            cfg["weight"] = args.weight
-        if args.epochs is not None:
-            cfg["epochs"] = args.epochs
-        if args.patience is not None:
-            cfg["patience"] = args.patience
+        cfg = _apply_train_overrides(get_config(args.config), args)
 
         train_data_path = args.data or cfg['train_data_path']
         out_dir = args.out or args.config
-        ensure_dir(out_dir)
-        save_model_path = f"{out_dir}/{cfg['save_model_path']}"
-        savepath = f"{out_dir}/{cfg['saveaxpath']}"
-        savepath2 = f"{out_dir}/{cfg['saveaxpath2']}"
-        saverocpath = f"{out_dir}/{cfg['assesspath']}"
-
-        # Data
-        # Data loading
-        train_loader, data = load_data(train_data_path)
-
-        # Model
-        # Build model
-        model = NeuralNetwork(
-            cfg['input_dim'], cfg['hidden_dim'], cfg['num_layers'], cfg['output_dim'], cfg['activation_function']
-        )
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        model = model.to(device)
-
-        # Optimization
-        # Optimizer and learning rate scheduler
-        criterion = CustomLoss()
-        optimizer = torch.optim.Adam(model.parameters(), lr=cfg['learning_rate'])
-        scheduler = ReduceLROnPlateau(
-            optimizer, cfg['scheduler_mode'], patience=cfg['scheduler_patience'], factor=cfg['scheduler_factor']
-        )
+        if args.distributed:
+            dist_ctx = init_distributed()
+            try:
+                run_training(args.config, cfg, train_data_path, out_dir, dist_ctx=dist_ctx, resume=args.resume)
+            finally:
+                cleanup_distributed()
+        else:
+            run_training(args.config, cfg, train_data_path, out_dir, resume=args.resume)
+        return
 
-        # train
-        train(
-            model,
-            train_loader,
-            criterion,
-            optimizer,
-            scheduler,
-            save_model_path,
-            data,
-            cfg['weight'],
-            args.config,
-            epochs=cfg['epochs'],
-            patience=cfg['patience'],
-            min_delta=cfg['min_delta'],
-        )
+    if args.command == "train-all":
+        # Train several configs at once; each worker is pinned to its own cores.
+        names = args.configs.split(",") if args.configs else list_config_names()
+        unknown = [n for n in names if n not in list_config_names()]
+        if unknown:
+            raise ValueError(f"Unknown config(s): {', '.join(unknown)}")
+        configs = {name: _apply_train_overrides(get_config(name), args) for name in names}
+        summary = train_many(configs, args.out, train_data_path=args.data, workers=args.workers)
+        print(summary.to_string(index=False))
+        return
 
-        # Evaluation & Visualization
-        # Evaluation and visualization
-        model = load_model(model, save_model_path)
-        visualize_model(model, data, savepath, savepath2, saverocpath)
-        r2 = accuracy(model, data)
-        print(f"R2: {r2:.6f}")
-        # write to a CSV summary
-        # Write results summary
-        pd.DataFrame([[args.config, r2]], columns=["config", "r2"]).to_csv(f"{out_dir}/summary.csv", index=False)
+    if args.command == "cv":
+        # Per-fold held-out errors and their spread.
+        cfg = _apply_train_overrides(get_config(args.config), args)
+        summary = cross_validate(args.config, cfg, args.out or f"{args.config}-cv", folds=args.folds,
+                                 method=args.method, train_data_path=args.data, workers=args.workers)
+        columns = ["fold"] + [c for c in summary.columns if c.startswith("test_")]
+        print(summary[columns].to_string(index=False))
+        return
+
+    if args.command == "benchmark-curriculum":
+        # Same seed and settings, with and without the coarse-to-fine stages.
+        cfg = _apply_train_overrides(get_config(args.config), args)
+        cfg["curriculum"] = cfg["curriculum"] or (4, 2)
+        if cfg["target_energy_rmse"] is None:
+            raise ValueError("benchmark-curriculum needs --target-rmse")
+        summary = compare_curriculum(args.config, cfg, args.out or f"{args.config}-curriculum",
+                                     train_data_path=args.data, seed=args.seed)
+        print(summary.to_string(index=False))
+        return
+
+    if args.command == "train-ensemble":
+        # Train K members at once; writes member_<i>.pth and ensemble.json.
+        cfg = _apply_train_overrides(get_config(args.config), args)
+        out_dir = args.out or f"{args.config}-ensemble"
+        train_loader, data = load_data(
+            args.data or cfg['train_data_path'], batch_size=cfg['batch_size'],
+            dtype=resolve_dtype(cfg['train_precision']), cache=cfg['data_cache']
+        )
+        manifest = train_ensemble(cfg, train_loader, data, out_dir, members=args.members, seed=args.seed,
+                                  trainname=args.config)
+        print(pd.DataFrame(manifest["members"]).to_string(index=False))
         return
 
     if args.command == "visualize":
         # Load a trained model and generate plots.
         # Load trained model and generate plots.
         cfg = get_config(args.config)
+        if args.precision is not None:
+            cfg["inference_precision"] = args.precision
+        if args.features is not None:
+            cfg["features"] = args.features
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        model = NeuralNetwork(
-            cfg['input_dim'], cfg['hidden_dim'], cfg['num_layers'], cfg['output_dim'], cfg['activation_function']
-        ).to(device)
         model_path = f"{args.model_dir}/{cfg['save_model_path']}"
-        model = load_model(model, model_path)
-        _, data = load_data(args.data)
+        model = get_model(model_path, cfg, device=device, dtype=resolve_dtype(cfg['inference_precision']))
+        _, data = load_data(args.data, cache=cfg['data_cache'])
         savepath = f"{args.model_dir}/{cfg['saveaxpath']}"
         savepath2 = f"{args.model_dir}/{cfg['saveaxpath2']}"
         saverocpath = f"{args.model_dir}/{cfg['assesspath']}"
-        visualize_model(model, data, savepath, savepath2, saverocpath)
-        r2 = accuracy(model, data)
+        with autocast(cfg['inference_precision'], device):
+            visualize_model(model, data, savepath, savepath2, saverocpath)
+            r2 = accuracy(model, data)
         print(f"R2: {r2:.6f}")
         return
 
@@ -179,9 +388,117 @@ def cli():
             init_v1=args.v1,
             init_v2=args.v2,
             init_v3=args.v3,
+            precision=args.precision,
+            features=args.features,
+            potential=PESTable.from_npz(args.table) if args.table else None,
+            compile=args.compile,
         )
         return
 
+    if args.command == "tabulate":
+        # Energies and gradients on a dense grid once; MD then interpolates them.
+        cfg = get_config(args.config)
+        if args.features is not None:
+            cfg["features"] = args.features
+        for key, value in (("table_x_range", args.x_range), ("table_y_range", args.y_range)):
+            if value is not None:
+                cfg[key] = tuple(float(v) for v in value.split(","))
+        if args.spacing is not None:
+            cfg["table_spacing"] = args.spacing
+        model_path = f"{args.model_dir}/{cfg['save_model_path']}"
+        model = get_model(model_path, cfg, dtype=torch.float64)
+
+        def energy_and_gradients(coords):
+            energy, gradients = model.energy_and_gradients(torch.from_numpy(coords))
+            return energy.numpy(), gradients.numpy()
+
+        table = tabulate(energy_and_gradients, cfg["table_x_range"], cfg["table_y_range"], cfg["table_spacing"])
+        out_path = table.save(args.out or model_path.rsplit(".", 1)[0] + ".table.npz")
+        errors = table.errors
+        print(f"{model_path} -> {out_path} ({table.energy.shape[1]} x {table.energy.shape[0]} points)")
+        print(f"energy error max {errors['energy_max_error']:.3e} / rms {errors['energy_rms_error']:.3e} Ha, "
+              f"force error max {errors['force_max_error']:.3e} / rms {errors['force_rms_error']:.3e} Ha/Bohr")
+        return
+
+    if args.command == "export-numpy":
+        # Flat weights + activation for numpy_pes.NumpyPES, optionally checked against torch.
+        cfg = get_config(args.config)
+        if args.features is not None:
+            cfg["features"] = args.features
+        model_path = f"{args.model_dir}/{cfg['save_model_path']}"
+        model = get_model(model_path, cfg)
+        out_path = export_npz(model, args.out or model_path.rsplit(".", 1)[0] + ".npz")
+        print(f"{model_path} -> {out_path}")
+        if args.data:
+            X = read_dataset(args.data)[['x', 'y']].to_numpy(dtype=np.float64)
+            energy, forces = NumpyPES.from_npz(out_path, dtype=np.float64).energy_and_forces(X)
+            ref_energy, ref_forces = get_model(model_path, cfg, dtype=torch.float64).energy_and_forces(torch.from_numpy(X))
+            print(f"max |dE| {np.abs(energy - ref_energy.numpy()).max():.3e} Ha, "
+                  f"max |dF| {np.abs(forces - ref_forces.numpy()).max():.3e} Ha/Bohr over {len(X)} points")
+        return
+
+    if args.command == "convert-data":
+        # Write each CSV as a binary dataset; every --data option accepts the result.
+        if args.out and len(args.inputs) > 1:
+            raise ValueError("--out can only be used with a single input file")
+        for csv_path in args.inputs:
+            out_path = convert_csv_to_binary(csv_path, args.out, dtype=args.dtype)
+            header = read_binary_header(out_path)
+            print(f"{csv_path} -> {out_path} ({header['rows']} rows, {args.dtype})")
+        return
+
+    if args.command == "merge-data":
+        # One dataset in Hartree / Hartree/Bohr with source, level and force-mask columns.
+        merged, report = merge_sources(args.inputs, tol=args.tol)
+        merged.to_csv(args.out, index=False)
+        print(f"{report['rows']} rows ({report['with_forces']} with forces) -> {args.out}; "
+              f"dropped {report['exact_duplicates']} exact and {report['tolerance_duplicates']} near duplicates")
+        print(pd.Series(report["per_source"], name="rows").to_string())
+        return
+
+    if args.command == "filter-data":
+        # Deterministic kept/removed split with a reason code per removed row.
+        cfg = get_config(args.config)
+        data_path = args.data or cfg['train_data_path']
+        if args.features is not None:
+            cfg["features"] = args.features
+        stem = data_path.rsplit(".", 1)[0]
+        kept_path = args.kept or f"{stem}_filtered.csv"
+        removed_path = args.removed or f"{stem}_removed.csv"
+        for path, given in ((kept_path, args.kept), (removed_path, args.removed)):
+            # A default name may be a tracked, hand-made split (e.g. input_force_filtered.csv)
+            if not given and os.path.exists(path):
+                raise FileExistsError(f"{path} exists; pass --kept/--removed explicitly to overwrite it")
+        data = read_dataset(data_path)
+        model = None
+        if args.model_dir:
+            model = get_model(f"{args.model_dir}/{cfg['save_model_path']}", cfg, dtype=torch.float64)
+        failed = pd.read_csv(args.failed) if args.failed else None
+        kept, removed = filter_dataset(
+            data, force_atol=args.force_atol, force_rtol=args.force_rtol, curvature_z=args.curvature_z,
+            failed_points=failed, model=model, residual_z=args.residual_z, jump_atol=args.jump_atol,
+        )
+        kept.to_csv(kept_path, index=False)
+        removed.to_csv(removed_path, index=False)
+        print(f"kept {len(kept)} -> {kept_path}, removed {len(removed)} -> {removed_path}")
+        if len(removed):
+            print(removed["reason"].str.split(";").explode().value_counts().to_string())
+        return
+
+    if args.command == "benchmark-precision":
+        # Compare throughput and rounding error of each precision on one set of weights.
+        cfg = get_config(args.config)
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if args.model_dir:
+            model = get_model(f"{args.model_dir}/{cfg['save_model_path']}", cfg, device=device)
+        else:
+            model = build_model(cfg).to(device)
+        _, data = load_data(args.data or cfg['train_data_path'], cache=cfg['data_cache'])
+        results = benchmark_precision(model, data, device)
+        print(results.to_string(index=False))
+        results.to_csv(args.out, index=False)
+        return
+
 
 if __name__ == '__main__':
     cli()
@@ -7,6 +7,150 @@ Neural network model definition: Multi-layer perceptron supporting safe activati
 import torch
 import torch.nn as nn
 
+from numpy_pes import LEGACY_FORCE_SCALE
+
+FEATURE_KINDS = ("raw", "morse", "inverse", "poly")
+# Config keys forwarded to FeatureTransform by build_model
+FEATURE_OPTIONS = ("morse_scales", "inverse_powers", "poly_degree")
+# Target standardization buffers and their identity values (checkpoints without them load as identity)
+STANDARDIZATION_BUFFERS = {"energy_mean": 0.0, "energy_scale": 1.0, "force_scale": 1.0}
+
+
+def forces_from_gradients(gradients, scale=LEGACY_FORCE_SCALE):
+    """
+    Map PES gradients dE/d(r12, r23) to atomic forces.
+
+    Map gradients with respect to the two bond lengths (Hartree/Å) to the
+    Cartesian forces in the column order of the targets z2..z4, i.e.
+    (F2, F3, F1), times `scale`. The default `LEGACY_FORCE_SCALE` (divide by
+    0.529) reproduces the legacy training convention that the models were
+    fitted with. It is not an Å -> Bohr conversion and does not match the
+    units of the QC force columns; ``numpy_pes.QC_FORCE_SCALE`` (times
+    0.529177) does.
+
+    Args:
+        gradients (Tensor): shape (N, 2) / Gradients with respect to (x, y)
+        scale (float): unit factor, `LEGACY_FORCE_SCALE` or ``numpy_pes.QC_FORCE_SCALE``
+    """
+    gradients = gradients * scale
+    F1 = -gradients[:, 0]
+    F2 = gradients[:, 0] - gradients[:, 1]
+    F3 = gradients[:, 1]
+    return torch.stack((F2, F3, F1), dim=1)
+
+
+def _mish(z, module):
+    t = torch.tanh(nn.functional.softplus(z))
+    return z * t, t + z * torch.sigmoid(z) * (1 - t * t)
+
+
+def _gelu(z, module):
+    cdf = 0.5 * (1 + torch.erf(z * 0.7071067811865476))
+    pdf = torch.exp(-0.5 * z * z) * 0.3989422804014327
+    return z * cdf, cdf + z * pdf
+
+
+def _elu(z, module):
+    negative = module.alpha * torch.expm1(z)
+    return torch.where(z > 0, z, negative), torch.where(z > 0, torch.ones_like(z), negative + module.alpha)
+
+
+def _leaky_relu(z, module):
+    slope = torch.where(z > 0, torch.ones_like(z), torch.full_like(z, module.negative_slope))
+    return z * slope, slope
+
+
+def _relu(z, module):
+    slope = (z > 0).to(z.dtype)
+    return z * slope, slope
+
+
+# (act(z), act'(z)) in one pass, for the analytic backward of NeuralNetwork.energy_and_forces
+ACTIVATION_DERIVATIVES = {
+    "Mish": _mish,
+    "ReLU": _relu,
+    "LeakyReLU": _leaky_relu,
+    "ELU": _elu,
+    "GELU": _gelu,
+}
+
+
+def parse_features(spec):
+    """
+    Feature kinds of a spec such as "morse+inverse" (None or "" = no transform).
+    """
+    if not spec:
+        return ()
+    kinds = tuple(k.strip() for k in spec.split("+") if k.strip())
+    unknown = [k for k in kinds if k not in FEATURE_KINDS]
+    if unknown:
+        raise ValueError(f"Unknown input feature '{unknown[0]}' (choose from {', '.join(FEATURE_KINDS)})")
+    return kinds
+
+
+class FeatureTransform(nn.Module):
+    """
+    Fixed per-coordinate features of the bond lengths, applied before the first Linear layer.
+
+    Kinds: "raw" (r), "morse" (exp(-r/a) for each scale a), "inverse" (r^-p for
+    each power p) and "poly" (r^k, k = 1..degree). Every feature depends on a
+    single coordinate, so the Jacobian is one derivative per feature plus a
+    fixed (features, coordinates) `selector`; see ``NeuralNetwork.head`` for the
+    cached-feature training path.
+    """
+
+    def __init__(self, spec, input_dim=2, morse_scales=(0.5, 1.0, 2.0), inverse_powers=(1, 2), poly_degree=3):
+        """
+        Args:
+            spec (str): "+"-joined feature kinds, e.g. "morse+inverse"
+            input_dim (int): number of coordinates
+            morse_scales (tuple): length scales a (Å) of the Morse-like features
+            inverse_powers (tuple): powers p of the inverse-distance features
+            poly_degree (int): highest power of the polynomial features
+        """
+        super().__init__()
+        self.kinds = parse_features(spec)
+        if not self.kinds:
+            raise ValueError("FeatureTransform needs at least one feature kind")
+        self.spec = "+".join(self.kinds)
+        self.register_buffer("morse_scales", torch.tensor(morse_scales, dtype=torch.float32))
+        self.register_buffer("inverse_powers", torch.tensor(inverse_powers, dtype=torch.float32))
+        self.register_buffer("poly_powers", torch.arange(1, int(poly_degree) + 1, dtype=torch.float32))
+        widths = {"raw": 1, "morse": len(morse_scales), "inverse": len(inverse_powers), "poly": int(poly_degree)}
+        coordinate = torch.cat([torch.arange(input_dim).repeat_interleave(widths[k]) for k in self.kinds])
+        self.register_buffer("selector", nn.functional.one_hot(coordinate, input_dim).float())
+        self.out_dim = len(coordinate)
+
+    def _blocks(self, r):
+        """
+        (values, d values / dr) of every kind, each of shape (N, input_dim, width).
+        """
+        u = r.unsqueeze(-1)
+        for kind in self.kinds:
+            if kind == "raw":
+                yield u, torch.ones_like(u)
+            elif kind == "morse":
+                e = torch.exp(-u / self.morse_scales)
+                yield e, -e / self.morse_scales
+            elif kind == "inverse":
+                v = u ** -self.inverse_powers
+                yield v, -self.inverse_powers * v / u
+            else:
+                yield u ** self.poly_powers, self.poly_powers * u ** (self.poly_powers - 1)
+
+    def forward(self, r):
+        return torch.cat([v.flatten(1) for v, _ in self._blocks(r)], dim=1)
+
+    def features_and_derivatives(self, r):
+        """
+        Features (N, F) and their derivatives d phi_f / d r_coord(f) (N, F).
+
+        The full Jacobian d phi / d r is ``derivatives[:, :, None] * selector``.
+        """
+        values, derivatives = zip(*self._blocks(r))
+        return torch.cat([v.flatten(1) for v in values], dim=1), torch.cat([d.flatten(1) for d in derivatives], dim=1)
+
+
 class NeuralNetwork(nn.Module):
     def __init__(
         self,
@@ -16,6 +160,8 @@ class NeuralNetwork(nn.Module):
         output_dim,
         activation_name,
         dropout_ratio: float = 0.0,
+        features=None,
+        feature_options=None,
     ):
         """
         Initialize a feed-forward network.
@@ -29,6 +175,10 @@ class NeuralNetwork(nn.Module):
             output_dim (int): output dimension / Output dimensions
             activation_name (str): activation name in torch.nn / Activation function name (in torch.nn)
             dropout_ratio (float): optional dropout rate / Optional dropout ratio
+            features (str | None): input feature spec such as "morse+inverse"
+                (see ``FeatureTransform``); None feeds the raw bond lengths
+            feature_options (dict | None): FeatureTransform keyword arguments
+                (morse_scales, inverse_powers, poly_degree)
         """
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         super(NeuralNetwork, self).__init__()
@@ -38,6 +188,12 @@ class NeuralNetwork(nn.Module):
 
         self.layers = nn.ModuleList()  # create a list of modules to store all the hidden layers.
 
+        # Optional fixed feature stage; autograd through it folds its Jacobian into the forces.
+        self.features = None
+        if features:
+            self.features = FeatureTransform(features, input_dim, **(feature_options or {}))
+            input_dim = self.features.out_dim
+
         # Add the first hidden layer that accepts the input dimensions.
         first_layer = nn.Linear(input_dim, hidden_dim)
         self.layers.append(first_layer)
@@ -52,6 +208,7 @@ class NeuralNetwork(nn.Module):
         if not hasattr(nn, activation_name):
             raise ValueError(f"Unknown activation function: {activation_name}")
         self.activation = getattr(nn, activation_name)()
+        self.activation_name = activation_name
 
         # Optionally add a Dropout layer, which is enabled only if `dropout_ratio` is greater than 0.
         if dropout_ratio > 0:
@@ -63,19 +220,182 @@ class NeuralNetwork(nn.Module):
         self.output_layer = nn.Linear(hidden_dim, output_dim)
         #nn.init.kaiming_uniform_(self.output_layer.weight, nonlinearity='leaky_relu')
 
+        # Target standardization, saved with the weights; identity until fit_standardization.
+        for name, value in STANDARDIZATION_BUFFERS.items():
+            self.register_buffer(name, torch.tensor(value))
+
     def forward(self, x):
         """
         Forward pass through stacked layers and output head.
 
         Forward pass: sequentially through stacked hidden layers and output layer.
         """
+        if self.features is not None:
+            x = self.features(x)
+        return self.head(x)
+
+    def head(self, x):
+        """
+        The MLP after the feature stage, in physical units.
+
+        The network predicts standardized energies; they are mapped back with
+        the stored mean and scale, so every caller gets Hartree. Training with
+        cached features (see ``train.batch_loss``) calls this on precomputed
+        features and applies the chain rule itself.
+        """
         # Pass through each layer to perform operations
         for layer in self.layers:
-            x = layer(x).to(x.device)
+            x = layer(x)
             x = self.activation(x)
-            if self.dropout:
+            if self.dropout is not None:
                 x = self.dropout(x)
 
         # Pass the output layer
         x = self.output_layer(x)
-        return x
+        return x * self.energy_scale + self.energy_mean
+
+    @property
+    def arch(self):
+        """
+        Architecture as ``build_model`` config keys; stored in checkpoints (see ``checkpoint.pes_checkpoint``).
+        """
+        arch = {
+            "input_dim": self.layers[0].in_features if self.features is None else self.features.selector.shape[1],
+            "hidden_dim": self.layers[0].out_features,
+            "num_layers": len(self.layers),
+            "output_dim": self.output_layer.out_features,
+            "activation_function": self.activation_name,
+            "features": self.features.spec if self.features is not None else None,
+        }
+        if self.features is not None:
+            arch["morse_scales"] = tuple(self.features.morse_scales.tolist())
+            arch["inverse_powers"] = tuple(self.features.inverse_powers.tolist())
+            arch["poly_degree"] = len(self.features.poly_powers)
+        return arch
+
+    @property
+    def analytic_forces(self):
+        """
+        Whether energy_and_forces can use the analytic backward pass.
+
+        Needs a known activation derivative (``ACTIVATION_DERIVATIVES``; the
+        tanh approximation of GELU is not covered) and no dropout.
+        """
+        if self.dropout is not None or self.activation_name not in ACTIVATION_DERIVATIVES:
+            return False
+        return getattr(self.activation, "approximate", "none") == "none"
+
+    def _head_energy_and_gradient(self, x):
+        """
+        Energies and dE/dx of the MLP, with the backward pass written out.
+
+        The input gradient of Linear -> activation -> ... -> Linear is
+        W_out diag(act'(z_L)) W_L ... diag(act'(z_1)) W_1, evaluated right to
+        left as batched matrix products: one forward and one backward sweep,
+        no autograd graph.
+        """
+        activation = ACTIVATION_DERIVATIVES[self.activation_name]
+        slopes = []
+        for layer in self.layers:
+            x, slope = activation(layer(x), self.activation)
+            slopes.append(slope)
+        energy = self.output_layer(x)[:, 0] * self.energy_scale + self.energy_mean
+        gradient = self.output_layer.weight[0] * self.energy_scale
+        for layer, slope in zip(reversed(self.layers), reversed(slopes)):
+            gradient = (gradient * slope) @ layer.weight
+        return energy, gradient
+
+    def energy_and_gradients(self, coords=None, create_graph=False, features=None):
+        """
+        Energies (N,) and gradients dE/d(r12, r23) (N, 2) in one batched call.
+
+        Uses the analytic backward pass when `analytic_forces` allows it and a
+        single autograd call otherwise; the feature Jacobian is applied by the
+        chain rule.
+
+        Args:
+            coords (Tensor): (N, 2) bond lengths (r12, r23)
+            create_graph (bool): keep the results differentiable with respect to
+                the weights (training, where the force loss trains the network);
+                otherwise nothing is recorded and the results are detached
+            features (tuple | None): precomputed (phi, dphi) from
+                ``FeatureTransform.features_and_derivatives``, used instead of `coords`
+        """
+        analytic = self.analytic_forces
+        if coords is not None:
+            # Gradients are taken with respect to the weights only, never into the caller's batch
+            coords = coords.detach()
+        with torch.set_grad_enabled(create_graph or not analytic):
+            if features is None and self.features is not None:
+                features = self.features.features_and_derivatives(coords)
+            x = coords if features is None else features[0]
+            if analytic:
+                energy, gradient = self._head_energy_and_gradient(x)
+            else:
+                x = x.detach().requires_grad_(True)
+                energy = self.head(x)[:, 0]
+                (gradient,) = torch.autograd.grad(energy.sum(), x, create_graph=create_graph)
+            if features is not None:
+                gradient = (gradient * features[1]) @ self.features.selector.to(gradient.dtype)
+        if not create_graph:
+            energy, gradient = energy.detach(), gradient.detach()
+        return energy, gradient
+
+    def energy_and_forces(self, coords=None, create_graph=False, features=None):
+        """
+        Energies (N,) in Hartree and atomic forces (N, 3) in z2..z4 order, in one batched call.
+
+        The single entry point for forces: training, evaluation, MD and plotting
+        all go through it. See `energy_and_gradients` for the arguments and
+        ``forces_from_gradients`` for the force convention.
+        """
+        energy, gradients = self.energy_and_gradients(coords, create_graph=create_graph, features=features)
+        return energy, forces_from_gradients(gradients)
+
+    def fit_standardization(self, targets):
+        """
+        Set the target standardization from training targets.
+
+        The energy mean and standard deviation and one force scale (the RMS of
+        all present force components, so force directions are kept) are stored
+        as buffers and saved with the weights.
+
+        Args:
+            targets: (N, 4) array or tensor of z1 (energy) and z2..z4 (forces)
+        """
+        if isinstance(targets, torch.Tensor):
+            targets = targets.detach().to("cpu", torch.float64)
+        else:
+            targets = torch.tensor(targets, dtype=torch.float64)
+        energy = targets[:, 0]
+        forces = targets[:, 1:4][torch.isfinite(targets[:, 1:4])]
+        energy_scale = float(energy.std()) if len(energy) > 1 else 0.0
+        force_scale = float(forces.pow(2).mean().sqrt()) if forces.numel() else 0.0
+        self.energy_mean.fill_(float(energy.mean()))
+        # A constant energy (or no forces at all) keeps the unit scale
+        self.energy_scale.fill_(energy_scale or 1.0)
+        self.force_scale.fill_(force_scale or 1.0)
+        return self
+
+    def standardize(self, energy, forces):
+        """
+        Energies and forces in the standardized units the loss is computed in.
+        """
+        return (energy - self.energy_mean) / self.energy_scale, forces / self.force_scale
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Checkpoints written before standardization existed load as unstandardized models
+        for name, value in STANDARDIZATION_BUFFERS.items():
+            state_dict.setdefault(prefix + name, torch.tensor(value))
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+
+def build_model(cfg, dropout_ratio: float = 0.0):
+    """
+    NeuralNetwork described by a merged config (architecture and input features).
+    """
+    return NeuralNetwork(
+        cfg['input_dim'], cfg['hidden_dim'], cfg['num_layers'], cfg['output_dim'], cfg['activation_function'],
+        dropout_ratio=dropout_ratio, features=cfg.get('features'),
+        feature_options={key: cfg[key] for key in FEATURE_OPTIONS if key in cfg},
+    )
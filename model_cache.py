@@ -0,0 +1,170 @@
+"""
+Process-wide model cache.
+
+LRU cache of inference-ready models: `get_model` returns the eval()
+NeuralNetwork of a checkpoint and only reads the file (``checkpoint.load_pes``)
+when it is new or has changed on disk, so the GUI, the CLI commands and MD
+drivers pay the load cost once per process.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+import torch
+
+from config import get_config, DEFAULT_CONFIG_NAME
+from model import FEATURE_OPTIONS
+from checkpoint import load_pes
+
+# Batch sizes run by the warm-up: one point (MD steps) and a batch (plots, evaluation)
+WARMUP_ROWS = (1, 256)
+# Methods replaced by their torch.compile'd versions (the energy/force path and the plain forward)
+COMPILED_METHODS = ("forward", "_head_energy_and_gradient")
+
+
+def model_nbytes(model):
+    """
+    Bytes held by a model's parameters and buffers.
+    """
+    return sum(t.numel() * t.element_size() for t in chain(model.parameters(), model.buffers()))
+
+
+def _warm_up(model):
+    """
+    Run energies and forces once per `WARMUP_ROWS` batch size (allocations, lazy init, compilation).
+    """
+    param = next(model.parameters())
+    for rows in WARMUP_ROWS:
+        coords = torch.linspace(0.8, 3.0, 2 * rows, dtype=param.dtype, device=param.device).reshape(rows, 2)
+        model.energy_and_forces(coords)
+        with torch.no_grad():
+            model(coords)
+
+
+def _compile(model):
+    """
+    torch.compile the inference path in place; falls back to the eager model if compilation fails.
+
+    Returns whether the model is compiled. Compilation is lazy, so the warm-up
+    is where an unsupported platform shows up.
+    """
+    try:
+        for name in COMPILED_METHODS:
+            setattr(model, name, torch.compile(getattr(model, name), dynamic=True))
+        _warm_up(model)
+        return True
+    except Exception as exc:  # torch.compile missing or unsupported platform
+        logging.warning(f"torch.compile unavailable, using the eager model: {exc}")
+        for name in COMPILED_METHODS:
+            model.__dict__.pop(name, None)
+        return False
+
+
+class ModelCache:
+    """
+    LRU cache of eval() models keyed by checkpoint file identity and load options.
+
+    A file is identified by (absolute path, mtime, size), so a checkpoint
+    rewritten by training is reloaded and its stale entries are dropped.
+    Entries are evicted least recently used first when there are more than
+    `max_models` or their weights exceed `max_bytes`; the newest entry is
+    always kept.
+
+    Cached models are shared: callers must not train, move or cast them (ask
+    for the device and dtype instead), and ``copy.deepcopy`` one to modify it.
+    """
+
+    def __init__(self, max_models: int = 8, max_bytes: int = 512 * 2 ** 20):
+        """
+        Args:
+            max_models (int): maximum number of cached models
+            max_bytes (int): maximum total bytes of cached weights and buffers
+        """
+        self.max_models = int(max_models)
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return sum(nbytes for _, nbytes in self._entries.values())
+
+    @staticmethod
+    def _key(path, cfg, device, dtype, compile):
+        stat = os.stat(path)
+        # cfg only shapes bare state-dict checkpoints, but is part of the key so they stay correct
+        legacy = None if cfg is None else tuple(
+            repr(cfg.get(k)) for k in ("activation_function", "features", *FEATURE_OPTIONS))
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, str(device), str(dtype), bool(compile), legacy)
+
+    def get(self, path, cfg=None, device=None, dtype=None, warmup=False, compile=False):
+        """
+        eval() model of the checkpoint at `path`, loaded on a miss.
+
+        Args:
+            path (str): checkpoint path
+            cfg (dict | None): config for bare state-dict checkpoints (see ``load_pes``)
+            device: target device (default CPU)
+            dtype: target dtype (default: as stored)
+            warmup (bool): run a few forward/force passes before returning a new model
+            compile (bool): torch.compile the energy/force path (implies warmup)
+        """
+        device = torch.device(device or "cpu")
+        key = self._key(path, cfg, device, dtype, compile)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key][0]
+            self.stats["misses"] += 1
+            # Older versions of the file can never be hit again
+            for stale in [k for k in self._entries if k[0] == key[0] and k[1:3] != key[1:3]]:
+                del self._entries[stale]
+            model = load_pes(path, cfg, device=device, dtype=dtype)
+            if compile:
+                _compile(model)
+            elif warmup:
+                _warm_up(model)
+            self._entries[key] = (model, model_nbytes(model))
+            self._evict()
+            return model
+
+    def _evict(self):
+        while len(self._entries) > 1 and (len(self._entries) > self.max_models or self.nbytes > self.max_bytes):
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        """
+        Drop every cached model.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+
+
+def model_cache():
+    """
+    The process-wide cache, sized by the default config (model_cache_size, model_cache_mb).
+    """
+    global _cache
+    if _cache is None:
+        cfg = get_config(DEFAULT_CONFIG_NAME)
+        _cache = ModelCache(cfg["model_cache_size"], int(cfg["model_cache_mb"] * 2 ** 20))
+    return _cache
+
+
+def get_model(path, cfg=None, device=None, dtype=None, warmup=False, compile=False):
+    """
+    eval() model of a checkpoint from the process-wide cache; see `ModelCache.get`.
+    """
+    return model_cache().get(path, cfg, device=device, dtype=dtype, warmup=warmup, compile=compile)
@@ -5,41 +5,23 @@ Molecular dynamics simulation based on trained potential energy surface (PES).
 """
 
 import os
-import re
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import torch
-import torch.nn as nn
-from model import NeuralNetwork
 from config import get_config
 from utils import ensure_dir
+from precision import resolve_dtype
+from checkpoint import is_history_checkpoint
+from model_cache import get_model
 
-# ---------- Helpers for picking correct arch & weights ----------
-ACTIVATIONS = {"Mish", "ReLU", "LeakyReLU", "ELU", "GELU"}
-STEM_REGEX = re.compile(r"^(\d+)-(\d+)-([A-Za-z]+)$")
-TS_SUFFIX = re.compile(r"-\d{8}-\d{6}$")  # -YYYYMMDD-HHMMSS
-
-def _parse_stem_to_arch(stem_no_ts: str):
-    """
-    stem format: "<num_layers>-<hidden_dim>-<activation>"
-    """
-    m = STEM_REGEX.match(stem_no_ts)
-    if not m:
-        return None
-    num_layers = int(m.group(1))
-    hidden_dim = int(m.group(2))
-    act = m.group(3)
-    if act not in ACTIVATIONS:
-        return None
-    return {"num_layers": num_layers, "hidden_dim": hidden_dim, "activation_function": act}
-
+# ---------- Helpers for picking weights ----------
 def _latest_pth_in_dir(dirpath: str):
     try:
         pths = [
             os.path.join(dirpath, f)
             for f in os.listdir(dirpath)
-            if f.endswith(".pth") and os.path.isfile(os.path.join(dirpath, f))
+            if f.endswith(".pth") and not is_history_checkpoint(f) and os.path.isfile(os.path.join(dirpath, f))
         ]
         if not pths:
             return None
@@ -61,48 +43,56 @@ def run_simulation(
     init_v1: float = -20000,
     init_v2: float = 0.0,
     init_v3: float = 0.0,
+    precision: str = None,
+    features: str = None,
+    potential=None,
+    model_path: str = None,
+    compile: bool = False,
 ):
     """
     Run an MD trajectory using gradients from the neural PES.
 
     Use neural network potential energy gradients to advance MD trajectory.
+    Forces are evaluated in cfg['md_precision'] (float64 by default) unless
+    `precision` overrides it. The model is rebuilt from its checkpoint
+    through the process-wide model cache (``model_cache.get_model``), so repeated
+    trajectories load it once: `model_path`, else cfg['save_model_path'] or the
+    newest .pth in `model_dir`; `compile` torch.compiles its force path.
+    `features` only matters for legacy bare state-dict checkpoints, whose
+    activation comes from the directory name (see ``checkpoint.load_pes``); the
+    forces are taken through the feature stage, so its Jacobian is included.
+
+    `potential` replaces the model: any object with
+    ``energy_and_forces(coords) -> (energies, forces)`` on (N, 2) arrays, such as
+    ``pes_table.PESTable`` or ``numpy_pes.NumpyPES``. Outputs still go to `model_dir`.
     """
-    # 1) Read base config and override structure based on directory name (parse after removing timestamp suffix)
+    # 1) Read base config (the architecture comes from the checkpoint)
     cfg = get_config(config_name)
     ensure_dir(model_dir)
 
-    dir_base = os.path.basename(os.path.normpath(model_dir))
-    stem_no_ts = TS_SUFFIX.sub("", dir_base)        # Remove -YYYYMMDD-HHMMSS
-    arch = _parse_stem_to_arch(stem_no_ts)
-    if arch:
-        cfg["num_layers"] = arch["num_layers"]
-        cfg["hidden_dim"] = arch["hidden_dim"]
-        cfg["activation_function"] = arch["activation_function"]
-
-    input_dim = cfg["input_dim"]
-    output_dim = cfg["output_dim"]
-    hidden_dim = cfg["hidden_dim"]
-    num_layers = cfg["num_layers"]
-    activation_name = cfg["activation_function"]
-
-    # 2) Select weights to load: prioritize cfg['save_model_path'], otherwise latest .pth in directory
-    preferred_path = os.path.join(model_dir, cfg.get("save_model_path", "model.pth"))
-    if os.path.exists(preferred_path):
-        model_path = preferred_path
-    else:
-        cand = _latest_pth_in_dir(model_dir)
-        if cand is None:
-            raise FileNotFoundError(f"No .pth file found under {model_dir}")
-        model_path = cand
-
-    # 3) Build model and load matching weights
+    if features is not None:
+        cfg["features"] = features
+    dtype = resolve_dtype(precision or cfg["md_precision"])
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = NeuralNetwork(input_dim, hidden_dim, num_layers, output_dim, activation_name).to(device)
 
-    # Use map_location to be compatible with CPU/GPU scenarios
-    state = torch.load(model_path, map_location=device)
-    model.load_state_dict(state)
-    model.eval()
+    if potential is None:
+        # 2) Select weights to load: prioritize cfg['save_model_path'], otherwise latest .pth in directory
+        preferred_path = os.path.join(model_dir, cfg.get("save_model_path", "model.pth"))
+        if model_path is None and os.path.exists(preferred_path):
+            model_path = preferred_path
+        elif model_path is None:
+            model_path = _latest_pth_in_dir(model_dir)
+            if model_path is None:
+                raise FileNotFoundError(f"No .pth file found under {model_dir}")
+
+        # 3) Rebuild the model from the checkpoint (cached across runs)
+        model = get_model(model_path, cfg, device=device, dtype=dtype, compile=compile)
+
+        def energy_and_forces(coords):
+            energy, forces = model.energy_and_forces(torch.as_tensor(coords, dtype=dtype, device=device))
+            return energy.cpu().numpy(), forces.cpu().numpy()
+    else:
+        energy_and_forces = potential.energy_and_forces
 
     # ---------- Physical constants and initial conditions ----------
     F = 4.3597e-8
@@ -123,34 +113,26 @@ def run_simulation(
         coordinates_list.append([x1, x2, x3])
         rlist.append([r12, r23])
 
-        # Enable grad for input, use neural potential gradients as forces
-        input_tensor = torch.tensor([[r12, r23]], dtype=torch.float32, requires_grad=True, device=device)
-        output = model(input_tensor)                   # [1, 1] or [1], depending on your network output implementation
-        potential_list.append(float(output.detach().cpu().item()))
+        # Energy and forces of the potential in one call
+        energies, forces = energy_and_forces([[r12, r23]])
+        output = energies[0]
+        potential_list.append(float(output))
 
         # If trajectory goes beyond training domain, end early
         if r12 < 0 or r12 > 4.0 or r23 < 0 or r23 > 3.99:
             print("break")
             break
 
-        # Total energy (note output is tensor, convert to float for storage below)
+        # Total energy
         E = (
             output * 8.314
             + 0.5 * m1 * m * abs(v1 ** 2) * 10e19 / 1.609
             + 0.5 * m2 * m * abs(v2 ** 2) * 10e19 / 1.609
             + 0.5 * m3 * m * abs(v3 ** 2) * 10e19 / 1.609
         )
-        Elist.append(float(E.detach().cpu().item()))
-
-        # Calculate forces (gradient of potential with respect to r)
-        model.zero_grad(set_to_none=True)
-        if input_tensor.grad is not None:
-            input_tensor.grad.zero_()
-        output.backward()
-        predictions = input_tensor.grad / 0.529
-        F1 = -predictions[0][0]
-        F2 = predictions[0][0] - predictions[0][1]
-        F3 = predictions[0][1]
+        Elist.append(float(E))
+
+        F2, F3, F1 = forces[0]
 
         # Velocity-position update (simple explicit integration, consistent with original version)
         x1 = float(x1 + v1 * dt * 1e10)
@@ -184,15 +166,8 @@ def run_simulation(
     r12_values = np.linspace(0.5, 4.0, 100)
     r23_values = np.linspace(0.5, 4.0, 100)
     R12, R23 = np.meshgrid(r12_values, r23_values)
-    Potential = np.zeros_like(R12, dtype=np.float32)
-
-    # No gradient needed when evaluating potential, no_grad speeds up
-    with torch.no_grad():
-        for i in range(R12.shape[0]):
-            for j in range(R12.shape[1]):
-                input_tensor = torch.tensor([[R12[i, j], R23[i, j]]], dtype=torch.float32, device=device)
-                out = model(input_tensor)
-                Potential[i, j] = float(out.detach().cpu().item())
+    # One batched call for the whole contour grid
+    Potential = energy_and_forces(np.column_stack([R12.ravel(), R23.ravel()]))[0].reshape(R12.shape).astype(np.float32)
 
     rlist1 = np.array(rlist)
     plt.figure(figsize=(12, 9))
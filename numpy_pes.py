@@ -0,0 +1,229 @@
+"""
+Torch-free PES inference.
+
+NumPy inference engine: `export_npz` writes a trained NeuralNetwork (weights,
+activation, input features and target standardization) to a flat .npz, and
+`NumpyPES` evaluates energies and analytic forces from it with NumPy alone, so
+MD and prediction workers start without importing torch.
+"""
+
+import numpy as np
+
+FORMAT_VERSION = 1
+NUMPY_ACTIVATIONS = ("Mish", "ReLU", "LeakyReLU", "ELU", "GELU")
+# dE/d(r12, r23) -> (F2, F3, F1), before the unit scale of `forces_from_gradients`
+FORCE_MATRIX = np.array([[1.0, 0.0, -1.0], [-1.0, 1.0, 0.0]])
+# Force scale of the legacy training convention (divide by 0.529); the model,
+# NumpyPES, PESTable and MD all use it. It is NOT the unit of the QC force columns.
+LEGACY_FORCE_SCALE = 1 / 0.529
+# Force scale of the QC force columns: dE/dr in Hartree/Å times the Bohr radius
+# in Å is Hartree/Bohr. About 3.6x LEGACY_FORCE_SCALE.
+QC_FORCE_SCALE = 0.529177
+
+
+def _mish(z, params):
+    # tanh(softplus(z)) = n / (n + 2) with n = e^z (e^z + 2): one exp instead of log, tanh and sigmoid
+    e = np.exp(np.minimum(z, 20))
+    n = e * (e + 2)
+    t = n / (n + 2)
+    return z * t, t + z * (e / (1 + e)) * (1 - t * t)
+
+
+def _relu(z, params):
+    slope = (z > 0).astype(z.dtype)
+    return z * slope, slope
+
+
+def _leaky_relu(z, params):
+    slope = np.where(z > 0, 1, params["negative_slope"]).astype(z.dtype)
+    return z * slope, slope
+
+
+def _elu(z, params):
+    negative = params["alpha"] * np.expm1(np.minimum(z, 0))
+    return np.where(z > 0, z, negative), np.where(z > 0, 1, negative + params["alpha"]).astype(z.dtype)
+
+
+def _gelu(z, params):
+    if params["approximate"] == "tanh":
+        c = 0.7978845608028654  # sqrt(2/pi)
+        t = np.tanh(c * (z + 0.044715 * z ** 3))
+        return 0.5 * z * (1 + t), 0.5 * (1 + t) + 0.5 * z * (1 - t * t) * c * (1 + 3 * 0.044715 * z * z)
+    try:
+        from scipy.special import erf
+    except ImportError as exc:
+        raise ImportError("Exact GELU in NumPy needs scipy (pip install scipy)") from exc
+    cdf = 0.5 * (1 + erf(z * 0.7071067811865476))
+    return z * cdf, cdf + z * np.exp(-0.5 * z * z) * 0.3989422804014327
+
+
+# (act(z), act'(z)) in one pass; mirrors model.ACTIVATION_DERIVATIVES
+ACTIVATIONS = {"Mish": _mish, "ReLU": _relu, "LeakyReLU": _leaky_relu, "ELU": _elu, "GELU": _gelu}
+
+
+def forces_from_gradients(gradients, scale=LEGACY_FORCE_SCALE):
+    """
+    NumPy counterpart of ``model.forces_from_gradients``: (..., 2) dE/d(r12, r23) -> (..., 3) forces (F2, F3, F1).
+
+    `scale` is `LEGACY_FORCE_SCALE` for model forces and `QC_FORCE_SCALE` for
+    forces comparable to the QC data.
+    """
+    return (gradients @ FORCE_MATRIX.astype(gradients.dtype, copy=False)) * scale
+
+
+def gradients_from_forces(forces, scale=LEGACY_FORCE_SCALE):
+    """
+    Inverse of `forces_from_gradients`: (..., 3) forces -> (..., 2) dE/d(r12, r23).
+
+    Least squares over the three components, exact for forces that sum to zero.
+    """
+    return (forces / scale) @ np.linalg.pinv(FORCE_MATRIX).astype(forces.dtype, copy=False)
+
+
+def export_npz(model, path):
+    """
+    Write a trained NeuralNetwork to a flat .npz for `NumpyPES`.
+
+    Stores the hidden/output Linear weights in the model's dtype, the activation
+    name and parameters, the input feature spec and buffers, and the target
+    standardization. Dropout is an inference no-op and is not stored.
+
+    Args:
+        model (NeuralNetwork): trained model (any device)
+        path (str): output .npz path
+
+    Returns:
+        str: `path`
+    """
+    name = type(model.activation).__name__
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Activation '{name}' has no NumPy implementation (choose from {', '.join(NUMPY_ACTIVATIONS)})")
+
+    def array(tensor):
+        return tensor.detach().cpu().numpy()
+
+    arrays = {
+        "format_version": np.array(FORMAT_VERSION),
+        "num_layers": np.array(len(model.layers)),
+        "activation": np.array(name),
+        "negative_slope": np.array(float(getattr(model.activation, "negative_slope", 0.01))),
+        "alpha": np.array(float(getattr(model.activation, "alpha", 1.0))),
+        "approximate": np.array(str(getattr(model.activation, "approximate", "none"))),
+        "output_weight": array(model.output_layer.weight),
+        "output_bias": array(model.output_layer.bias),
+        "energy_mean": np.array(float(model.energy_mean)),
+        "energy_scale": np.array(float(model.energy_scale)),
+        "features": np.array(model.features.spec if model.features is not None else ""),
+    }
+    for k, layer in enumerate(model.layers):
+        arrays[f"weight_{k}"] = array(layer.weight)
+        arrays[f"bias_{k}"] = array(layer.bias)
+    if model.features is not None:
+        for key in ("morse_scales", "inverse_powers", "poly_powers", "selector"):
+            arrays[key] = array(getattr(model.features, key))
+    np.savez(path, **arrays)
+    return path
+
+
+class NumpyPES:
+    """
+    Energies and analytic forces of an exported NeuralNetwork, in NumPy.
+
+    Same interface as ``NeuralNetwork.energy_and_forces`` on arrays: a forward
+    sweep that keeps each activation's derivative, then the input gradient
+    W_out diag(act') W_L ... W_1 as batched matmuls.
+    """
+
+    def __init__(self, arrays, dtype=None):
+        """
+        Args:
+            arrays (Mapping): contents of an `export_npz` file
+            dtype: evaluation dtype (default: the stored weight dtype)
+        """
+        version = int(arrays["format_version"])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported NumPy PES format version {version} (expected {FORMAT_VERSION})")
+        self.dtype = np.dtype(dtype or arrays["output_weight"].dtype)
+        cast = lambda key: np.asarray(arrays[key], dtype=self.dtype)
+        n = int(arrays["num_layers"])
+        self.weights = [cast(f"weight_{k}") for k in range(n)]
+        self.biases = [cast(f"bias_{k}") for k in range(n)]
+        self.output_weight = cast("output_weight")[0]
+        self.output_bias = cast("output_bias")[0]
+        self.energy_mean = float(arrays["energy_mean"])
+        self.energy_scale = float(arrays["energy_scale"])
+        self.activation_name = str(arrays["activation"])
+        self.activation = ACTIVATIONS[self.activation_name]
+        self.params = {"negative_slope": float(arrays["negative_slope"]), "alpha": float(arrays["alpha"]),
+                       "approximate": str(arrays["approximate"])}
+        self.kinds = tuple(k for k in str(arrays["features"]).split("+") if k)
+        if self.kinds:
+            self.morse_scales = cast("morse_scales")
+            self.inverse_powers = cast("inverse_powers")
+            self.poly_powers = cast("poly_powers")
+            self.selector = cast("selector")
+
+    @classmethod
+    def from_npz(cls, path, dtype=None):
+        """
+        Load an `export_npz` file.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(arrays, dtype=dtype)
+
+    def _features(self, r):
+        """
+        Features (N, F) and d phi_f / d r_coord(f) (N, F); see ``model.FeatureTransform``.
+        """
+        u = r[:, :, None]
+        values, derivatives = [], []
+        for kind in self.kinds:
+            if kind == "raw":
+                v, d = u, np.ones_like(u)
+            elif kind == "morse":
+                v = np.exp(-u / self.morse_scales)
+                d = -v / self.morse_scales
+            elif kind == "inverse":
+                v = u ** -self.inverse_powers
+                d = -self.inverse_powers * v / u
+            else:
+                v = u ** self.poly_powers
+                d = self.poly_powers * u ** (self.poly_powers - 1)
+            values.append(v.reshape(len(r), -1))
+            derivatives.append(d.reshape(len(r), -1))
+        return np.concatenate(values, axis=1), np.concatenate(derivatives, axis=1)
+
+    def energy_and_gradients(self, coords):
+        """
+        Energies (N,) and gradients dE/d(r12, r23) (N, 2).
+
+        Args:
+            coords (array-like): (N, 2) bond lengths (r12, r23) in Å
+        """
+        x = np.asarray(coords, dtype=self.dtype).reshape(-1, 2)
+        if self.kinds:
+            x, dphi = self._features(x)
+        slopes = []
+        for weight, bias in zip(self.weights, self.biases):
+            x, slope = self.activation(x @ weight.T + bias, self.params)
+            slopes.append(slope)
+        energy = (x @ self.output_weight + self.output_bias) * self.energy_scale + self.energy_mean
+        gradient = self.output_weight * self.energy_scale
+        for weight, slope in zip(reversed(self.weights), reversed(slopes)):
+            gradient = (gradient * slope) @ weight
+        if self.kinds:
+            gradient = (gradient * dphi) @ self.selector
+        return energy, gradient
+
+    def energy(self, coords):
+        """
+        Energies (N,) in Hartree.
+        """
+        return self.energy_and_gradients(coords)[0]
+
+    def energy_and_forces(self, coords):
+        """
+        Energies (N,) in Hartree and atomic forces (N, 3) in z2..z4 order.
+        """
+        energy, gradients = self.energy_and_gradients(coords)
+        return energy, forces_from_gradients(gradients)
@@ -0,0 +1,233 @@
+"""
+Regular-grid PES dataset.
+
+Regular-grid view of a PES dataset: the QC generators scan (r12, r23) on an
+evenly spaced grid, so energies and forces are stored as 2-D arrays with a mask
+for failed points. This gives O(1) lookup, bicubic interpolation, plotting
+without triangulation and vectorized finite-difference force checks.
+"""
+
+import numpy as np
+
+from data_loader import read_dataset
+from numpy_pes import QC_FORCE_SCALE, forces_from_gradients
+
+FORCE_COLUMNS = ["z2", "z3", "z4"]
+# Slack, in grid cells, for queries on the outer grid lines
+EDGE_TOLERANCE = 1e-9
+
+
+def _keys_weights(t, a=-0.5):
+    """
+    Bicubic-convolution (Keys) weights of the 4 neighbours at offsets -1, 0, 1, 2.
+
+    Args:
+        t (np.ndarray): fractional position in [0, 1) within the cell
+        a (float): kernel parameter; -0.5 gives third-order accuracy (quadratics are exact)
+    """
+    s = np.stack([1 + t, t, 1 - t, 2 - t], axis=-1)
+    near = ((a + 2) * s - (a + 3)) * s * s + 1
+    far = ((a * s - 5 * a) * s + 8 * a) * s - 4 * a
+    return np.where(s <= 1, near, far)
+
+
+class PESGrid:
+    """
+    PES samples on a regular (r12, r23) grid.
+
+    Arrays are indexed ``[j, i]`` for the point ``(x[i], y[j])``, which is the
+    layout matplotlib's contour/surface functions expect, so plotting needs no
+    reshape. Points missing from the dataset (failed QC jobs) are NaN and
+    ``mask`` is False there.
+    """
+
+    def __init__(self, x, y, energy, forces, rows):
+        """
+        Args:
+            x (np.ndarray): (nx,) evenly spaced r12 values (Å)
+            y (np.ndarray): (ny,) evenly spaced r23 values (Å)
+            energy (np.ndarray): (ny, nx) energies (Hartree), NaN where missing
+            forces (np.ndarray): (3, ny, nx) forces in z2..z4 order, NaN where missing
+            rows (np.ndarray): (ny, nx) row of each point in the source table, -1 where missing
+        """
+        self.x = x
+        self.y = y
+        self.energy = energy
+        self.forces = forces
+        self.rows = rows
+        self.mask = rows >= 0
+        self.dx = float(x[1] - x[0]) if len(x) > 1 else 1.0
+        self.dy = float(y[1] - y[0]) if len(y) > 1 else 1.0
+
+    @staticmethod
+    def _axis(values, tol):
+        """
+        Sorted grid axis covering `values`, or ValueError if they are not evenly spaced.
+
+        Gaps (a whole missing row or column) are allowed; every coordinate must
+        sit on a multiple of the smallest spacing.
+        """
+        unique = np.unique(np.round(values / tol) * tol)
+        if len(unique) < 2:
+            return unique
+        step = np.diff(unique).min()
+        steps = (unique - unique[0]) / step
+        if not np.allclose(steps, np.round(steps), atol=tol / step):
+            raise ValueError("Coordinates do not lie on a regular grid")
+        return unique[0] + step * np.arange(int(round(steps[-1])) + 1)
+
+    @classmethod
+    def from_frame(cls, data, tol=1e-6):
+        """
+        Build a grid from a frame with columns x, y, z1 and optionally z2..z4.
+
+        Raises ValueError if the coordinates are not on a regular grid or if a
+        grid point appears twice.
+        """
+        xs = data['x'].to_numpy(dtype=np.float64)
+        ys = data['y'].to_numpy(dtype=np.float64)
+        x = cls._axis(xs, tol)
+        y = cls._axis(ys, tol)
+        i = np.round((xs - x[0]) / (x[1] - x[0] if len(x) > 1 else 1.0)).astype(np.int64)
+        j = np.round((ys - y[0]) / (y[1] - y[0] if len(y) > 1 else 1.0)).astype(np.int64)
+
+        rows = np.full((len(y), len(x)), -1, dtype=np.int64)
+        flat = j * len(x) + i
+        if len(np.unique(flat)) != len(flat):
+            raise ValueError("Duplicate grid points; deduplicate the dataset first")
+        rows[j, i] = np.arange(len(data))
+
+        energy = np.full(rows.shape, np.nan)
+        energy[j, i] = data['z1'].to_numpy(dtype=np.float64)
+        forces = np.full((3,) + rows.shape, np.nan)
+        if all(c in data.columns for c in FORCE_COLUMNS):
+            forces[:, j, i] = data[FORCE_COLUMNS].to_numpy(dtype=np.float64).T
+        return cls(x, y, energy, forces, rows)
+
+    @classmethod
+    def from_file(cls, file_path, cache=True, tol=1e-6):
+        """
+        Build a grid from a CSV or binary dataset (see data_loader.read_dataset).
+        """
+        return cls.from_frame(read_dataset(file_path, cache=cache), tol=tol)
+
+    @property
+    def shape(self):
+        return self.energy.shape
+
+    def index(self, x, y):
+        """
+        Grid indices (j, i) of the nearest points to (x, y), computed in O(1).
+
+        Points outside the grid get index -1.
+        """
+        i = np.round((np.asarray(x, dtype=np.float64) - self.x[0]) / self.dx).astype(np.int64)
+        j = np.round((np.asarray(y, dtype=np.float64) - self.y[0]) / self.dy).astype(np.int64)
+        inside = (i >= 0) & (i < len(self.x)) & (j >= 0) & (j < len(self.y))
+        return np.where(inside, j, -1), np.where(inside, i, -1)
+
+    def lookup(self, x, y):
+        """
+        Energies and forces stored at the grid points nearest to (x, y).
+
+        Returns (energy, forces) with shapes (...,) and (..., 3); NaN for points
+        outside the grid or missing from the dataset.
+        """
+        j, i = self.index(x, y)
+        inside = j >= 0
+        energy = np.where(inside, self.energy[j, i], np.nan)
+        forces = np.where(inside[..., None], np.moveaxis(self.forces[:, j, i], 0, -1), np.nan)
+        return energy, forces
+
+    def interpolate(self, x, y, values=None):
+        """
+        Bicubic (Keys convolution) interpolation at arbitrary (x, y).
+
+        Vectorized over any number of query points. Edge cells reuse the
+        boundary values; queries outside the grid, or whose 4x4 stencil touches
+        a missing point, return NaN.
+
+        Args:
+            x, y: query coordinates (arrays of equal shape)
+            values (np.ndarray | None): (ny, nx) field to interpolate; defaults to the energy
+        """
+        values = self.energy if values is None else values
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        u = (x.ravel() - self.x[0]) / self.dx
+        v = (y.ravel() - self.y[0]) / self.dy
+        outside = ((u < -EDGE_TOLERANCE) | (u > len(self.x) - 1 + EDGE_TOLERANCE)
+                   | (v < -EDGE_TOLERANCE) | (v > len(self.y) - 1 + EDGE_TOLERANCE))
+        i0 = np.clip(np.floor(u).astype(np.int64), 0, max(len(self.x) - 2, 0))
+        j0 = np.clip(np.floor(v).astype(np.int64), 0, max(len(self.y) - 2, 0))
+        wx = _keys_weights(u - i0)
+        wy = _keys_weights(v - j0)
+        offsets = np.arange(-1, 3)
+        ii = np.clip(i0[:, None] + offsets, 0, len(self.x) - 1)
+        jj = np.clip(j0[:, None] + offsets, 0, len(self.y) - 1)
+        stencil = values[jj[:, :, None], ii[:, None, :]]
+        result = np.einsum("nk,nkl,nl->n", wy, stencil, wx)
+        result[outside] = np.nan
+        return result.reshape(x.shape)
+
+    def finite_difference_forces(self):
+        """
+        Forces implied by the energy grid, in z2..z4 order.
+
+        Central differences of the energy give dE/d(r12, r23) (one-sided at
+        the edges), mapped with ``forces_from_gradients`` at `QC_FORCE_SCALE`,
+        the units of the stored forces, so the two are directly comparable.
+        Model forces use the legacy scale instead and are not. NaN propagates
+        to the neighbours of missing points.
+        """
+        dE_dy, dE_dx = np.gradient(self.energy, self.dy, self.dx)
+        gradients = np.stack([dE_dx, dE_dy], axis=-1)
+        return np.moveaxis(forces_from_gradients(gradients, scale=QC_FORCE_SCALE), -1, 0)
+
+    def force_residuals(self):
+        """
+        Stored forces minus finite-difference forces, shape (3, ny, nx).
+        """
+        return self.forces - self.finite_difference_forces()
+
+    def stride_rows(self, stride):
+        """
+        Source-table rows of the subgrid that keeps every `stride`-th point along both axes.
+
+        Missing points are skipped; stride 1 returns every row.
+        """
+        stride = int(stride)
+        keep = np.zeros(self.shape, dtype=bool)
+        keep[::stride, ::stride] = True
+        return np.sort(self.rows[keep & self.mask])
+
+    def to_grid(self, values):
+        """
+        Place a per-row array of the source table onto the grid (NaN where missing).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        grid = np.full(self.shape, np.nan)
+        grid[self.mask] = values[self.rows[self.mask]]
+        return grid
+
+    def meshgrid(self):
+        """
+        (X, Y) coordinate arrays matching the grid layout.
+        """
+        return np.meshgrid(self.x, self.y)
+
+    def plot_contour(self, ax, values=None, levels=14, filled=True, **kwargs):
+        """
+        Contour plot of a (ny, nx) field (default: energy) on a matplotlib axis.
+        """
+        values = self.energy if values is None else values
+        plot = ax.contourf if filled else ax.contour
+        return plot(self.x, self.y, np.ma.masked_invalid(values), levels, **kwargs)
+
+    def plot_surface(self, ax, values=None, **kwargs):
+        """
+        3-D surface of a (ny, nx) field (default: energy) on a 3-D matplotlib axis.
+        """
+        values = self.energy if values is None else values
+        X, Y = self.meshgrid()
+        return ax.plot_surface(X, Y, np.ma.masked_invalid(values), **kwargs)
@@ -0,0 +1,206 @@
+"""
+Tabulated PES surrogate.
+
+Tabulated surrogate of a trained PES: the model's energies and gradients are
+evaluated once on a dense regular (r12, r23) grid, and energies and forces are
+then served by vectorized bicubic Hermite interpolation. The interpolant is C1
+and its forces are the exact derivatives of its energy, so MD with the table
+conserves energy like MD with the model, at a fraction of the cost per step.
+"""
+
+import math
+
+import numpy as np
+
+from numpy_pes import forces_from_gradients
+
+FORMAT_VERSION = 1
+# Inverse of the bicubic Hermite basis: coefficients = HERMITE @ F @ HERMITE.T
+HERMITE = np.array([[1.0, 0.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0], [-3.0, 3.0, -2.0, -1.0], [2.0, -2.0, 1.0, 1.0]])
+ERROR_KEYS = ("energy_max_error", "energy_rms_error", "force_max_error", "force_rms_error")
+
+
+def _evaluate(energy_and_gradients, coords, chunk_size):
+    """
+    Energies (N,) and gradients (N, 2) of `coords` in chunks, as float64 arrays.
+    """
+    energies, gradients = [], []
+    for start in range(0, len(coords), chunk_size):
+        energy, gradient = energy_and_gradients(coords[start:start + chunk_size])
+        energies.append(np.asarray(energy, dtype=np.float64))
+        gradients.append(np.asarray(gradient, dtype=np.float64))
+    return np.concatenate(energies), np.concatenate(gradients)
+
+
+def tabulate(energy_and_gradients, x_range=(0.0, 4.0), y_range=(0.0, 3.99), spacing=0.01, chunk_size=65536):
+    """
+    Tabulate a PES on a regular grid and measure the interpolation error.
+
+    The energies and dE/d(r12, r23) are evaluated at every grid point; the
+    cross derivative d2E/dr12 dr23 is the central difference of the
+    gradients. The error bounds compare the table with the PES at every cell
+    centre, where the Hermite interpolation error is largest.
+
+    Args:
+        energy_and_gradients (callable): (N, 2) float64 array -> (energies (N,),
+            gradients (N, 2)), e.g. a wrapped ``NeuralNetwork.energy_and_gradients``
+            or ``numpy_pes.NumpyPES.energy_and_gradients``
+        x_range, y_range (tuple): (min, max) of r12 and r23 in Å
+        spacing (float): target grid spacing in Å (rounded so the ranges are covered exactly)
+        chunk_size (int): points per PES call
+
+    Returns:
+        PESTable
+    """
+    axes = [np.linspace(lo, hi, int(round((hi - lo) / spacing)) + 1) for lo, hi in (x_range, y_range)]
+    X, Y = np.meshgrid(*axes)
+    energy, gradient = _evaluate(energy_and_gradients, np.column_stack([X.ravel(), Y.ravel()]), chunk_size)
+    if not (np.isfinite(energy).all() and np.isfinite(gradient).all()):
+        raise ValueError("The PES is not finite on the whole table range; narrow x_range / y_range")
+    shape = X.shape
+    dE_dx, dE_dy = gradient[:, 0].reshape(shape), gradient[:, 1].reshape(shape)
+    cross = 0.5 * (np.gradient(dE_dx, axes[1], axis=0) + np.gradient(dE_dy, axes[0], axis=1))
+    table = PESTable(axes[0], axes[1], energy.reshape(shape), dE_dx, dE_dy, cross)
+
+    centres = [0.5 * (a[1:] + a[:-1]) for a in axes]
+    CX, CY = np.meshgrid(*centres)
+    check = np.column_stack([CX.ravel(), CY.ravel()])
+    ref_energy, ref_gradient = _evaluate(energy_and_gradients, check, chunk_size)
+    energy_err, force_err = table.energy_and_forces(check)
+    energy_err = energy_err - ref_energy
+    force_err = force_err - forces_from_gradients(ref_gradient)
+    table.errors = {
+        "energy_max_error": float(np.abs(energy_err).max()),
+        "energy_rms_error": float(np.sqrt(np.mean(energy_err ** 2))),
+        "force_max_error": float(np.abs(force_err).max()),
+        "force_rms_error": float(np.sqrt(np.mean(force_err ** 2))),
+    }
+    return table
+
+
+class PESTable:
+    """
+    Bicubic Hermite interpolant of tabulated energies and gradients.
+
+    Arrays are indexed ``[j, i]`` for the point ``(x[i], y[j])`` as in
+    ``pes_grid.PESGrid``. Same ``energy_and_forces`` interface as
+    ``numpy_pes.NumpyPES``, so it can replace the model in ``run_simulation``.
+    Queries outside the table use the polynomial of the nearest edge cell; only
+    the tabulated range (``bounds``) is covered by the error bounds.
+    """
+
+    def __init__(self, x, y, energy, dE_dx, dE_dy, cross, errors=None):
+        """
+        Args:
+            x (np.ndarray): (nx,) evenly spaced r12 values (Å)
+            y (np.ndarray): (ny,) evenly spaced r23 values (Å)
+            energy (np.ndarray): (ny, nx) energies (Hartree)
+            dE_dx, dE_dy (np.ndarray): (ny, nx) gradients (Hartree/Å)
+            cross (np.ndarray): (ny, nx) d2E/dx dy (Hartree/Å^2)
+            errors (dict | None): interpolation error bounds (see `tabulate`)
+        """
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.energy = energy
+        self.dE_dx = dE_dx
+        self.dE_dy = dE_dy
+        self.cross = cross
+        self.errors = errors or {}
+        self.dx = float(self.x[1] - self.x[0])
+        self.dy = float(self.y[1] - self.y[0])
+        self.bounds = ((float(self.x[0]), float(self.x[-1])), (float(self.y[0]), float(self.y[-1])))
+        self.coefficients = self._coefficients()
+
+    def _coefficients(self):
+        """
+        Polynomial coefficients a[k, l] of t^k s^l for every cell, shape (ny-1, nx-1, 4, 4).
+
+        t and s are the fractional positions along x and y; derivatives are
+        scaled to cell units.
+        """
+        def corners(values):
+            return np.stack([np.stack([values[:-1, :-1], values[1:, :-1]], -1),
+                             np.stack([values[:-1, 1:], values[1:, 1:]], -1)], -2)
+
+        f = corners(self.energy)
+        ft = corners(self.dE_dx * self.dx)
+        fs = corners(self.dE_dy * self.dy)
+        fts = corners(self.cross * self.dx * self.dy)
+        F = np.concatenate([np.concatenate([f, fs], -1), np.concatenate([ft, fts], -1)], -2)
+        return HERMITE @ F @ HERMITE.T
+
+    @classmethod
+    def from_npz(cls, path):
+        """
+        Load a table written by `save`.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            version = int(arrays["format_version"])
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported PES table format version {version} (expected {FORMAT_VERSION})")
+            errors = {key: float(arrays[key]) for key in ERROR_KEYS if key in arrays}
+            return cls(arrays["x"], arrays["y"], arrays["energy"], arrays["dE_dx"], arrays["dE_dy"],
+                       arrays["cross"], errors)
+
+    def save(self, path):
+        """
+        Write the table and its error bounds to a .npz.
+        """
+        np.savez(path, format_version=np.array(FORMAT_VERSION), x=self.x, y=self.y, energy=self.energy,
+                 dE_dx=self.dE_dx, dE_dy=self.dE_dy, cross=self.cross,
+                 **{key: np.array(value) for key, value in self.errors.items()})
+        return path
+
+    def energy_and_gradients(self, coords):
+        """
+        Interpolated energies (N,) and their exact gradients dE/d(r12, r23) (N, 2).
+
+        Args:
+            coords (array-like): (N, 2) bond lengths (r12, r23) in Å
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if len(coords) == 1:
+            energy, dE_dx, dE_dy = self._point(*coords[0].tolist())
+            return np.array([energy]), np.array([[dE_dx, dE_dy]])
+        u = (coords[:, 0] - self.x[0]) / self.dx
+        v = (coords[:, 1] - self.y[0]) / self.dy
+        i = np.minimum(np.maximum(np.floor(u).astype(np.int64), 0), len(self.x) - 2)
+        j = np.minimum(np.maximum(np.floor(v).astype(np.int64), 0), len(self.y) - 2)
+        t = u - i
+        s = (v - j)[:, None]
+        a = self.coefficients[j, i]
+        # Horner along s, then along t, for the energy and both derivatives
+        a_s = ((a[..., 3] * s + a[..., 2]) * s + a[..., 1]) * s + a[..., 0]
+        a_ds = (3 * a[..., 3] * s + 2 * a[..., 2]) * s + a[..., 1]
+        energy = ((a_s[:, 3] * t + a_s[:, 2]) * t + a_s[:, 1]) * t + a_s[:, 0]
+        dE_dx = ((3 * a_s[:, 3] * t + 2 * a_s[:, 2]) * t + a_s[:, 1]) / self.dx
+        dE_dy = (((a_ds[:, 3] * t + a_ds[:, 2]) * t + a_ds[:, 1]) * t + a_ds[:, 0]) / self.dy
+        return energy, np.stack([dE_dx, dE_dy], axis=1)
+
+    def _point(self, r12, r23):
+        """
+        (energy, dE/dr12, dE/dr23) of one point with Python floats.
+
+        MD asks for one point per step, where per-call NumPy overhead would
+        dominate the handful of multiply-adds.
+        """
+        u = (r12 - self.bounds[0][0]) / self.dx
+        v = (r23 - self.bounds[1][0]) / self.dy
+        i = min(max(math.floor(u), 0), len(self.x) - 2)
+        j = min(max(math.floor(v), 0), len(self.y) - 2)
+        t, s = u - i, v - j
+        a_s, a_ds = [], []
+        for a0, a1, a2, a3 in self.coefficients[j, i].tolist():
+            a_s.append(((a3 * s + a2) * s + a1) * s + a0)
+            a_ds.append((3 * a3 * s + 2 * a2) * s + a1)
+        energy = ((a_s[3] * t + a_s[2]) * t + a_s[1]) * t + a_s[0]
+        dE_dx = ((3 * a_s[3] * t + 2 * a_s[2]) * t + a_s[1]) / self.dx
+        dE_dy = (((a_ds[3] * t + a_ds[2]) * t + a_ds[1]) * t + a_ds[0]) / self.dy
+        return energy, dE_dx, dE_dy
+
+    def energy_and_forces(self, coords):
+        """
+        Interpolated energies (N,) in Hartree and atomic forces (N, 3) in z2..z4 order.
+        """
+        energy, gradients = self.energy_and_gradients(coords)
+        return energy, forces_from_gradients(gradients)
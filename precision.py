@@ -0,0 +1,106 @@
+"""
+Precision policy.
+
+Precision policy: map the precision names used in config ("float32", "float64",
+"bf16") to storage dtypes and autocast contexts, plus a small benchmark of the
+throughput/accuracy trade-off of each setting.
+"""
+
+import time
+from contextlib import nullcontext
+
+import torch
+
+PRECISIONS = ("float32", "float64", "bf16")
+
+
+def resolve_dtype(precision: str) -> torch.dtype:
+    """
+    Storage dtype of parameters and inputs for a precision name.
+
+    "bf16" keeps float32 storage and runs matmuls under bfloat16 autocast.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision} (expected one of {', '.join(PRECISIONS)})")
+    return torch.float64 if precision == "float64" else torch.float32
+
+
+def autocast(precision: str, device):
+    """
+    Autocast context for a precision name (no-op unless "bf16").
+    """
+    resolve_dtype(precision)  # validate the name
+    if precision == "bf16":
+        return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def model_dtype(model) -> torch.dtype:
+    """
+    dtype of a model's parameters (inputs are cast to it before the forward pass).
+    """
+    return next(model.parameters()).dtype
+
+
+def benchmark_precision(model, data, device, precisions=PRECISIONS, batch_size: int = 256, repeats: int = 20):
+    """
+    Throughput and accuracy of one set of weights under each precision.
+
+    Accuracy is measured against a float64 evaluation of the same weights, so it
+    isolates the rounding error of the precision itself (energies sit near -128 Ha
+    while the interesting features are mHa differences).
+
+    Returns:
+        pd.DataFrame with one row per precision: training steps/s, inference
+        samples/s, max |dE| and max |dF| versus float64.
+    """
+    import copy
+    import pandas as pd
+    from loss import CustomLoss
+    from train import batch_loss
+
+    X = torch.tensor(data[['x', 'y']].to_numpy(), dtype=torch.float64, device=device)
+    labels = torch.tensor(data[['z1', 'z2', 'z3', 'z4']].to_numpy(), dtype=torch.float64, device=device)
+    criterion = CustomLoss()
+
+    def energies_and_forces(m, inputs, precision):
+        with autocast(precision, device):
+            energy, forces = m.energy_and_forces(inputs)
+        return energy.double(), forces.double()
+
+    reference = copy.deepcopy(model).to(device=device, dtype=torch.float64).eval()
+    ref_energy, ref_forces = energies_and_forces(reference, X, "float64")
+
+    rows = []
+    for precision in precisions:
+        dtype = resolve_dtype(precision)
+        m = copy.deepcopy(model).to(device=device, dtype=dtype)
+        Xp, labels_p = X.to(dtype), labels.to(dtype)
+
+        m.eval()
+        energy, forces = energies_and_forces(m, Xp, precision)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            energies_and_forces(m, Xp, precision)
+        infer_rate = repeats * len(Xp) / (time.perf_counter() - start)
+
+        m.train()
+        optimizer = torch.optim.SGD(m.parameters(), lr=0.0)  # time the step, keep the weights
+        batch = (Xp[:batch_size], labels_p[:batch_size])
+        start = time.perf_counter()
+        for _ in range(repeats):
+            optimizer.zero_grad()
+            with autocast(precision, device):
+                loss, _ = batch_loss(m, *batch, criterion, 0.014)
+            loss.backward()
+            optimizer.step()
+        train_rate = repeats / (time.perf_counter() - start)
+
+        rows.append({
+            "precision": precision,
+            "train_steps_per_s": train_rate,
+            "infer_samples_per_s": infer_rate,
+            "max_abs_energy_err": (energy - ref_energy).abs().max().item(),
+            "max_abs_force_err": (forces - ref_forces).abs().max().item(),
+        })
+    return pd.DataFrame(rows)
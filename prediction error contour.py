@@ -1,10 +1,11 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 import torch
 from matplotlib import rcParams
-from model import NeuralNetwork
 from config import get_config
+from model_cache import get_model
+from data_loader import read_dataset
+from pes_grid import PESGrid
 
 # Set the global font and size
 rcParams['font.family'] = 'Arial'
@@ -18,27 +19,18 @@ rcParams['ytick.labelsize'] = 10
 path = "3-64"
 
 # read the data
-data = pd.read_csv("input_force.csv")
+data = read_dataset("input_force.csv", cache=True)
 
 # get config from config.py
 config = get_config(path)
 
-input_dim = config['input_dim']
-output_dim = config['output_dim']
-hidden_dim = config['hidden_dim']
-num_layers = config['num_layers']
-activation_function = "nn." + config['activation_function'] + "()"
-
-# Instantiate the network.
-model = NeuralNetwork(input_dim, hidden_dim, num_layers, output_dim, activation_function)
-
-# Load the model weights.
-model.load_state_dict(torch.load(path + "/" + path + ".pth"))
+# Rebuild the network from its checkpoint.
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+model = get_model(path + "/" + path + ".pth", config, device=device, dtype=torch.float32)
 
 # pretreatment of data
 X_real = data[['x', 'y']].values
 y_real = data['z1'].values
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 X_real_tensor = torch.tensor(X_real, dtype=torch.float32).to(device)
 
 # predict using model
@@ -60,7 +52,8 @@ print(f"Maximum deviation: {max_error:.4f}")
 
 # Draw the contour plot
 plt.figure(figsize=(10, 8))
-contour = plt.tricontourf(X_real[:, 0], X_real[:, 1], error, levels=14, cmap='RdBu')
+grid = PESGrid.from_frame(data)
+contour = grid.plot_contour(plt.gca(), grid.to_grid(error), levels=14, cmap='RdBu')
 colorbar = plt.colorbar(contour)
 colorbar.set_label('Prediction Error (Hartree)', fontsize=24, fontname='Arial')
 colorbar.ax.tick_params(labelsize=18)
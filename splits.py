@@ -0,0 +1,157 @@
+"""
+Train / validation / test splits.
+
+Dataset splitting: random, spatial-block and hold-out-region splits of the
+(r12, r23) grid, and k-fold partitions for cross-validation. All functions
+return positional row indices and are deterministic for a given seed.
+"""
+
+import numpy as np
+
+SPLIT_METHODS = ("random", "block", "region")
+
+
+def grid_blocks(data, blocks=6):
+    """
+    Spatial block id of every row: x and y are each cut into `blocks` equal-width bins.
+    """
+    ids = []
+    for column in ("x", "y"):
+        values = data[column].to_numpy(dtype=np.float64)
+        edges = np.linspace(values.min(), values.max(), int(blocks) + 1)[1:-1]
+        ids.append(np.searchsorted(edges, values, side="right"))
+    return ids[0] * int(blocks) + ids[1]
+
+
+def _assign_groups(groups, sizes, targets, rng):
+    """
+    Shuffle the groups and hand them out in order until each target row count is reached.
+
+    Returns the split number (index into `targets`, or len(targets) for the
+    remainder) of every group.
+    """
+    order = rng.permutation(len(groups))
+    assignment = np.full(len(groups), len(targets))
+    filled = np.zeros(len(targets))
+    split = 0
+    for g in order:
+        while split < len(targets) and filled[split] >= targets[split]:
+            split += 1
+        if split == len(targets):
+            break
+        assignment[g] = split
+        filled[split] += sizes[g]
+    return assignment
+
+
+def _as_split(labels):
+    return {name: np.flatnonzero(labels == code) for code, name in enumerate(("test", "val", "train"))}
+
+
+def split_dataset(data, method="block", fractions=(0.8, 0.1, 0.1), blocks=6, region=None, seed=0):
+    """
+    Split rows into train / val / test index arrays.
+
+    Args:
+        data (pd.DataFrame): frame with columns x, y
+        method (str): "random" (rows), "block" (whole spatial blocks, see
+            `grid_blocks`, so validation/test points are not surrounded by
+            training points) or "region" (test = the `region` rectangle)
+        fractions (tuple): (train, val, test) fractions; for "region" the test
+            fraction is ignored and val is drawn from the rest
+        blocks (int): blocks per axis for "block"
+        region (tuple | None): (x_min, x_max, y_min, y_max) for "region"
+        seed (int): random seed
+
+    Returns:
+        dict: {"train": idx, "val": idx, "test": idx} of sorted positional indices
+    """
+    if method not in SPLIT_METHODS:
+        raise ValueError(f"Unknown split method '{method}' (choose from {', '.join(SPLIT_METHODS)})")
+    rng = np.random.default_rng(seed)
+    n = len(data)
+    _, val_fraction, test_fraction = (float(f) for f in fractions)
+    labels = np.full(n, 2)
+
+    if method == "region":
+        if region is None:
+            raise ValueError("The region split needs region=(x_min, x_max, y_min, y_max)")
+        x_min, x_max, y_min, y_max = region
+        x = data['x'].to_numpy()
+        y = data['y'].to_numpy()
+        labels[(x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)] = 0
+        rest = np.flatnonzero(labels == 2)
+        val = rng.choice(rest, size=min(len(rest), int(round(val_fraction * n))), replace=False)
+        labels[val] = 1
+    elif method == "random":
+        order = rng.permutation(n)
+        n_test = int(round(test_fraction * n))
+        n_val = int(round(val_fraction * n))
+        labels[order[:n_test]] = 0
+        labels[order[n_test:n_test + n_val]] = 1
+    else:
+        ids = grid_blocks(data, blocks)
+        groups, inverse, sizes = np.unique(ids, return_inverse=True, return_counts=True)
+        assignment = _assign_groups(groups, sizes, [test_fraction * n, val_fraction * n], rng)
+        labels = assignment[inverse]
+    return _as_split(labels)
+
+
+def kfold_indices(data, folds=5, method="block", blocks=6, seed=0):
+    """
+    Partition rows into `folds` disjoint test folds.
+
+    With method "block" whole spatial blocks go to one fold (each block to the
+    currently smallest fold, in random order); "random" deals shuffled rows.
+
+    Returns:
+        list[np.ndarray]: sorted positional indices of each fold
+    """
+    folds = int(folds)
+    if folds < 2:
+        raise ValueError("Cross-validation needs at least 2 folds")
+    rng = np.random.default_rng(seed)
+    if method == "random":
+        order = rng.permutation(len(data))
+        return [np.sort(order[k::folds]) for k in range(folds)]
+    if method != "block":
+        raise ValueError("k-fold supports the 'random' and 'block' methods")
+    ids = grid_blocks(data, blocks)
+    groups, inverse, sizes = np.unique(ids, return_inverse=True, return_counts=True)
+    if len(groups) < folds:
+        raise ValueError(f"{len(groups)} spatial blocks cannot fill {folds} folds; increase split_blocks")
+    fold_of_group = np.empty(len(groups), dtype=np.int64)
+    filled = np.zeros(folds)
+    for g in rng.permutation(len(groups)):
+        k = int(np.argmin(filled))
+        fold_of_group[g] = k
+        filled[k] += sizes[g]
+    fold_of_row = fold_of_group[inverse]
+    return [np.flatnonzero(fold_of_row == k) for k in range(folds)]
+
+
+def cv_splits(data, folds=5, method="block", val_fraction=0.1, blocks=6, seed=0):
+    """
+    Train / val / test indices of every cross-validation fold.
+
+    Fold k is the test set; the validation set used for early stopping is
+    split off the remaining rows with the same method.
+    """
+    splits = []
+    for k, test in enumerate(kfold_indices(data, folds, method, blocks, seed)):
+        rest = np.setdiff1d(np.arange(len(data)), test)
+        inner = split_dataset(data.iloc[rest], method, fractions=(1 - val_fraction, val_fraction, 0.0),
+                              blocks=blocks, seed=seed + k + 1)
+        splits.append({"train": rest[inner["train"]], "val": rest[inner["val"]], "test": test})
+    return splits
+
+
+def split_from_config(data, cfg):
+    """
+    Split described by a config (keys split, split_fractions, split_blocks,
+    holdout_region, split_seed), or None when `split` is unset.
+    """
+    if not cfg.get("split"):
+        return None
+    return split_dataset(data, cfg["split"], fractions=cfg["split_fractions"], blocks=cfg["split_blocks"],
+                         region=cfg["holdout_region"], seed=cfg["split_seed"])
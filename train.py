@@ -4,12 +4,240 @@ Training loop utilities.
 Training loop utilities: contains training functions and model saving.
 """
 
+import time
 import torch
 from utils import setup_logging, log_metrics
-import numpy as np
-from sklearn.metrics import r2_score
+from model import forces_from_gradients
+from loss import StandardizedLoss
+from evaluation import Evaluator
+from data_loader import StreamingPESDataset, featurize_loader, subset_loader, file_digest, frame_digest
+from pes_grid import PESGrid
+from precision import resolve_dtype, autocast
+from checkpoint import (CheckpointWriter, capture_training_state, restore_training_state, state_path_for, atomic_save,
+                        pes_checkpoint)
 from tqdm import tqdm
 
+
+def batch_loss(model, inputs, labels, criterion, weight):
+    """
+    Energy + force loss for a whole batch.
+
+    One ``model.energy_and_forces(create_graph=True)`` call gives the energies
+    and forces of every sample, differentiable in the weights, so the force
+    term also trains them.
+
+    `inputs` is either the (N, 2) coordinates or a (phi, dphi) pair of cached
+    input features and their derivatives (``data_loader.featurize_loader``).
+
+    Returns:
+        (loss, predicted_forces)
+    """
+    if isinstance(inputs, (tuple, list)):
+        energy, pred_forces = model.energy_and_forces(features=inputs, create_graph=True)
+    else:
+        energy, pred_forces = model.energy_and_forces(inputs, create_graph=True)
+    loss = criterion(energy, labels[:, 0], pred_forces, labels[:, 1:4], weight)
+    return loss, pred_forces
+
+
+def make_train_step(model, criterion, weight):
+    """
+    Eager energy -> force -> loss step.
+
+    Returns step(inputs, labels) -> (loss, predicted_forces); the parameter
+    gradients are accumulated into ``.grad`` as with ``loss.backward()``.
+    """
+    def step(inputs, labels):
+        loss, pred_forces = batch_loss(model, inputs, labels, criterion, weight)
+        loss.backward()
+        return loss, pred_forces
+    return step
+
+
+class CompiledTrainStep:
+    """
+    torch.compile'd energy -> force -> loss step.
+
+    aot_autograd cannot differentiate through ``autograd.grad(create_graph=True)``,
+    so the step is written with torch.func (per-sample ``grad_and_value`` for
+    energies and input gradients, outer ``grad_and_value`` for the parameters) and
+    the whole function is compiled. Parameter gradients are written to ``.grad``.
+    If compilation is unavailable or fails, the eager step is used instead.
+    """
+
+    def __init__(self, model, criterion, weight, example=None, bench_steps: int = 20):
+        """
+        Args:
+            model (nn.Module): model to train (its parameters are read live)
+            criterion: loss module with CustomLoss's signature
+            weight (float): gradient term weight
+            example (tuple | None): (inputs, labels) batch used to compile eagerly
+                and measure the steady-state speedup
+            bench_steps (int): steps timed for the speedup report
+        """
+        from torch.func import functional_call, grad_and_value, vmap
+
+        self.model = model
+        self.eager_step = make_train_step(model, criterion, weight)
+        self.report = {"compiled": False, "compile_time": None, "eager_ms": None, "compiled_ms": None}
+
+        def energy(params, buffers, x):
+            return functional_call(model, (params, buffers), (x.unsqueeze(0),))[0, 0]
+
+        def loss_fn(params, buffers, inputs, labels):
+            per_sample = vmap(grad_and_value(energy, argnums=2), in_dims=(None, None, 0), randomness="different")
+            gradients, energies = per_sample(params, buffers, inputs)
+            pred_forces = forces_from_gradients(gradients)
+            loss = criterion(energies, labels[:, 0], pred_forces, labels[:, 1:4], weight)
+            return loss, pred_forces
+
+        self._functional = grad_and_value(loss_fn, has_aux=True)
+        try:
+            self._compiled = torch.compile(self._functional)
+        except Exception as exc:  # torch.compile missing or unsupported platform
+            tqdm.write(f"torch.compile unavailable, using eager step: {exc}")
+            self._compiled = None
+        if example is not None and self._compiled is not None:
+            self._warmup(*example, bench_steps=bench_steps)
+
+    def _run(self, fn, inputs, labels):
+        params = {k: p.detach() for k, p in self.model.named_parameters()}
+        buffers = {k: b.detach() for k, b in self.model.named_buffers()}
+        grads, (loss, pred_forces) = fn(params, buffers, inputs, labels)
+        for k, p in self.model.named_parameters():
+            p.grad = grads[k] if p.grad is None else p.grad + grads[k]
+        return loss, pred_forces
+
+    def _warmup(self, inputs, labels, bench_steps: int = 20):
+        """
+        Compile on an example batch and time compiled vs eager steps.
+        """
+        start = time.perf_counter()
+        try:
+            self._run(self._compiled, inputs, labels)
+        except Exception as exc:
+            tqdm.write(f"torch.compile failed, using eager step: {exc}")
+            self._compiled = None
+            return
+        self.report["compiled"] = True
+        self.report["compile_time"] = time.perf_counter() - start
+        for key, fn in (("eager_ms", self.eager_step), ("compiled_ms", self)):
+            fn(inputs, labels)
+            start = time.perf_counter()
+            for _ in range(bench_steps):
+                fn(inputs, labels)
+            self.report[key] = (time.perf_counter() - start) / bench_steps * 1e3
+        self.model.zero_grad(set_to_none=True)
+        tqdm.write(
+            f"Compiled training step in {self.report['compile_time']:.1f} s; "
+            f"steady state {self.report['compiled_ms']:.2f} ms vs {self.report['eager_ms']:.2f} ms eager "
+            f"({self.report['eager_ms'] / self.report['compiled_ms']:.2f}x)"
+        )
+
+    def __call__(self, inputs, labels):
+        if self._compiled is not None:
+            try:
+                return self._run(self._compiled, inputs, labels)
+            except Exception as exc:
+                tqdm.write(f"torch.compile failed, using eager step: {exc}")
+                self._compiled = None
+        return self.eager_step(inputs, labels)
+
+
+def _as_inputs(tensors, device, dtype):
+    """
+    Move a batch's input tensors to the device: a single tensor, or a tuple for cached features.
+    """
+    tensors = tuple(t.to(device, dtype) for t in tensors)
+    return tensors[0] if len(tensors) == 1 else tensors
+
+
+def _train_epoch_batched(step, train_loader, optimizer, device, dtype=torch.float32):
+    """
+    One epoch of mini-batch training.
+
+    Returns the sample-weighted mean loss and the mean absolute predicted force.
+    """
+    sum_total = 0
+    grad_sum = 0
+    n_samples = 0
+    for *inputs, labels in train_loader:
+        inputs = _as_inputs(inputs, device, dtype)
+        labels = labels.to(device, dtype)
+        optimizer.zero_grad()
+        loss, pred_forces = step(inputs, labels)
+        optimizer.step()
+        sum_total += loss.detach() * labels.shape[0]
+        grad_sum += pred_forces.detach().abs().sum()
+        n_samples += labels.shape[0]
+    return sum_total / n_samples, grad_sum / (3 * n_samples)
+
+
+def _train_epoch_full_batch(step, X, labels, optimizer):
+    """
+    One optimizer step on the whole resident dataset.
+
+    The loss is wrapped in a closure so the same code drives Adam and L-BFGS
+    (which re-evaluates the closure during its line search).
+    """
+    last = {}
+
+    def closure():
+        optimizer.zero_grad()
+        loss, pred_forces = step(X, labels)
+        last["forces"] = pred_forces.detach()
+        return loss
+
+    loss = optimizer.step(closure)
+    return loss.detach(), last["forces"].abs().mean()
+
+
+def _train_epoch_per_sample(model, train_loader, criterion, optimizer, weight, device, dtype=torch.float32):
+    """
+    One epoch of the original per-sample training.
+
+    Kept as the reference for the batched engine: the predicted forces come
+    from ``model.energy_and_forces`` without a graph, so only the energy term
+    trains the weights, as in the original loop.
+    """
+    sum_total = 0
+    grad_list = torch.tensor([[0.,0.,0.]], dtype=torch.float32, device=device)
+    for inputs, labels in train_loader:
+        inputs = inputs.to(device, dtype)
+        labels = labels.to(device, dtype)
+        optimizer.zero_grad()
+        _, pred_grad = model.energy_and_forces(inputs)
+        outputs = model(inputs)
+        loss = criterion(outputs[0][0], labels[0][0],pred_grad, labels[0][1:4], weight).to(device)
+        grad_list = torch.cat((grad_list,pred_grad),dim=0)     
+        grad_list = grad_list.to(device)
+        loss.backward()
+        sum_total += loss.detach()
+        optimizer.step()
+    sum_total /= len(train_loader)
+    return sum_total, grad_list.abs().mean()
+
+
+def build_optimizer(model, cfg):
+    """
+    Create the optimizer named by cfg['optimizer'].
+
+    Create optimizer from config: "Adam" (default) or "LBFGS" (full-batch only).
+    """
+    name = cfg.get("optimizer", "Adam")
+    if name == "Adam":
+        return torch.optim.Adam(model.parameters(), lr=cfg['learning_rate'])
+    if name == "LBFGS":
+        return torch.optim.LBFGS(
+            model.parameters(),
+            lr=cfg['lbfgs_learning_rate'],
+            max_iter=cfg['lbfgs_max_iter'],
+            history_size=cfg['lbfgs_history_size'],
+            line_search_fn="strong_wolfe",
+        )
+    raise ValueError(f"Unknown optimizer: {name}")
+
+
 def train(
     model,
     train_loader,
@@ -23,6 +251,21 @@ def train(
     epochs: int = 1000,
     patience: int = 50,
     min_delta: float = 1e-4,
+    full_batch: bool = False,
+    eval_every: int = 1,
+    eval_subsample=None,
+    evaluator=None,
+    compile: bool = False,
+    precision: str = "float32",
+    num_threads=12,
+    dist_ctx=None,
+    async_checkpoint: bool = True,
+    keep_best: int = 3,
+    resume_from=None,
+    val_evaluator=None,
+    cache_features: bool = True,
+    curriculum=None,
+    target_rmse=None,
 ):
     """
     Train the model with early stopping and LR scheduling.
@@ -31,105 +274,281 @@ def train(
 
     Args:
         model: torch model / Model
-        train_loader: DataLoader producing (X, y) / Training data loader
+        train_loader: DataLoader producing (X, y) / Training data loader.
+            A loader with batch_size 1 runs the original per-sample path;
+            larger batches use the batched engine (see ``batch_loss``). A
+            ``data_loader.StreamingPESDataset`` streams batches from disk; pair it
+            with an ``evaluation.ChunkedEvaluator`` (`data` is then None).
         criterion: loss function / Loss function
         optimizer: optimizer / Optimizer
         scheduler: LR scheduler / Learning rate scheduler
         path (str): checkpoint save path / Model save path
-        data (pd.DataFrame): raw dataframe for eval / Data for evaluation and visualization
+        data (pd.DataFrame): raw dataframe for eval / Data for evaluation (ignored when `evaluator` is given)
         weight (float): gradient term weight / Gradient term weight
         trainname (str): run name for logging / Training task name
         epochs (int): max epochs / Maximum epochs
         patience (int): early stopping patience / Early stopping patience value
         min_delta (float): min improvement to reset patience / Minimum improvement to reset patience
+        full_batch (bool): keep the whole dataset as resident device tensors and
+            take one step per epoch on it; always on for ``torch.optim.LBFGS``
+        eval_every (int): log evaluation metrics every N epochs (0 disables)
+        eval_subsample (int | None): evaluate on a fixed random subset of rows
+        evaluator: custom evaluation stage with ``should_run(epoch)`` and
+            ``evaluate(model)``; defaults to ``evaluation.Evaluator`` on `data`
+        compile (bool): use the torch.compile'd energy/force/loss step
+            (batched and full-batch modes; falls back to eager on failure)
+        precision (str): "float32", "float64" or "bf16" (float32 weights with
+            bfloat16 autocast); the model is cast to the matching dtype
+        num_threads (int | None): torch intra-op threads; None keeps the current setting
+        dist_ctx: ``distributed.DistributedContext`` for data-parallel training;
+            the data is sharded, gradients and losses are all-reduced, and rank 0
+            alone evaluates, checkpoints and takes the scheduler/early-stop decisions
+        async_checkpoint (bool): write checkpoints from a background thread
+            (``checkpoint.CheckpointWriter``); `path` always holds the best state
+            once train() returns
+        keep_best (int): best-k history checkpoints kept next to `path`
+            (async mode; a `.last` checkpoint is also kept)
+        resume_from (str | None): training-state checkpoint (``<stem>.state.pth``,
+            written every epoch) to continue from; restores weights, optimizer,
+            scheduler, early-stop counters and RNG state and resumes at the next epoch
+        val_evaluator: ``evaluation.Evaluator`` on a held-out validation set
+            (see ``splits.py``); when given, its loss replaces the training loss
+            for early stopping, best-checkpoint selection and the LR scheduler
+        cache_features (bool): for a model with an input feature stage
+            (``model.FeatureTransform``), compute the features and their
+            derivatives once per dataset instead of every step (eager batched
+            and full-batch modes on a single process)
+        curriculum (list | None): coarse-to-fine schedule, [(rows, max_epochs), ...]
+            of progressively denser subsets of the training set (row indices
+            into the loader's dataset, e.g. from ``curriculum_stages``); each
+            stage ends early when its patience runs out, and the whole set is
+            trained last with the remaining epochs. Optimizer and scheduler
+            state carry over between stages (in-memory, single-process only)
+        target_rmse (float | None): energy RMSE (Hartree) whose first crossing
+            in the evaluation metrics is timed for the report
+
+    Returns:
+        dict: "epochs" and "seconds" run, "time_to_target" / "epoch_to_target"
+        (None if `target_rmse` was not reached) and per-stage start info
     """
-    torch.set_num_threads(12)
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+    is_main = dist_ctx is None or dist_ctx.is_main
     trainname = ''.join(['Training Batch','-',trainname])
-    writer = setup_logging(trainname)
+    writer = setup_logging(trainname) if is_main else None
     model.train()
     best_loss = float('inf')
     patience_counter = 0
     # min improvement to reset patience
     min_delta = float(min_delta)
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    dtype = resolve_dtype(precision)
+    model.to(dtype)
+    if hasattr(model, "standardize") and not isinstance(criterion, StandardizedLoss):
+        # The loss compares standardized targets (see NeuralNetwork.fit_standardization)
+        criterion = StandardizedLoss(criterion, model.standardize)
     epochs = int(epochs)
     current_lr = optimizer.param_groups[0]['lr']  # the initial learning rate
     loss_list = []
-    for epoch in tqdm(range(epochs),desc=trainname):
-        sum_total = 0
-        grad_list = torch.tensor([[0.,0.,0.]], dtype=torch.float32, device=device)
-        model.train()  # assure the model is in training mode
-        for inputs, labels in train_loader:
-            inputs = inputs.to(device)
-            labels = labels.to(device)
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            inputs.retain_grad()
-            outputs.backward(torch.ones_like(outputs), retain_graph=True)
-            predicted_gradients = inputs.grad/0.529
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            F1 = -predicted_gradients[0][0]
-            F2 = predicted_gradients[0][0]-predicted_gradients[0][1]
-            F3 = predicted_gradients[0][1]
-            pred_grad = torch.cat((F2.reshape(-1,1),F3.reshape(-1,1),F1.reshape(-1,1)),dim=1).to(device)
-            loss = criterion(outputs[0][0], labels[0][0],pred_grad, labels[0][1:4], weight).to(device)
-            grad_list = torch.cat((grad_list,pred_grad),dim=0)     
-            grad_list = grad_list.to(device)
-            loss.backward()
-            sum_total += loss
-            optimizer.step()
-        sum_total /= len(train_loader)
-        loss_list.append(sum_total)
-        epsilon = 1e-6
-        # Detect gradient vanishing to avoid futile training.
-        # Detect gradient vanishing to avoid futile training.
-        if torch.all(grad_list.abs().mean() < epsilon):
-            print('break')
-            break
+    if evaluator is None and is_main:
+        evaluator = Evaluator(data, device, every=eval_every, subsample=eval_subsample, dtype=dtype)
+    batched = getattr(train_loader, "batch_size", 1) not in (None, 1)
+    full_batch = full_batch or isinstance(optimizer, torch.optim.LBFGS)
+    if isinstance(train_loader, StreamingPESDataset) and (full_batch or dist_ctx is not None):
+        raise ValueError("Streaming data supports mini-batch training only (no full-batch, LBFGS or distributed)")
+    if dist_ctx is not None and not (full_batch or batched):
+        raise ValueError("Distributed training needs batch_size > 1 or full-batch mode")
+    if curriculum and (dist_ctx is not None or isinstance(train_loader, StreamingPESDataset)):
+        raise ValueError("Curriculum training needs the in-memory loader on a single process")
+    if (cache_features and getattr(model, "features", None) is not None and (full_batch or batched)
+            and not compile and dist_ctx is None and not isinstance(train_loader, StreamingPESDataset)):
+        train_loader = featurize_loader(train_loader, model.features)
+    # Coarse-to-fine stages (loader, epoch budget); the last one is the whole training set
+    stage_loaders = [subset_loader(train_loader, rows) for rows, _ in curriculum or ()] + [train_loader]
+    stage_epochs = [int(n) for _, n in curriculum or ()] + [None]
+
+    def resident(loader):
+        *X, labels = (t.detach().to(device, dtype) for t in loader.dataset.tensors)
+        X = X[0] if len(X) == 1 else tuple(X)
+        if dist_ctx is not None:
+            X, labels = dist_ctx.shard_tensors(X, labels)
+        return X, labels
+
+    if full_batch:
+        X_full, labels_full = resident(train_loader)
+    elif dist_ctx is not None:
+        train_loader = stage_loaders[-1] = dist_ctx.shard_loader(train_loader)
+    if dist_ctx is not None:
+        dist_ctx.broadcast_parameters(model)
+    step = make_train_step(model, criterion, weight)
+    if compile and (full_batch or batched):
+        example = (X_full, labels_full) if full_batch else tuple(t.to(device, dtype) for t in next(iter(train_loader)))
+        step = CompiledTrainStep(model, criterion, weight, example=example)
+        if is_main:
+            log_metrics(writer, {k: v for k, v in step.report.items() if isinstance(v, float)}, 0, "Compile")
+    elif compile:
+        tqdm.write("--compile needs batch_size > 1 or full-batch mode; using the per-sample loop")
+    if dist_ctx is not None:
+        step = dist_ctx.wrap_step(step, model)
+    start_epoch = 0
+    stage, stage_start = 0, 0
+    if resume_from:
+        resumed = restore_training_state(resume_from, model, optimizer, scheduler)
+        start_epoch = resumed["epoch"] + 1
+        best_loss, patience_counter = resumed["best_loss"], resumed["patience_counter"]
+        stage, stage_start = min(resumed["stage"], len(stage_loaders) - 1), resumed["stage_start"]
+        current_lr = optimizer.param_groups[0]['lr']
+        if is_main:
+            tqdm.write(f"Resuming from {resume_from} at epoch {start_epoch}")
+    # Provenance stored in every model checkpoint (see checkpoint.pes_checkpoint)
+    metadata = {"precision": precision}
+    if is_main:
+        if isinstance(train_loader, StreamingPESDataset):
+            metadata["data_hash"] = file_digest(train_loader.file_path)
+        elif data is not None:
+            metadata["data_hash"] = frame_digest(data)
+    checkpointer = CheckpointWriter(path, keep_best=keep_best, metadata=metadata) if (async_checkpoint and is_main) else None
+    report = {"time_to_target": None, "epoch_to_target": None, "stages": []}
+    active_stage = None
+    start_time = time.perf_counter()
+    try:
+        for epoch in tqdm(range(start_epoch, epochs),desc=trainname,disable=not is_main,
+                          initial=start_epoch,total=epochs):
+            if stage != active_stage:
+                train_loader = stage_loaders[stage]
+                if full_batch:
+                    X_full, labels_full = resident(train_loader)
+                if len(stage_loaders) > 1 and is_main:
+                    tqdm.write(f"Curriculum stage {stage + 1}/{len(stage_loaders)}: "
+                               f"{len(train_loader.dataset)} rows from epoch {epoch}")
+                    report["stages"].append({"stage": stage, "rows": len(train_loader.dataset), "start_epoch": epoch,
+                                             "start_seconds": time.perf_counter() - start_time})
+                active_stage = stage
+            model.train()  # assure the model is in training mode
+            if hasattr(getattr(train_loader, "sampler", None), "set_epoch"):
+                train_loader.sampler.set_epoch(epoch)
+            elif hasattr(train_loader, "set_epoch"):
+                train_loader.set_epoch(epoch)
+            with autocast(precision, device):
+                if full_batch:
+                    sum_total, grad_mean = _train_epoch_full_batch(step, X_full, labels_full, optimizer)
+                elif batched:
+                    sum_total, grad_mean = _train_epoch_batched(step, train_loader, optimizer, device, dtype)
+                else:
+                    sum_total, grad_mean = _train_epoch_per_sample(
+                        model, train_loader, criterion, optimizer, weight, device, dtype
+                    )
+            if dist_ctx is not None:
+                sum_total, grad_mean = dist_ctx.average(sum_total), dist_ctx.average(grad_mean)
+            loss_list.append(sum_total)
+            epsilon = 1e-6
+            # Detect gradient vanishing to avoid futile training.
+            # Detect gradient vanishing to avoid futile training.
+            if torch.all(grad_mean < epsilon):
+                print('break')
+                break
         
-        model.eval()
-        X_pred = np.array([data['x'].to_numpy(), data['y'].to_numpy()]).T
-        X_pred_tensor = torch.tensor(X_pred, dtype=torch.float32).to(device)
+            stop = False
+            if is_main:
+                # Evaluate on the cached tensors only when due (see Evaluator).
+                metrics = {'Loss': sum_total}
+                if evaluator.should_run(epoch):
+                    metrics.update(evaluator.evaluate(model))
+                    if (target_rmse is not None and report["time_to_target"] is None
+                            and metrics["Energy_RMSE"] <= target_rmse):
+                        report["time_to_target"] = time.perf_counter() - start_time
+                        report["epoch_to_target"] = epoch
+                        metrics["TimeToTarget"] = report["time_to_target"]
+                log_metrics(writer, metrics, epoch, "Train")
+                # The quantity early stopping and the scheduler follow
+                monitor = sum_total
+                if val_evaluator is not None:
+                    monitor, val_metrics = val_evaluator.loss(model, criterion, weight)
+                    log_metrics(writer, {'Loss': monitor, **val_metrics}, epoch, "Val")
 
-        # Predict on full mesh for logging.
-        # Make predictions on full data for logging.
-        with torch.no_grad():  # excluding the gradient
-            y_pred_tensor = model(X_pred_tensor).cpu()
+                new_lr = optimizer.param_groups[0]['lr']
+                if new_lr < current_lr:
+                    current_lr = new_lr  # upgrade the learning rate
 
-        # Convert the prediction results to a NumPy array.
-        y_pred = y_pred_tensor.numpy()
+                # Update the best checkpoint if improved.
+                # If loss improves, save the best model.
+                if monitor < best_loss - min_delta:
+                    best_loss = monitor
+                    patience_counter = 0  # reset the patience counter
+                    scores = {k: v for k, v in metrics.items() if k != 'Loss' and isinstance(v, float)}
+                    if checkpointer is not None:
+                        checkpointer.submit_best(model, monitor, epoch, scores)
+                    else:
+                        save_model(model, path, {"epoch": epoch, "loss": float(monitor), **scores}, **metadata)
+                else:
+                    patience_counter += 1 # if no improvements, add 1 to the patience counter
+
+                if checkpointer is not None:
+                    checkpointer.submit_last(model, epoch)
+
+                #optimize the learning rate
+                scheduler.step(monitor.detach().cpu().item())
+
+                # check the early stop condition
+                stop = patience_counter >= patience
+                if stage < len(stage_loaders) - 1 and (stop or epoch + 1 - stage_start >= stage_epochs[stage]):
+                    # Move to the next, denser stage: the optimizer and scheduler carry over,
+                    # early stopping and the best checkpoint restart on the new data.
+                    stage, stage_start, stop = stage + 1, epoch + 1, False
+                    best_loss, patience_counter = float('inf'), 0
+
+                # Full training state for --resume, written every epoch.
+                state = capture_training_state(epoch, model, optimizer, scheduler, best_loss, patience_counter,
+                                               stage=stage, stage_start=stage_start)
+                if checkpointer is not None:
+                    checkpointer.submit_state(state)
+                else:
+                    atomic_save(state, state_path_for(path))
+            if dist_ctx is not None:
+                # Rank 0 decides; every rank follows its learning rate and stop flag.
+                stop, lr = dist_ctx.broadcast_decision(stop, optimizer.param_groups[0]['lr'])
+                for group in optimizer.param_groups:
+                    group['lr'] = lr
+            if stop:
+                if is_main:
+                    tqdm.write("Early stopping triggered")
+                break
+    finally:
+        if checkpointer is not None:
+            checkpointer.close()
+    report["epochs"] = len(loss_list)
+    report["seconds"] = time.perf_counter() - start_time
+    return report
+
+
+def curriculum_stages(data, strides, stage_epochs):
+    """
+    Curriculum schedule for ``train``: one (rows, stage_epochs) stage per stride.
+
+    Each stage keeps every `stride`-th point of the (r12, r23) grid along both
+    axes (``pes_grid.PESGrid.stride_rows``), so stride 4 trains on ~1/16 of
+    the data. Strides are used in the given order, e.g. (4, 2); the full set
+    follows automatically.
+
+    Args:
+        data (pd.DataFrame): the training rows (same order as the loader's dataset)
+        strides (tuple[int]): subgrid strides, coarsest first
+        stage_epochs (int): epoch budget of each coarse stage
+    """
+    try:
+        grid = PESGrid.from_frame(data)
+    except ValueError as exc:
+        raise ValueError(f"Curriculum training needs data on a regular grid: {exc}") from exc
+    return [(grid.stride_rows(stride), int(stage_epochs)) for stride in strides if int(stride) > 1]
 
-        r_squared = r2_score(data['z1'], y_pred)
-        
-        log_metrics(writer, {'Loss': sum_total, 'Accuracy': r_squared}, epoch, "Train")
-
-        new_lr = optimizer.param_groups[0]['lr']
-        if new_lr < current_lr:
-            current_lr = new_lr  # upgrade the learning rate
-
-        # Update the best checkpoint if improved.
-        # If loss improves, save the best model.
-        if sum_total < best_loss - min_delta:
-            best_loss = sum_total
-            patience_counter = 0  # reset the patience counter
-            save_model(model, path)
-        else:
-            patience_counter += 1 # if no improvements, add 1 to the patience counter
-        
-        #optimize the learning rate
-        scheduler.step(sum_total.detach().cpu().item())
-        # check the early stop condition
-        if patience_counter >= patience:
-            tqdm.write("Early stopping triggered")
-            break
 
-def save_model(model, path):
+def save_model(model, path, metrics=None, **metadata):
     """
-    Save model state dict to disk.
+    Save a self-describing model checkpoint to disk.
 
-    Save model weights to disk.
+    Save the weights with their architecture, normalization and metrics
+    (``checkpoint.pes_checkpoint``), so ``checkpoint.load_pes`` needs no config.
     """
-    torch.save(model.state_dict(), path)
+    torch.save(pes_checkpoint(model, metrics, **metadata), path)
 
 
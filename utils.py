@@ -13,6 +13,8 @@ from sklearn.metrics import r2_score
 import matplotlib.pyplot as plt
 import os
 
+from checkpoint import read_checkpoint
+
 
 def ensure_dir(path: str):
     """
@@ -28,11 +30,14 @@ def ensure_dir(path: str):
 
 def load_model(model, path):
     """
-    Load a state dict into the given model.
+    Load a checkpoint's weights into the given model.
 
-    Load weights from specified path into the given model.
+    Load weights from specified path into the given model. Reads both
+    self-describing checkpoints and bare state dicts; use
+    ``checkpoint.load_pes`` to rebuild the model from the checkpoint alone.
     """
-    model.load_state_dict(torch.load(path))
+    state_dict, _ = read_checkpoint(path)
+    model.load_state_dict(state_dict)
     model.eval()
     logging.info(f"Model loaded from {path}")
     return model
@@ -70,13 +75,15 @@ def visualize_model(model, data, savepath, savepath2, saverocpath):
     x = data['x']
     y = data['y']
     x_roc = np.array([x.to_numpy(), y.to_numpy()]).T
-    x_roc_tensor = torch.tensor(x_roc, dtype=torch.float32)
+    dtype = next(model.parameters()).dtype
+    device = next(model.parameters()).device
+    x_roc_tensor = torch.tensor(x_roc, dtype=dtype, device=device)
     model.eval()
     # predict
     with torch.no_grad():  # excluding the gradient
         y_roc_tensor = model(x_roc_tensor)
     # convert the result to numpy array
-    y_roc = y_roc_tensor.numpy()
+    y_roc = y_roc_tensor.float().cpu().numpy()
     print()
     # Visualize the reliability of predictions.
     plt.figure()
@@ -92,15 +99,14 @@ def visualize_model(model, data, savepath, savepath2, saverocpath):
     yp = np.linspace(0.5, 4.0, 1000)
     xp, yp = np.meshgrid(xp, yp)
     X_pred = np.array([xp.ravel(), yp.ravel()]).T
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    X_pred_tensor = torch.tensor(X_pred, dtype=torch.float32).to(device)
+    X_pred_tensor = torch.tensor(X_pred, dtype=dtype).to(device)
 
     # predict
     with torch.no_grad():  # excluding the gradient
         y_pred_tensor = model(X_pred_tensor).cpu()
 
     # convert the result to numpy array
-    y_pred = y_pred_tensor.numpy()
+    y_pred = y_pred_tensor.float().numpy()
     # visualize
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
@@ -144,15 +150,16 @@ def accuracy(model, data):
     Compute R^2 on provided dataframe.
     """
     model.eval()
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    device = next(model.parameters()).device
+    dtype = next(model.parameters()).dtype
     X_pred = np.array([data['x'].to_numpy(), data['y'].to_numpy()]).T
-    X_pred_tensor = torch.tensor(X_pred, dtype=torch.float32).to(device)
+    X_pred_tensor = torch.tensor(X_pred, dtype=dtype).to(device)
 
     # Make predictions
     with torch.no_grad():
         y_pred_tensor = model(X_pred_tensor).cpu()
 
-    y_pred = y_pred_tensor.numpy()
+    y_pred = y_pred_tensor.double().numpy()
 
     r_squared = r2_score(data['z1'], y_pred)
 